@@ -85,7 +85,6 @@ class CommandQueueCleaner:
                 data = response.json()
                 print(f"📊 队列状态:")
                 print(f"   - 待执行命令: {data.get('command_count', 0)}")
-                print(f"   - 超时处理: {data.get('timeout_processed', 0)}")
                 return data.get('command_count', 0)
             else:
                 print(f"❌ 获取状态失败: {response.status_code}")
@@ -3,6 +3,10 @@ ASGI config for campus_delivery project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+HTTP 请求交给 Django 处理；/ws/robot/<id>/ 的 WebSocket 连接交给
+core.websocket 的机器人指令通道。需要使用支持 WebSocket 的 ASGI 服务器
+（如 uvicorn），runserver 只能提供 HTTP。
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -13,4 +17,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'campus_delivery.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# 必须在 Django 初始化之后导入（依赖 ORM）
+from core.websocket import robot_websocket_application  # noqa: E402
+from core.sweeper import start_in_process_sweeper  # noqa: E402
+
+start_in_process_sweeper()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await robot_websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.sql_profiling.SQLProfilingMiddleware',  # SQL 分析（默认关闭）
+    'core.cpu_profiler.CpuProfilerMiddleware',  # CPU 采样（管理员通过 /api/cpu-profiles/control/ 开启）
     'core.middleware.NetworkMonitorMiddleware',  # 网络监控中间件
     'core.middleware.RealTimeMonitorMiddleware',  # 实时监控中间件
     'django.middleware.security.SecurityMiddleware',
@@ -220,12 +222,19 @@ LOGGING = {
 
     },
     'handlers': {
+        # 按大小或每天轮转，旧文件 gzip 压缩（core.log_handlers）
+        # 多个 uvicorn 工作进程时每个进程写 system_backend.<pid>.log，避免轮转同一个文件
         'system_backend_file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': '/app/logs/system_backend.log',  # Docker容器内的路径
+            'class': 'core.log_handlers.CompressingRotatingFileHandler',
+            'filename': os.getenv('SYSTEM_BACKEND_LOG_FILE', '/app/logs/system_backend.log'),  # Docker容器内的路径
             'formatter': 'simple',
             'encoding': 'utf-8',
+            'maxBytes': int(os.getenv('SYSTEM_BACKEND_LOG_MAX_BYTES', str(50 * 1024 * 1024))),
+            'backupCount': int(os.getenv('SYSTEM_BACKEND_LOG_BACKUPS', '14')),
+            'interval': 86400,
+            'delay': True,
+            'per_process': int(os.getenv('WEB_CONCURRENCY', '1')) > 1,
         },
 
         'console': {
@@ -246,3 +255,166 @@ LOGGING = {
 
 
 
+# system_backend 的文件/控制台输出移到后台线程（core.log_handlers），请求线程只入队，队列满时丢弃
+LOG_QUEUE = {
+    'ENABLED': os.getenv('LOG_QUEUE_ENABLED', 'true').lower() == 'true',
+    'LOGGERS': ['system_backend'],
+    'MAX_QUEUE_SIZE': int(os.getenv('LOG_QUEUE_MAX_SIZE', '10000')),
+}
+
+# 系统事件路由（core.events，SystemLog.emit / log_*）：按 log_type 写入 both / db / file / drop
+# 例如 'ROUTES': {'WEBSOCKET_CONNECTION': 'file'} 让高频事件不入库
+# DEFER_TYPES 中的高频类型经 log_sink 批量写库（队列满时丢弃），其余（审计事件）同步写库
+SYSTEM_LOG_ROUTING = {
+    'DEFAULT_ROUTE': os.getenv('SYSTEM_LOG_DEFAULT_ROUTE', 'both'),
+    'ROUTES': {},
+    'DEFER': False,
+    'DEFER_TYPES': ['NETWORK_REQUEST', 'NETWORK_RESPONSE', 'WEBSOCKET_CONNECTION'],
+}
+
+# 日志异步批量写入配置（core.log_sink）
+LOG_SINK = {
+    'ENABLED': os.getenv('LOG_SINK_ENABLED', 'true').lower() == 'true',
+    'MAX_QUEUE_SIZE': int(os.getenv('LOG_SINK_MAX_QUEUE_SIZE', '10000')),
+    'BATCH_SIZE': int(os.getenv('LOG_SINK_BATCH_SIZE', '200')),
+    'FLUSH_INTERVAL': float(os.getenv('LOG_SINK_FLUSH_INTERVAL', '1.0')),
+    'OVERFLOW_POLICY': os.getenv('LOG_SINK_OVERFLOW_POLICY', 'drop'),  # drop / sample / block
+    'SAMPLE_RATE': 0.1,
+    'BLOCK_TIMEOUT': 0.5,
+}
+
+# 网络监控载荷采集策略（core.capture）
+# 按路由采样写库，请求/响应体按字节截断；状态码 >= 400 的请求始终记录
+NETWORK_CAPTURE_POLICY = {
+    'DEFAULT_SAMPLE_RATE': float(os.getenv('NETWORK_CAPTURE_SAMPLE_RATE', '0.2')),
+    'MAX_BODY_BYTES': 2048,
+    'ERROR_MAX_BODY_BYTES': 65536,
+    'CONTENT_TYPES': [
+        'application/json',
+        'application/x-www-form-urlencoded',
+        'text/plain',
+    ],
+    'ALWAYS_CAPTURE_ERRORS': True,
+    'ROUTES': [
+        # 机器人高频轮询
+        {'pattern': r'^/api/robots/\d+/(get_commands|heartbeat|status|current_orders)/$', 'sample_rate': 0.01, 'max_body_bytes': 512},
+        # 订单列表内嵌二维码图片，只保留很短的预览
+        {'pattern': r'^/api/(orders|dispatch/orders)/$', 'sample_rate': 0.05, 'max_body_bytes': 512},
+        # 监控页面自身的轮询和指标抓取不再记录
+        {'pattern': r'^/api/(network-monitor|logs)/', 'sample_rate': 0.0},
+        {'pattern': r'^/metrics/$', 'sample_rate': 0.0},
+    ],
+}
+
+# 进程内指标（core.metrics），/metrics/ 以 Prometheus 文本格式导出
+# 多进程部署时各进程把快照写入 MULTIPROCESS_DIR，导出时合并
+METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+    'MULTIPROCESS_DIR': os.getenv('METRICS_DIR', '/tmp/campus_delivery_metrics'),
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'ALLOWED_IPS': os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(','),
+}
+
+# 长轮询：get_commands?wait= 的最长等待秒数；跨进程唤醒使用的标记文件目录
+LONG_POLL_MAX_WAIT = int(os.getenv('LONG_POLL_MAX_WAIT', '25'))
+ROBOT_NOTIFY_DIR = os.getenv('ROBOT_NOTIFY_DIR', '/tmp/campus_delivery_notify')
+
+# 机器人 WebSocket 指令通道（core.websocket，挂载在 ASGI 应用的 /ws/robot/<id>/）
+ROBOT_WEBSOCKET = {
+    'SHARDS': 16,
+    'HEARTBEAT_INTERVAL': int(os.getenv('ROBOT_WS_HEARTBEAT_INTERVAL', '30')),
+    'CROSS_PROCESS_CHECK_INTERVAL': 0.5,
+}
+
+# 后台清理任务（core.sweeper）：命令超时处理、过期命令清理
+# 推荐以独立进程运行: python manage.py run_sweeper；IN_PROCESS 开启时随 Web 进程启动线程
+SWEEPER = {
+    'IN_PROCESS': os.getenv('SWEEPER_IN_PROCESS', 'false').lower() == 'true',
+    'TICK_INTERVAL': 5,
+    'LOCK_FILE': os.getenv('SWEEPER_LOCK_FILE', '/tmp/campus_delivery_sweeper.lock'),
+    'COMMAND_TIMEOUT': int(os.getenv('COMMAND_TIMEOUT_SECONDS', '300')),
+    'COMPLETED_RETENTION_DAYS': 3,
+    'FAILED_RETENTION_DAYS': 1,
+    'INTERVALS': {
+        'expire_commands': 30,
+        'purge_commands': 3600,
+        'presence_offline': 15,
+        'telemetry_rollup': 60,
+        'telemetry_retention': 3600,
+        'traffic_rollup_retention': 3600,
+        'log_archive': 3600,
+        'slow_query_retention': 3600,
+        'cpu_profile_retention': 3600,
+    },
+}
+
+# 流量分钟汇总（core.rollups）：网络监控页的统计与活跃连接都读取汇总表
+TRAFFIC_ROLLUP = {
+    'RETENTION_DAYS': int(os.getenv('TRAFFIC_ROLLUP_RETENTION_DAYS', '7')),
+    'STATS_WINDOW_HOURS': 24,
+    'ACTIVE_WINDOW_SECONDS': 60,
+}
+
+# 机器人在线状态（core.presence）：心跳/轮询只写共享目录，last_status_update 按间隔节流写库
+ROBOT_PRESENCE = {
+    'DIR': os.getenv('ROBOT_PRESENCE_DIR', '/tmp/campus_delivery_presence'),
+    'FLUSH_INTERVAL': int(os.getenv('ROBOT_PRESENCE_FLUSH_INTERVAL', '60')),
+    'OFFLINE_AFTER': int(os.getenv('ROBOT_PRESENCE_OFFLINE_AFTER', '90')),
+}
+
+# 车队快照（core.fleet，/api/robots/fleet/）：结果缓存秒数
+ROBOT_FLEET = {
+    'CACHE_TTL': float(os.getenv('ROBOT_FLEET_CACHE_TTL', '2')),
+}
+
+# 遥测历史（core.telemetry_history）：原始采样经日志写入器批量插入，清理任务降采样为 1 分钟 / 1 小时汇总
+TELEMETRY_HISTORY = {
+    'ENABLED': os.getenv('TELEMETRY_HISTORY_ENABLED', 'true').lower() == 'true',
+    'RAW_RETENTION_DAYS': int(os.getenv('TELEMETRY_RAW_RETENTION_DAYS', '2')),
+    'MINUTE_RETENTION_DAYS': int(os.getenv('TELEMETRY_MINUTE_RETENTION_DAYS', '14')),
+    'HOUR_RETENTION_DAYS': int(os.getenv('TELEMETRY_HOUR_RETENTION_DAYS', '365')),
+    'ROLLUP_BATCH_SIZE': 20000,
+    'MAX_POINTS': 5000,
+}
+
+# 流式导出（core.exports，/api/logs/export/、/api/orders/export/）：按主键分批读取的行数
+DATA_EXPORT = {
+    'CHUNK_SIZE': int(os.getenv('DATA_EXPORT_CHUNK_SIZE', '2000')),
+    'GZIP_LEVEL': 6,
+}
+
+# 系统日志归档（core.log_archive）：超过保留期的日志按天写入 gzip NDJSON 并从数据库删除
+# Web 与 sweeper 进程需要共享 DIR（docker-compose 中的 log_archive 卷）
+LOG_ARCHIVE = {
+    'ENABLED': os.getenv('LOG_ARCHIVE_ENABLED', 'true').lower() == 'true',
+    'DIR': os.getenv('LOG_ARCHIVE_DIR', os.path.join(BASE_DIR, 'log_archive')),
+    'RETENTION_DAYS': int(os.getenv('LOG_RETENTION_DAYS', '30')),
+    'BATCH_SIZE': 2000,
+    'MAX_DAYS_PER_RUN': 7,
+}
+
+# 按请求的 SQL 分析（core.sql_profiling）：Server-Timing 响应头、按视图的语句数/耗时指标，
+# 超过 SLOW_QUERY_MS 的语句写入 SlowQuery（/api/slow-queries/top/ 按语句指纹汇总）
+SQL_PROFILING = {
+    'ENABLED': os.getenv('SQL_PROFILING_ENABLED', 'false').lower() == 'true',
+    'SLOW_QUERY_MS': int(os.getenv('SLOW_QUERY_MS', '100')),
+    'MAX_SLOW_PER_REQUEST': 10,
+    'TOP_N': 3,
+    'SERVER_TIMING': True,
+    'MAX_SQL_LENGTH': 4000,
+    'RETENTION_DAYS': int(os.getenv('SLOW_QUERY_RETENTION_DAYS', '7')),
+}
+
+# CPU 采样分析（core.cpu_profiler）：管理员通过 /api/cpu-profiles/control/ 按 URL 名称或请求比例开启，
+# 折叠栈文件写入 DIR（Web 与 sweeper 进程共享，docker-compose 中的 cpu_profiles 卷）
+CPU_PROFILER = {
+    'ENABLED': os.getenv('CPU_PROFILER_ENABLED', 'true').lower() == 'true',
+    'DIR': os.getenv('CPU_PROFILER_DIR', '/tmp/campus_delivery_cpu_profiles'),
+    'INTERVAL_MS': int(os.getenv('CPU_PROFILER_INTERVAL_MS', '10')),
+    'MAX_DEPTH': 128,
+    'MAX_CONCURRENT': 4,
+    'MAX_DURATION': 3600,
+    'CONTROL_REFRESH': 2,
+    'MAX_PROFILES': 500,
+    'RETENTION_DAYS': 3,
+}
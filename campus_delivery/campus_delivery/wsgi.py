@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'campus_delivery.settings')
 
 application = get_wsgi_application()
+
+# SWEEPER['IN_PROCESS'] 开启时在 Web 进程内运行后台清理任务
+from core.sweeper import start_in_process_sweeper  # noqa: E402
+
+start_in_process_sweeper()
@@ -0,0 +1,131 @@
+"""
+网络监控载荷采集策略
+
+决定每个请求是否写入 SystemLog、请求/响应体保留多少：
+- 按路由（正则）配置采样率
+- 请求体/响应体按字节数截断
+- 只解析允许的 Content-Type，其余只记录大小
+- 状态码 >= 400 的请求始终完整记录（使用更宽的截断上限）
+"""
+import json
+import random
+import re
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import QueryDict
+
+DEFAULT_CAPTURE_POLICY = {
+    'DEFAULT_SAMPLE_RATE': 1.0,
+    'MAX_BODY_BYTES': 2048,
+    'ERROR_MAX_BODY_BYTES': 65536,
+    'CONTENT_TYPES': [
+        'application/json',
+        'application/x-www-form-urlencoded',
+        'text/plain',
+    ],
+    'ALWAYS_CAPTURE_ERRORS': True,
+    # [{'pattern': r'^/api/robots/\d+/get_commands/$', 'sample_rate': 0.01, 'max_body_bytes': 512}]
+    'ROUTES': [],
+}
+
+
+class CaptureDecision:
+    """单个请求的采集决定"""
+
+    __slots__ = ('sampled', 'sample_rate', 'max_body_bytes')
+
+    def __init__(self, sampled, sample_rate, max_body_bytes):
+        self.sampled = sampled
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+
+
+class CapturePolicy:
+    """根据 settings.NETWORK_CAPTURE_POLICY 做采样与截断"""
+
+    def __init__(self, config=None):
+        merged = dict(DEFAULT_CAPTURE_POLICY)
+        merged.update(config or {})
+        self.default_sample_rate = float(merged['DEFAULT_SAMPLE_RATE'])
+        self.max_body_bytes = int(merged['MAX_BODY_BYTES'])
+        self.error_max_body_bytes = int(merged['ERROR_MAX_BODY_BYTES'])
+        self.content_types = tuple(ct.lower() for ct in merged['CONTENT_TYPES'])
+        self.always_capture_errors = bool(merged['ALWAYS_CAPTURE_ERRORS'])
+        self.routes = [
+            (
+                re.compile(route['pattern']),
+                float(route.get('sample_rate', self.default_sample_rate)),
+                int(route.get('max_body_bytes', self.max_body_bytes)),
+            )
+            for route in merged['ROUTES']
+        ]
+
+    def decide(self, path):
+        """请求开始时按路由决定是否采样"""
+        sample_rate, max_body_bytes = self.default_sample_rate, self.max_body_bytes
+        for pattern, route_rate, route_limit in self.routes:
+            if pattern.search(path):
+                sample_rate, max_body_bytes = route_rate, route_limit
+                break
+        sampled = sample_rate >= 1.0 or (sample_rate > 0 and random.random() < sample_rate)
+        return CaptureDecision(sampled, sample_rate, max_body_bytes)
+
+    def should_record(self, decision, status_code):
+        """响应完成后决定是否落库：被采样或出错"""
+        if decision.sampled:
+            return True
+        return self.always_capture_errors and status_code >= 400
+
+    def body_limit(self, decision, status_code):
+        if status_code >= 400 and self.always_capture_errors:
+            return max(self.error_max_body_bytes, decision.max_body_bytes)
+        return decision.max_body_bytes
+
+    def is_capturable(self, content_type):
+        content_type = (content_type or '').split(';')[0].strip().lower()
+        return bool(content_type) and content_type.startswith(self.content_types)
+
+    def render_body(self, raw, content_type, limit):
+        """把原始字节转换为可写入 JSON 字段的结构，超出 limit 时截断"""
+        if not raw:
+            return {}
+        size = len(raw)
+        if not self.is_capturable(content_type):
+            return {'omitted': True, 'content_type': content_type, 'size': size}
+        if size > limit:
+            return {
+                'truncated': True,
+                'size': size,
+                'preview': raw[:limit].decode('utf-8', errors='replace'),
+            }
+
+        text = raw.decode('utf-8', errors='replace')
+        media_type = content_type.split(';')[0].strip().lower()
+        if media_type == 'application/json':
+            try:
+                return json.loads(text)
+            except ValueError:
+                return {'raw_body': text}
+        if media_type == 'application/x-www-form-urlencoded':
+            return dict(QueryDict(text).items())
+        return {'raw_body': text}
+
+
+_policy = None
+
+
+def get_capture_policy():
+    """按 settings 懒加载的全局策略"""
+    global _policy
+    if _policy is None:
+        _policy = CapturePolicy(getattr(settings, 'NETWORK_CAPTURE_POLICY', None))
+    return _policy
+
+
+@receiver(setting_changed)
+def _reset_capture_policy(setting, **kwargs):
+    global _policy
+    if setting == 'NETWORK_CAPTURE_POLICY':
+        _policy = None
@@ -0,0 +1,209 @@
+"""
+机器人指令的序列化与执行结果处理
+
+HTTP 轮询接口（get_commands / execute_command）与 WebSocket 通道共用这里的逻辑，
+保证两条路径下发的指令格式和执行结果带来的状态变化完全一致。
+"""
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import DeliveryOrder, RobotCommand, SystemLog
+from .versioning import bump_robot_versions
+
+# 批量上报一次最多处理的指令数
+MAX_RESULT_BATCH = 100
+
+
+class CommandAlreadyProcessed(Exception):
+    """指令已不是 PENDING 状态（可能已被另一条通道确认）"""
+
+
+def serialize_command(command):
+    """下发给机器人的指令格式"""
+    return {
+        'command_id': command.id,
+        'command': command.command,
+        'command_display': command.get_command_display(),
+        'sent_at': command.sent_at.isoformat(),
+        'sent_by': command.sent_by.username if command.sent_by else None
+    }
+
+
+class CommandEffects:
+    """收集指令执行结果带来的状态变化，最后一次性写库
+
+    机器人只保存一次，订单状态按集合 UPDATE 迁移，日志一次批量插入。
+    """
+
+    def __init__(self, robot):
+        self.robot = robot
+        self.robot_changed = False
+        self.order_transitions = []  # [(原状态, 新状态)]，按发生顺序执行
+        self.logs = []
+
+    def set_door_status(self, status):
+        self.robot.door_status = status
+        self.robot_changed = True
+
+    def update_robot(self, **fields):
+        for name, value in fields.items():
+            setattr(self.robot, name, value)
+        self.robot_changed = True
+
+    def transition_orders(self, from_status, to_status):
+        self.order_transitions.append((from_status, to_status))
+
+    def log(self, level, message, log_type='ROBOT_CONTROL', data=None):
+        self.logs.append((level, message, log_type, data or {}))
+
+    def apply(self):
+        robot = self.robot
+        if self.robot_changed:
+            robot.last_status_update = timezone.now()
+            robot.save()
+        # 指令、订单状态经由 update/bulk_update 改变，不触发信号，单独使 ETag 失效
+        bump_robot_versions(robot.id)
+        for from_status, to_status in self.order_transitions:
+            DeliveryOrder.objects.filter(robot=robot, status=from_status).update(status=to_status)
+        if self.logs:
+            SystemLog.emit_many([
+                {'level': level, 'message': message, 'log_type': log_type, 'robot': robot, 'data': data}
+                for level, message, log_type, data in self.logs
+            ])
+
+
+def complete_command(robot, command, result):
+    """把指令标记为已完成并执行对应的状态变化
+
+    用条件更新抢占指令，HTTP 与 WebSocket 同时上报同一指令时只有一方生效。
+    """
+    executed_at = timezone.now()
+    with transaction.atomic():
+        claimed = RobotCommand.objects.filter(id=command.id, status='PENDING').update(
+            status='COMPLETED',
+            executed_at=executed_at,
+            result=result
+        )
+        if not claimed:
+            raise CommandAlreadyProcessed(command.id)
+        command.status = 'COMPLETED'
+        command.executed_at = executed_at
+        command.result = result
+
+        effects = CommandEffects(robot)
+        _collect_effects(effects, command, result)
+        effects.apply()
+    return command
+
+
+def complete_commands(robot, items):
+    """按顺序批量处理指令执行结果，返回每条的处理结果
+
+    items: [{'command_id': ..., 'result': ..., 'executed_at': ISO时间(可选)}]
+    所有指令在一个事务中加锁读取、一次 bulk_update 写回，状态变化统一写库。
+    每条结果的 outcome: COMPLETED / ALREADY_PROCESSED / NOT_FOUND / INVALID
+    """
+    now = timezone.now()
+    ids = []
+    for item in items:
+        try:
+            ids.append(int(item.get('command_id')))
+        except (TypeError, ValueError, AttributeError):
+            pass
+
+    outcomes = []
+    with transaction.atomic():
+        commands = {
+            command.id: command
+            for command in RobotCommand.objects.select_for_update().filter(robot=robot, id__in=ids)
+        }
+        effects = CommandEffects(robot)
+        completed = []
+        for item in items:
+            outcome = {'command_id': item.get('command_id') if isinstance(item, dict) else None}
+            try:
+                command_id = int(item['command_id'])
+                executed_at = _parse_executed_at(item.get('executed_at'), now)
+            except (TypeError, ValueError, KeyError):
+                outcome.update({'outcome': 'INVALID', 'detail': '指令ID或执行时间格式错误'})
+                outcomes.append(outcome)
+                continue
+
+            command = commands.get(command_id)
+            if command is None:
+                outcome.update({'outcome': 'NOT_FOUND', 'detail': '指令不存在'})
+            elif command.status != 'PENDING':
+                outcome.update({'outcome': 'ALREADY_PROCESSED', 'detail': '指令已被处理', 'status': command.status})
+            else:
+                result = str(item.get('result') or '')
+                command.status = 'COMPLETED'
+                command.executed_at = executed_at
+                command.result = result
+                _collect_effects(effects, command, result)
+                completed.append(command)
+                outcome.update({'outcome': 'COMPLETED', 'executed_at': executed_at.isoformat()})
+            outcomes.append(outcome)
+
+        if completed:
+            RobotCommand.objects.bulk_update(completed, ['status', 'executed_at', 'result'])
+        effects.apply()
+    return outcomes
+
+
+def _parse_executed_at(value, now):
+    """机器人上报的执行时间，缺省为服务器当前时间，且不晚于当前时间"""
+    if not value:
+        return now
+    executed_at = parse_datetime(value)
+    if executed_at is None:
+        raise ValueError(value)
+    if timezone.is_naive(executed_at):
+        executed_at = timezone.make_aware(executed_at)
+    return min(executed_at, now)
+
+
+def _collect_effects(effects, command, result):
+    """根据指令类型记录相应的状态变化"""
+    robot = effects.robot
+    if command.command == 'open_door':
+        _collect_door_result(effects, result, 'OPEN', '开门')
+    elif command.command == 'close_door':
+        _collect_door_result(effects, result, 'CLOSED', '关门')
+    elif command.command == 'start_delivery':
+        if robot.status == 'LOADING':
+            effects.update_robot(status='DELIVERING', delivery_start_time=timezone.now())
+            # 更新所有分配给该机器人的订单状态为DELIVERING
+            effects.transition_orders('ASSIGNED', 'DELIVERING')
+            effects.log('SUCCESS', f"机器人 {robot.name} 执行开始配送指令成功", log_type='DELIVERY')
+    elif command.command == 'stop_robot':
+        effects.update_robot(status='IDLE', delivery_start_time=None, qr_wait_start_time=None)
+        # 将正在配送的订单状态重置为ASSIGNED
+        effects.transition_orders('DELIVERING', 'ASSIGNED')
+        effects.log('WARNING', f"机器人 {robot.name} 执行停止指令成功")
+
+
+def _collect_door_result(effects, result, default_state, action_name):
+    """从ROS返回的result中解析真实门状态"""
+    robot = effects.robot
+    if result and result.startswith('door_'):
+        door_state = result.replace('door_', '').upper()
+        if door_state in ['OPEN', 'CLOSED']:
+            effects.set_door_status(door_state)
+            effects.log(
+                'SUCCESS',
+                f"机器人 {robot.name} 执行{action_name}指令成功，真实门状态: {door_state}",
+                data={'real_door_state': door_state, 'result': result}
+            )
+        else:
+            # 如果解析失败，使用默认状态
+            effects.set_door_status(default_state)
+            effects.log(
+                'WARNING',
+                f"机器人 {robot.name} 执行{action_name}指令，但门状态解析失败: {result}",
+                data={'result': result}
+            )
+    else:
+        # 如果没有返回门状态，使用默认状态
+        effects.set_door_status(default_state)
+        effects.log('SUCCESS', f"机器人 {robot.name} 执行{action_name}指令成功")
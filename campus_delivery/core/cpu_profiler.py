@@ -0,0 +1,300 @@
+"""
+CPU 采样分析（管理员按需开启）
+
+    POST /api/cpu-profiles/control/  {"routes": ["robots-receive-orders"], "sample_rate": 0.2, "duration_seconds": 600}
+    GET  /api/cpu-profiles/                      最近的采样记录
+    GET  /api/cpu-profiles/<id>/download/        折叠栈文件（flamegraph.pl / speedscope 可直接渲染）
+
+- 开关状态写在共享目录的 control.json 中，所有工作进程生效，到期自动关闭
+- 选中的请求（routes 为空表示所有 URL 名称，再按 sample_rate 抽样）在视图执行期间
+  由进程内唯一的采样线程每 INTERVAL_MS 读取一次该线程的调用栈（sys._current_frames），
+  按 "函数 (文件:行);...;函数 (文件:行) 次数" 的折叠格式写入 DIR，并记录 CpuProfile
+- 采用线程采样而不是 SIGPROF：信号只能投递到主线程，无法采样 runserver / gunicorn 的工作线程
+- 未开启时每个请求只多一次时间比较（control.json 最多每 CONTROL_REFRESH 秒 stat 一次）；
+  CPU_PROFILER['ENABLED']=False 时中间件不加载
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+logger = logging.getLogger('system_backend')
+
+DEFAULT_CPU_PROFILER_CONFIG = {
+    'ENABLED': True,               # False 时不加载中间件
+    'DIR': '/tmp/campus_delivery_cpu_profiles',
+    'INTERVAL_MS': 10,             # 采样间隔
+    'MAX_DEPTH': 128,              # 单个栈最多记录的帧数
+    'MAX_CONCURRENT': 4,           # 单个进程同时采样的请求数
+    'MAX_DURATION': 3600,          # 一次开启最长持续时间（秒）
+    'CONTROL_REFRESH': 2,          # 重新检查 control.json 的间隔（秒）
+    'MAX_PROFILES': 500,           # 保留的采样记录数
+    'RETENTION_DAYS': 3,
+}
+
+CONTROL_FILE = 'control.json'
+
+
+def get_cpu_profiler_config():
+    config = dict(DEFAULT_CPU_PROFILER_CONFIG)
+    config.update(getattr(settings, 'CPU_PROFILER', {}))
+    return config
+
+
+def profile_file_path(profile):
+    return os.path.join(get_cpu_profiler_config()['DIR'], profile.file)
+
+
+# ----------------------------------------------------------------------
+# 开关
+# ----------------------------------------------------------------------
+class ProfilerControl:
+    """control.json 的读写；读取结果在进程内缓存 CONTROL_REFRESH 秒"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._mtime = None
+        self._checked_at = None
+
+    def _path(self):
+        return os.path.join(get_cpu_profiler_config()['DIR'], CONTROL_FILE)
+
+    def current(self):
+        """当前生效的设置，未开启或已过期时返回 None"""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= get_cpu_profiler_config()['CONTROL_REFRESH']:
+            with self._lock:
+                self._checked_at = now
+                self._reload()
+        state = self._state
+        if state is None or state['expires_at'] <= time.time():
+            return None
+        return state
+
+    def _reload(self):
+        path = self._path()
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self._state = self._mtime = None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        self._state = state if state and state.get('active') else None
+        self._mtime = mtime
+
+    def enable(self, routes=(), sample_rate=1.0, duration=600, user=None):
+        config = get_cpu_profiler_config()
+        state = {
+            'active': True,
+            'routes': sorted(set(routes)),
+            'sample_rate': sample_rate,
+            'expires_at': time.time() + min(duration, config['MAX_DURATION']),
+            'updated_by': user,
+        }
+        os.makedirs(config['DIR'], exist_ok=True)
+        path = self._path()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+        self._checked_at = None
+        return state
+
+    def disable(self):
+        try:
+            os.remove(self._path())
+        except FileNotFoundError:
+            pass
+        self._checked_at = None
+
+    def selects(self, route):
+        """当前请求是否需要采样"""
+        state = self.current()
+        if state is None:
+            return False
+        if state['routes'] and route not in state['routes']:
+            return False
+        return random.random() < state['sample_rate']
+
+
+profiler_control = ProfilerControl()
+
+
+# ----------------------------------------------------------------------
+# 采样
+# ----------------------------------------------------------------------
+@lru_cache(maxsize=4096)
+def _short_filename(filename):
+    """去掉 sys.path 前缀，折叠栈中只保留模块相对路径"""
+    for prefix in sorted((p for p in sys.path if p), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+class ProfileSession:
+    """一个被采样的请求"""
+
+    def __init__(self, thread_id, max_depth):
+        self.thread_id = thread_id
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self._labels = {}
+
+    def add(self, frame):
+        labels = self._labels
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = f"{code.co_name} ({_short_filename(code.co_filename)}:{code.co_firstlineno})"
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        self.stacks[';'.join(stack)] += 1
+        self.samples += 1
+
+    def folded(self):
+        """折叠栈文本（按次数从多到少）"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class StackSampler:
+    """进程内唯一的采样线程，没有会话时退出"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._thread = None
+
+    def start(self, max_depth):
+        """开始采样当前线程，达到 MAX_CONCURRENT 时返回 None"""
+        session = ProfileSession(threading.get_ident(), max_depth)
+        with self._lock:
+            if len(self._sessions) >= get_cpu_profiler_config()['MAX_CONCURRENT']:
+                return None
+            self._sessions[session.thread_id] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='cpu-profiler', daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session):
+        with self._lock:
+            self._sessions.pop(session.thread_id, None)
+        session.duration = time.perf_counter() - session.started
+
+    def _run(self):
+        interval = get_cpu_profiler_config()['INTERVAL_MS'] / 1000
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for session in self._sessions.values():
+                    frame = frames.get(session.thread_id)
+                    if frame is not None:
+                        session.add(frame)
+                del frames
+
+
+stack_sampler = StackSampler()
+
+
+class CpuProfilerMiddleware:
+    """按 control.json 选中请求并采样视图执行期间的调用栈，见模块说明"""
+
+    def __init__(self, get_response):
+        if not get_cpu_profiler_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        session = getattr(request, '_cpu_profile', None)
+        if session is not None:
+            stack_sampler.stop(session)
+            self.save(request, response, session)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not profiler_control.selects(request.resolver_match.view_name):
+            return None
+        request._cpu_profile = stack_sampler.start(get_cpu_profiler_config()['MAX_DEPTH'])
+        return None
+
+    def save(self, request, response, session):
+        """写入折叠栈文件并记录 CpuProfile（没有采到样本的请求不记录）"""
+        if not session.samples:
+            return None
+        from .log_sink import log_sink
+        from .models import CpuProfile
+
+        config = get_cpu_profiler_config()
+        route = request.resolver_match.view_name
+        created_at = timezone.now()
+        filename = f"{created_at:%Y%m%d-%H%M%S}-{route.replace(':', '_')[:80]}-{uuid.uuid4().hex[:8]}.folded"
+        try:
+            os.makedirs(config['DIR'], exist_ok=True)
+            with open(os.path.join(config['DIR'], filename), 'w', encoding='utf-8') as f:
+                size = f.write(session.folded())
+        except OSError as e:
+            logger.error(f"写入 CPU 采样文件失败: {e}")
+            return None
+
+        profile = CpuProfile(
+            created_at=created_at,
+            route=route[:200],
+            method=request.method,
+            path=request.path[:255],
+            status_code=response.status_code,
+            duration_ms=round(session.duration * 1000, 2),
+            sample_count=session.samples,
+            interval_ms=config['INTERVAL_MS'],
+            file=filename,
+            size_bytes=size,
+        )
+        log_sink.enqueue(profile)
+        return profile
+
+
+def purge_cpu_profiles(now=None):
+    """删除超过保留期或超出 MAX_PROFILES 的采样记录及文件"""
+    from datetime import timedelta
+    from .models import CpuProfile
+
+    config = get_cpu_profiler_config()
+    cutoff = (now or timezone.now()) - timedelta(days=config['RETENTION_DAYS'])
+    keep_ids = CpuProfile.objects.order_by('-created_at', '-id').values_list('id', flat=True)[:config['MAX_PROFILES']]
+    expired = CpuProfile.objects.filter(created_at__lt=cutoff) | CpuProfile.objects.exclude(id__in=list(keep_ids))
+    rows = list(expired.values_list('id', 'file'))
+    for _, filename in rows:
+        try:
+            os.remove(os.path.join(config['DIR'], filename))
+        except FileNotFoundError:
+            pass
+    CpuProfile.objects.filter(id__in=[pk for pk, _ in rows]).delete()
+    return len(rows)
@@ -0,0 +1,167 @@
+"""
+系统事件（SystemLog.emit 及 log_info / log_warning / log_error / log_success）
+
+    SystemLog.emit('WARNING', "命令执行超时: %s", 'ROBOT_CONTROL', robot=robot, args=(command,))
+    SystemLog.emit_many([{'level': 'WARNING', 'message': ..., 'log_type': 'ROBOT_CONTROL', 'robot_id': 3}, ...])
+
+- 路由: SYSTEM_LOG_ROUTING['ROUTES'] 按 log_type 决定写入数据库、日志文件、两者或丢弃，
+  如高频类型只写文件而不入库
+- 延迟写库: 只有 DEFER_TYPES 中的高频类型（网络请求/响应、WebSocket 连接）交给 log_sink 批量写入，
+  log_sink 在队列满时会丢弃记录；二维码扫描、订单状态、错误等审计事件默认同步写入
+- 延迟格式化: 文件日志的消息在日志处理器真正输出时才拼接（配合 core.log_handlers 即在监听线程中），
+  只读取关联对象已加载的字段，不会因为拼接消息触发查询
+- 批量: emit_many 对每条事件分别路由，写库部分一次 bulk_create
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger('system_backend')
+
+ROUTES = ('both', 'db', 'file', 'drop')
+
+LOG_LEVELS = {
+    'INFO': logging.INFO,
+    'SUCCESS': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+}
+
+DEFAULT_SYSTEM_LOG_ROUTING = {
+    'DEFAULT_ROUTE': 'both',
+    'ROUTES': {},          # log_type -> both / db / file / drop
+    'DEFER': False,        # 所有类型都交给 log_sink 批量写入（可能丢失）
+    'DEFER_TYPES': ('NETWORK_REQUEST', 'NETWORK_RESPONSE', 'WEBSOCKET_CONNECTION'),  # 交给 log_sink 的类型
+}
+
+
+def get_system_log_routing():
+    config = dict(DEFAULT_SYSTEM_LOG_ROUTING)
+    config.update(getattr(settings, 'SYSTEM_LOG_ROUTING', {}))
+    return config
+
+
+def route_for(log_type):
+    config = get_system_log_routing()
+    route = config['ROUTES'].get(log_type, config['DEFAULT_ROUTE'])
+    if route not in ROUTES:
+        raise ValueError(f"未知的 SYSTEM_LOG_ROUTING 路由: {log_type} -> {route}")
+    return route
+
+
+def defers(log_type):
+    """该类型是否默认交给 log_sink 延迟写库"""
+    config = get_system_log_routing()
+    return config['DEFER'] or log_type in config['DEFER_TYPES']
+
+
+def _loaded(instance, field):
+    """已加载的字段值，未加载（延迟字段）时返回 None"""
+    return instance.__dict__.get(field) if instance is not None else None
+
+
+class EventLine:
+    """文件日志的消息，str() 时才拼接"""
+
+    __slots__ = ('log_type', 'message', 'args', 'robot', 'order_id', 'user')
+
+    def __init__(self, log_type, message, args, robot, order, user):
+        self.log_type = log_type
+        self.message = message
+        self.args = args
+        self.robot = _loaded(robot, 'name') or (f"#{robot.pk}" if robot is not None else None)
+        self.order_id = order.pk if order is not None else None
+        self.user = _loaded(user, 'username') or (f"#{user.pk}" if user is not None else None)
+
+    def __str__(self):
+        message = self.message % self.args if self.args else self.message
+        robot_info = f" (机器人: {self.robot})" if self.robot else ""
+        order_info = f" (订单: #{self.order_id})" if self.order_id else ""
+        user_info = f" (用户: {self.user})" if self.user else ""
+        return f"[{self.log_type}] {message}{robot_info}{order_info}{user_info}"
+
+
+def emit_event(model, level, message, log_type='SYSTEM', robot=None, order=None, user=None, data=None,
+               args=(), defer=None, targets=None, **fields):
+    """记录一条系统事件
+
+    args: message 的 % 格式化参数；写库时立即格式化，只写文件时推迟到输出时
+    defer: 是否经 log_sink 批量写库，默认由 SYSTEM_LOG_ROUTING 的 DEFER / DEFER_TYPES 决定
+    targets: 限定输出目标（如 ('db',)），与路由取交集
+    fields: client_ip、path 等其他列
+    返回写库的 SystemLog 实例（延迟写入时尚未保存），不写库时返回 None
+    """
+    route = route_for(log_type)
+    if route == 'drop':
+        return None
+    to_db = route in ('both', 'db') and (targets is None or 'db' in targets)
+    to_file = route in ('both', 'file') and (targets is None or 'file' in targets)
+
+    entry = None
+    if to_db:
+        entry = _build_entry(model, level, message, log_type, robot, order, user, data, args, fields)
+        if defer is None:
+            defer = defers(log_type)
+        if defer:
+            from .log_sink import log_sink
+            log_sink.enqueue(entry)
+        else:
+            entry.save()
+
+    if to_file:
+        _log_line(level, log_type, message, args, robot, order, user)
+
+    return entry
+
+
+def emit_events(model, events, defer=None, batch_size=500):
+    """批量记录系统事件，每条按自己的 log_type 路由；同步写库的部分一次 bulk_create
+
+    events: 字典列表，键同 emit_event 的参数（level、message、log_type、robot、order、user、data、args），
+            以及 robot_id 等其他列
+    defer: 同 emit_event，为 None 时按每条的 log_type 决定
+    返回写库的 SystemLog 实例列表
+    """
+    saved, deferred = [], []
+    for event in events:
+        fields = dict(event)
+        level = fields.pop('level')
+        message = fields.pop('message')
+        log_type = fields.pop('log_type', 'SYSTEM')
+        args = fields.pop('args', ())
+        robot, order, user = fields.pop('robot', None), fields.pop('order', None), fields.pop('user', None)
+        data = fields.pop('data', None)
+
+        route = route_for(log_type)
+        if route in ('both', 'db'):
+            entry = _build_entry(model, level, message, log_type, robot, order, user, data, args, fields)
+            (deferred if (defers(log_type) if defer is None else defer) else saved).append(entry)
+        if route in ('both', 'file'):
+            _log_line(level, log_type, message, args, robot, order, user)
+
+    if saved:
+        model.objects.bulk_create(saved, batch_size=batch_size)
+    if deferred:
+        from .log_sink import log_sink
+        for entry in deferred:
+            log_sink.enqueue(entry)
+    return saved + deferred
+
+
+def _build_entry(model, level, message, log_type, robot, order, user, data, args, fields):
+    return model(
+        level=level,
+        log_type=log_type,
+        message=message % args if args else message,
+        robot=robot,
+        order=order,
+        user=user,
+        data=data or {},
+        **fields
+    )
+
+
+def _log_line(level, log_type, message, args, robot, order, user):
+    python_level = LOG_LEVELS.get(level, logging.INFO)
+    if logger.isEnabledFor(python_level):
+        logger.log(python_level, '%s', EventLine(log_type, message, args, robot, order, user))
@@ -0,0 +1,156 @@
+"""
+流式导出（NDJSON / CSV，可选 gzip）
+
+    GET /api/logs/export/?fmt=ndjson&gzip=1&level=ERROR&start_date=2026-10-01
+    GET /api/orders/export/?fmt=csv
+
+- 查询按主键分批读取（每批 CHUNK_SIZE 行，WHERE id > 上一批最后一行），只取导出的列；
+  MySQL 驱动不支持服务端游标，iterator() 仍会把整个结果集读入内存，所以这里用主键分批代替
+- 每批编码后立即交给 StreamingHttpResponse 发送，gzip 使用增量压缩
+- ASGI 下以异步生成器交给 StreamingHttpResponse（见 core.streaming），否则 Django 会先读完整个导出
+内存占用只与批大小有关，与导出的总行数无关。
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .streaming import iterate_in_thread
+
+DEFAULT_EXPORT_CONFIG = {
+    'CHUNK_SIZE': 2000,      # 每批读取的行数
+    'GZIP_LEVEL': 6,
+}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+SYSTEM_LOG_COLUMNS = [
+    'id', 'timestamp', 'level', 'log_type', 'message',
+    'robot_id', 'order_id', 'user_id', 'user__username',
+    'client_ip', 'path', 'status_code', 'processing_time', 'data',
+]
+
+ORDER_COLUMNS = [
+    'id', 'created_at', 'status', 'student_id', 'student__username', 'teacher_id', 'robot_id',
+    'package_type', 'weight', 'fragile', 'description',
+    'pickup_building', 'pickup_instructions', 'delivery_building', 'delivery_room',
+    'delivery_speed', 'scheduled_date', 'scheduled_time', 'qr_scanned_at', 'qr_is_valid',
+]
+
+
+def get_export_config():
+    config = dict(DEFAULT_EXPORT_CONFIG)
+    config.update(getattr(settings, 'DATA_EXPORT', {}))
+    return config
+
+
+def iter_rows(queryset, columns, chunk_size=None):
+    """按主键升序分批读取 columns，逐行产出元组（columns 第一列必须是 id）"""
+    chunk_size = chunk_size or get_export_config()['CHUNK_SIZE']
+    queryset = queryset.order_by('id').values_list(*columns)
+    last_id = None
+    while True:
+        batch = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(batch[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def _isoformat(value):
+    # DjangoJSONEncoder 会把时间截断到毫秒，这里保留完整精度，与 CSV 一致
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def ndjson_line(columns, row):
+    """一行数据编码为一条 JSON（不含换行）"""
+    record = {column: _isoformat(value) for column, value in zip(columns, row)}
+    return json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def _ndjson_chunks(rows, columns, lines_per_chunk):
+    buffer = []
+    for row in rows:
+        buffer.append(ndjson_line(columns, row))
+        if len(buffer) >= lines_per_chunk:
+            yield ('\n'.join(buffer) + '\n').encode()
+            buffer = []
+    if buffer:
+        yield ('\n'.join(buffer) + '\n').encode()
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return _isoformat(value)
+
+
+def _csv_chunks(rows, columns, lines_per_chunk):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM 让 Excel 正确识别 UTF-8 中文
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        count += 1
+        if count >= lines_per_chunk:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks, level=None):
+    """增量 gzip 压缩，每个输入块压缩后立即产出"""
+    compressor = zlib.compressobj(get_export_config()['GZIP_LEVEL'] if level is None else level,
+                                  zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(queryset, columns, name, fmt='ndjson', use_gzip=False, asynchronous=False):
+    """构建流式导出响应；fmt 不支持时抛出 ValueError
+
+    asynchronous: ASGI 请求传 True，数据块改为异步生成器逐块产出
+    """
+    if fmt not in FORMATS:
+        raise ValueError(fmt)
+    chunk_size = get_export_config()['CHUNK_SIZE']
+    rows = iter_rows(queryset, columns, chunk_size)
+    encode = _ndjson_chunks if fmt == 'ndjson' else _csv_chunks
+    chunks = encode(rows, columns, max(1, chunk_size // 4))
+
+    filename = f"{name}-{timezone.now():%Y%m%d%H%M%S}.{fmt}"
+    if use_gzip:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    else:
+        content_type = FORMATS[fmt]
+
+    if asynchronous:
+        chunks = iterate_in_thread(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    # 告知反向代理不要缓冲整个响应
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,114 @@
+"""
+稀疏字段集（?fields= / ?omit=）
+
+GET /api/orders/?fields=id,status,robot_name
+GET /api/dispatch/orders/?omit=qr_code_url,qr_payload_data,description
+
+- SparseFieldsetsMixin: 读请求（GET/HEAD/OPTIONS）的序列化器只保留请求的字段（未知字段名忽略）；
+  写请求不裁剪，否则 ?fields= 之外的字段会被排除在校验和 validated_data 之外
+- SparseQuerysetMixin: 视图集的 list / retrieve 按序列化器实际输出的字段裁剪查询，
+  普通字段进入 only()，source 中跨关系的字段（如 student.username）改为 select_related，
+  只读取需要的关联列；不带参数时同样 select_related，避免逐行加载关联对象
+序列化器中由其他字段计算出的输出在 Meta.field_dependencies 中声明依赖的模型字段。
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _split(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+def requested_fields(request, available):
+    """根据 fields / omit 参数计算要输出的字段；两个参数都没有时返回 None（全部输出）"""
+    if request is None:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    fields = _split(params.get('fields'))
+    omit = _split(params.get('omit'))
+    if not fields and not omit:
+        return None
+    selected = [name for name in available if name in fields] if fields else list(available)
+    return [name for name in selected if name not in omit]
+
+
+class SparseFieldsetsMixin:
+    """ModelSerializer 混入：读请求按请求参数删减字段"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        selected = requested_fields(request, list(self.fields))
+        if selected is not None:
+            for name in list(self.fields):
+                if name not in selected:
+                    self.fields.pop(name)
+
+
+def sparse_queryset(queryset, serializer):
+    """按序列化器的字段为查询加上 only() 与 select_related()"""
+    model = queryset.model
+    dependencies = getattr(serializer.Meta, 'field_dependencies', {})
+    only = {model._meta.pk.name}
+    related = set()
+    load_all = False
+
+    for name, field in serializer.fields.items():
+        if name in dependencies:
+            sources = dependencies[name]
+        elif field.source == '*':
+            load_all = True  # SerializerMethodField 等需要整个对象
+            continue
+        else:
+            sources = [field.source]
+
+        for source in sources:
+            current = model
+            path = []
+            parts = source.split('.')
+            for index, part in enumerate(parts):
+                try:
+                    model_field = current._meta.get_field(part)
+                except FieldDoesNotExist:
+                    # 属性或方法，无法推断依赖的列
+                    if path:
+                        related.add('__'.join(path))
+                    load_all = True
+                    break
+                path.append(part)
+                last = index == len(parts) - 1
+                if model_field.is_relation and (model_field.many_to_many or not model_field.concrete):
+                    load_all = True  # 多对多或反向关系
+                    break
+                if last:
+                    only.add('__'.join(path))
+                elif model_field.is_relation:
+                    related.add('__'.join(path))
+                    current = model_field.related_model
+                else:
+                    load_all = True
+                    break
+
+    if related:
+        queryset = queryset.select_related(*sorted(related))
+    if not load_all:
+        # select_related 的关系本身也要在 only() 中，否则 Django 会拒绝延迟加载后再关联
+        queryset = queryset.only(*sorted(only | related))
+    return queryset
+
+
+class SparseQuerysetMixin:
+    """视图集混入：list / retrieve 按输出字段裁剪查询
+
+    挂在 filter_queryset 上（list 与 get_object 都会调用），视图集自定义的 get_queryset 不受影响。
+    """
+
+    sparse_actions = ('list', 'retrieve')
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, 'action', None) not in self.sparse_actions:
+            return queryset
+        return sparse_queryset(queryset, self.get_serializer())
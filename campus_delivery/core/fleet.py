@@ -0,0 +1,98 @@
+"""
+机器人车队快照
+
+调度页面一次取得所有机器人的状态、门、电量、待执行指令数和进行中的订单：
+- 机器人 + 待执行指令数: 一条带条件 Count 的查询
+- 进行中的订单: 一条 Prefetch 查询（to_attr 挂到每个机器人上）
+查询数量固定为 2，与机器人数量无关；结果按 ROBOT_FLEET['CACHE_TTL'] 秒缓存在 Django 缓存中。
+在线状态来自 core.presence，不进缓存，每次请求重新读取。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Prefetch, Q
+from django.utils import timezone
+
+from .models import DeliveryOrder, Robot
+from .presence import presence
+from .sweeper import not_timed_out
+
+DEFAULT_FLEET_CONFIG = {
+    'CACHE_TTL': 2,                       # 快照缓存秒数，0 表示不缓存
+    'CACHE_KEY': 'core:robot_fleet_snapshot',
+}
+
+ACTIVE_ORDER_STATUSES = ['ASSIGNED', 'DELIVERING']
+
+
+def get_fleet_config():
+    config = dict(DEFAULT_FLEET_CONFIG)
+    config.update(getattr(settings, 'ROBOT_FLEET', {}))
+    return config
+
+
+def robot_order_summary(order):
+    """机器人视角的订单摘要（status 接口与车队快照共用）"""
+    return {
+        "order_id": order.id,
+        "status": order.status,
+        "delivery_location": f"{order.delivery_building}-{order.delivery_room or '指定地点'}",
+        "qr_is_valid": order.qr_is_valid,
+        "qr_scanned_at": order.qr_scanned_at.isoformat() if order.qr_scanned_at else None
+    }
+
+
+def fleet_queryset(now=None):
+    active_orders = DeliveryOrder.objects.filter(status__in=ACTIVE_ORDER_STATUSES).only(
+        'id', 'robot_id', 'status', 'delivery_building', 'delivery_room', 'qr_is_valid', 'qr_scanned_at'
+    ).order_by('id')
+    return Robot.objects.annotate(
+        pending_commands=Count(
+            'commands',
+            filter=Q(commands__status='PENDING') & not_timed_out(now, prefix='commands__')
+        )
+    ).prefetch_related(
+        Prefetch('orders', queryset=active_orders, to_attr='active_orders')
+    ).order_by('id')
+
+
+def build_fleet_snapshot(now=None):
+    now = now or timezone.now()
+    robots = []
+    for robot in fleet_queryset(now):
+        robots.append({
+            "id": robot.id,
+            "name": robot.name,
+            "status": robot.status,
+            "is_available": robot.is_available,
+            "current_location": robot.current_location,
+            "battery_level": robot.battery_level,
+            "door_status": robot.door_status,
+            "pending_commands": robot.pending_commands,
+            "current_orders": [robot_order_summary(order) for order in robot.active_orders],
+            "last_update": robot.last_status_update.isoformat(),
+            "delivery_start_time": robot.delivery_start_time.isoformat() if robot.delivery_start_time else None,
+            "version": robot.version,
+        })
+    return {
+        "count": len(robots),
+        "robots": robots,
+        "generated_at": now.isoformat(),
+    }
+
+
+def get_fleet_snapshot():
+    """读取车队快照（带短期缓存），并填入实时在线状态"""
+    config = get_fleet_config()
+    snapshot = cache.get(config['CACHE_KEY']) if config['CACHE_TTL'] else None
+    if snapshot is None:
+        snapshot = build_fleet_snapshot()
+        if config['CACHE_TTL']:
+            cache.set(config['CACHE_KEY'], snapshot, config['CACHE_TTL'])
+
+    online = presence.online()
+    robots = [
+        dict(robot, online=robot['id'] in online,
+             last_seen=online[robot['id']].isoformat() if robot['id'] in online else None)
+        for robot in snapshot['robots']
+    ]
+    return dict(snapshot, robots=robots, online_count=sum(1 for robot in robots if robot['online']))
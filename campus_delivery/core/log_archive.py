@@ -0,0 +1,258 @@
+"""
+系统日志归档
+
+超过 LOG_ARCHIVE['RETENTION_DAYS'] 天的 SystemLog 由清理任务 log_archive 按天归档：
+1. 按主键分批读取当天的日志，写入 DIR/system-logs-YYYY-MM-DD.ndjson.gz（先写临时文件再改名）
+2. 写入归档清单 SystemLogArchive（行数、大小、sha256、主键范围）
+3. 按主键分批删除已归档的行，每批一个短事务，不长时间锁住日志表
+中途中断时，下一次运行会从清单中 purged=False 的记录继续删除。
+
+查询：SystemLogViewSet 的 start_date / end_date 覆盖已归档的日期时，
+分页器通过 keyset_extra_rows 从归档文件中补充数据（逐行流式读取，只保留一页所需的行）。
+"""
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .exports import SYSTEM_LOG_COLUMNS, iter_rows, ndjson_line
+
+logger = logging.getLogger('system_backend')
+
+DEFAULT_LOG_ARCHIVE_CONFIG = {
+    'ENABLED': True,
+    'DIR': '/tmp/campus_delivery_log_archive',
+    'RETENTION_DAYS': 30,      # 数据库中保留的天数
+    'BATCH_SIZE': 2000,        # 每批读取/删除的行数
+    'MAX_DAYS_PER_RUN': 7,     # 单次任务最多归档的天数
+}
+
+
+def get_log_archive_config():
+    config = dict(DEFAULT_LOG_ARCHIVE_CONFIG)
+    config.update(getattr(settings, 'LOG_ARCHIVE', {}))
+    return config
+
+
+def archive_filename(day):
+    return f"system-logs-{day:%Y-%m-%d}.ndjson.gz"
+
+
+def archive_file_path(archive):
+    return os.path.join(get_log_archive_config()['DIR'], archive.path)
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, dt_time.min))
+    return start, start + timedelta(days=1)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def archive_day(day):
+    """归档一天的日志并删除数据库中的行，返回 (归档行数, 删除行数)"""
+    from .models import SystemLog, SystemLogArchive
+
+    archive = SystemLogArchive.objects.filter(day=day).first()
+    written = 0
+    if archive is None:
+        config = get_log_archive_config()
+        start, end = _day_bounds(day)
+        queryset = SystemLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+
+        os.makedirs(config['DIR'], exist_ok=True)
+        filename = archive_filename(day)
+        path = os.path.join(config['DIR'], filename)
+        tmp_path = f"{path}.tmp"
+        first_id = last_id = None
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for row in iter_rows(queryset, SYSTEM_LOG_COLUMNS, config['BATCH_SIZE']):
+                f.write(ndjson_line(SYSTEM_LOG_COLUMNS, row))
+                f.write('\n')
+                written += 1
+                first_id = row[0] if first_id is None else first_id
+                last_id = row[0]
+        if not written:
+            os.remove(tmp_path)
+            return 0, 0
+        os.replace(tmp_path, path)
+
+        archive = SystemLogArchive.objects.create(
+            day=day,
+            path=filename,
+            row_count=written,
+            size_bytes=os.path.getsize(path),
+            sha256=_sha256(path),
+            first_id=first_id,
+            last_id=last_id,
+        )
+        logger.info(f"🗄️ 系统日志已归档: {day} - {written} 条 ({archive.size_bytes} 字节)")
+
+    return written, purge_archived(archive)
+
+
+def purge_archived(archive):
+    """分批删除清单对应的数据库行（只删除归档时已写入文件的主键范围）"""
+    from .models import SystemLog
+
+    if archive.purged:
+        return 0
+    batch_size = get_log_archive_config()['BATCH_SIZE']
+    start, end = _day_bounds(archive.day)
+    queryset = SystemLog.objects.filter(
+        timestamp__gte=start, timestamp__lt=end,
+        id__gte=archive.first_id, id__lte=archive.last_id,
+    ).order_by('id')
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += SystemLog.objects.filter(id__in=ids).delete()[0]
+    archive.purged = True
+    archive.save(update_fields=['purged'])
+    return deleted
+
+
+def archive_expired_logs(now=None):
+    """归档超过保留期的日志，返回 {'days': 天数, 'archived': 行数, 'deleted': 行数}"""
+    from .models import SystemLog, SystemLogArchive
+
+    config = get_log_archive_config()
+    result = {'days': 0, 'archived': 0, 'deleted': 0}
+    if not config['ENABLED']:
+        return result
+
+    # 继续上次中断的删除
+    for archive in SystemLogArchive.objects.filter(purged=False):
+        result['deleted'] += purge_archived(archive)
+
+    horizon = timezone.localdate(now or timezone.now()) - timedelta(days=config['RETENTION_DAYS'])
+    oldest = SystemLog.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is None:
+        return result
+    day = timezone.localdate(oldest)
+    while day < horizon and result['days'] < config['MAX_DAYS_PER_RUN']:
+        archived, deleted = archive_day(day)
+        result['archived'] += archived
+        result['deleted'] += deleted
+        result['days'] += 1
+        day += timedelta(days=1)
+    return result
+
+
+def archive_totals():
+    """归档清单汇总: (天数, 行数)"""
+    from .models import SystemLogArchive
+
+    totals = SystemLogArchive.objects.aggregate(rows=Sum('row_count'))
+    return SystemLogArchive.objects.count(), totals['rows'] or 0
+
+
+# ----------------------------------------------------------------------
+# 查询
+# ----------------------------------------------------------------------
+def iter_archive(archive):
+    """逐行读取归档文件，产出字典"""
+    with gzip.open(archive_file_path(archive), 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _to_date(value):
+    if not value:
+        return None
+    return value if hasattr(value, 'year') else parse_date(str(value))
+
+
+def _matches(record, filters):
+    for name in ('level', 'log_type'):
+        if filters.get(name) and record.get(name) != filters[name]:
+            return False
+    for name in ('robot_id', 'order_id'):
+        if filters.get(name) and str(record.get(name)) != str(filters[name]):
+            return False
+    return True
+
+
+def _build_log(record, timestamp):
+    """归档记录还原为未保存的 SystemLog 实例（供序列化器使用，不访问数据库）"""
+    from .models import SystemLog
+
+    log = SystemLog(**{
+        name: record.get(name)
+        for name in SYSTEM_LOG_COLUMNS
+        if '__' not in name and name != 'timestamp'
+    })
+    log.timestamp = timestamp
+    if log.data is None:
+        log.data = {}
+    if record.get('user_id'):
+        log.user = get_user_model()(id=record['user_id'], username=record.get('user__username') or '')
+    return log
+
+
+def archived_logs(filters, position=None, descending=True, limit=50):
+    """按 (timestamp, id) 顺序从归档中取至多 limit 条日志
+
+    filters: level / log_type / robot_id / order_id / start_date / end_date（同 SystemLogViewSet）
+    position: 游标位置 [timestamp ISO, id]，只返回排在它之后的行
+    """
+    from .models import SystemLogArchive
+
+    start_date, end_date = _to_date(filters.get('start_date')), _to_date(filters.get('end_date'))
+    if start_date is None and end_date is None:
+        return []
+
+    after = None
+    if position is not None:
+        after = (parse_datetime(position[0]), int(position[1]))
+
+    archives = SystemLogArchive.objects.all()
+    if start_date:
+        archives = archives.filter(day__gte=start_date)
+    if end_date:
+        archives = archives.filter(day__lte=end_date)
+    if after is not None:
+        after_day = timezone.localdate(after[0])
+        archives = archives.filter(**{'day__lte' if descending else 'day__gte': after_day})
+    archives = archives.order_by('-day' if descending else 'day')
+
+    rows = []
+    for archive in archives:
+        candidates = []
+        for record in iter_archive(archive):
+            if not _matches(record, filters):
+                continue
+            key = (parse_datetime(record['timestamp']), record['id'])
+            if after is not None and (key >= after if descending else key <= after):
+                continue
+            candidates.append((key, record))
+            # 只保留当天排在最前的 limit 行
+            if len(candidates) > limit * 2:
+                candidates = _top(candidates, limit, descending)
+        rows.extend(_build_log(record, key[0]) for key, record in _top(candidates, limit, descending))
+        if len(rows) >= limit:
+            break
+    return rows[:limit]
+
+
+def _top(candidates, limit, descending):
+    select = heapq.nlargest if descending else heapq.nsmallest
+    return select(limit, candidates, key=lambda item: item[0])
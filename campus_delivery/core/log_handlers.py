@@ -0,0 +1,172 @@
+"""
+非阻塞文件日志
+
+- install_queue_logging: 把 LOG_QUEUE['LOGGERS'] 中各 logger 已配置的处理器（文件、控制台）
+  移到 QueueListener 线程中执行，请求线程只把日志记录放入有界队列；
+  队列满时丢弃并计数，磁盘慢或 Docker 的 stdout 管道阻塞都不会拖住接口
+- CompressingRotatingFileHandler: 按大小和时间轮转，旧文件 gzip 压缩
+  （轮转与压缩都在监听线程中进行）
+
+每个进程应写自己的日志文件，多个进程轮转同一个文件会互相覆盖：不同服务用 SYSTEM_BACKEND_LOG_FILE
+区分，同一服务的多个 uvicorn 工作进程（WEB_CONCURRENCY>1）用 per_process 在文件名中加入 PID。
+Python 3.12 的 dictConfig 才支持 QueueHandler 的 handlers/listener 配置，部署镜像为 3.10，
+所以在 CoreConfig.ready() 中安装。
+"""
+import atexit
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_LOG_QUEUE_CONFIG = {
+    'ENABLED': True,
+    'LOGGERS': ['system_backend'],
+    'MAX_QUEUE_SIZE': 10000,
+}
+
+_install_lock = threading.Lock()
+_listeners = {}
+
+
+def get_log_queue_config():
+    config = dict(DEFAULT_LOG_QUEUE_CONFIG)
+    config.update(getattr(settings, 'LOG_QUEUE', {}))
+    return config
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """按大小（maxBytes）或时间（interval 秒，0 表示不按时间）轮转，轮转出的文件压缩为 .gz
+
+    文件名: system_backend.log, system_backend.log.1.gz, system_backend.log.2.gz ...
+    per_process=True 时为 system_backend.<pid>.log ...，fork 出的子进程在首次写入时切换到自己的文件
+    """
+
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0, encoding=None,
+                 delay=False, interval=0, compress=True, per_process=False):
+        self.per_process = per_process
+        self._template = filename
+        self._pid = os.getpid()
+        if per_process:
+            filename = self.process_filename(filename, self._pid)
+        super().__init__(filename, mode=mode, maxBytes=maxBytes, backupCount=backupCount,
+                         encoding=encoding, delay=delay)
+        self.interval = interval
+        self.compress = compress
+        if compress:
+            self.namer = lambda name: f"{name}.gz"
+            self.rotator = self._gzip_rotate
+        self.rollover_at = self._next_rollover(self._opened_at())
+
+    @staticmethod
+    def process_filename(filename, pid):
+        root, ext = os.path.splitext(filename)
+        return f"{root}.{pid}{ext}"
+
+    def _opened_at(self):
+        try:
+            return os.stat(self.baseFilename).st_mtime
+        except OSError:
+            return time.time()
+
+    def _next_rollover(self, now):
+        return now + self.interval if self.interval else None
+
+    def emit(self, record):
+        if self.per_process and self._pid != os.getpid():
+            self._switch_to_current_process()
+        super().emit(record)
+
+    def _switch_to_current_process(self):
+        self._pid = os.getpid()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = os.path.abspath(self.process_filename(self._template, self._pid))
+        self.rollover_at = self._next_rollover(self._opened_at())
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and record.created >= self.rollover_at:
+            # 空文件不轮转，只顺延下一次时间
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+            self.rollover_at = self._next_rollover(record.created)
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self._next_rollover(time.time())
+
+    @staticmethod
+    def _gzip_rotate(source, dest):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志而不是阻塞请求线程"""
+
+    def __init__(self, log_queue, name):
+        super().__init__(log_queue)
+        self.logger_name = name
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 进程内队列无需序列化，消息留给监听线程中的处理器格式化（core.events 的延迟拼接也在那里执行）
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            try:
+                from .metrics import metrics_registry
+                metrics_registry.inc(
+                    'log_queue_dropped_total', {'logger': self.logger_name},
+                    help_text='日志队列已满而丢弃的日志条数'
+                )
+            except Exception:
+                pass
+
+
+def install_queue_logging():
+    """为配置中的 logger 安装队列处理器（重复调用无副作用）"""
+    config = get_log_queue_config()
+    if not config['ENABLED']:
+        return
+    with _install_lock:
+        for name in config['LOGGERS']:
+            if name in _listeners:
+                continue
+            logger = logging.getLogger(name)
+            targets = [h for h in logger.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+            if not targets:
+                continue
+            log_queue = queue.Queue(maxsize=config['MAX_QUEUE_SIZE'])
+            listener = logging.handlers.QueueListener(log_queue, *targets, respect_handler_level=True)
+            handler = DroppingQueueHandler(log_queue, name)
+            for target in targets:
+                logger.removeHandler(target)
+            logger.addHandler(handler)
+            listener.start()
+            if not _listeners:
+                atexit.register(stop_queue_logging)
+            _listeners[name] = listener
+
+
+def stop_queue_logging():
+    """停止监听线程（写完队列中剩余的日志）"""
+    with _install_lock:
+        while _listeners:
+            _, listener = _listeners.popitem()
+            try:
+                listener.stop()
+            except Exception:
+                pass
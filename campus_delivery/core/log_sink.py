@@ -0,0 +1,282 @@
+"""
+日志异步批量写入器
+
+中间件等高频调用方把未保存的模型实例（如 SystemLog）放入有界队列，
+由后台线程按批量大小或时间阈值统一 bulk_create 入库，
+请求线程不再同步写数据库。
+
+一批中有无法写入的行（如外键指向的订单已被删除）时逐条重试，只丢弃出错的行。
+关闭（ENABLED=False）时在调用方线程中同步写入，不管理连接，可以在 transaction.atomic() 中使用。
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger('system_backend')
+
+OVERFLOW_POLICIES = ('drop', 'sample', 'block')
+
+# 放入队列用于唤醒写线程立即写入当前批次
+_FLUSH_MARKER = object()
+
+DEFAULT_SINK_CONFIG = {
+    'ENABLED': True,           # 关闭后退化为同步写入
+    'MAX_QUEUE_SIZE': 10000,   # 队列容量
+    'BATCH_SIZE': 200,         # 达到该数量立即写入
+    'FLUSH_INTERVAL': 1.0,     # 最长等待秒数
+    'OVERFLOW_POLICY': 'drop',  # 队列满时的策略: drop / sample / block
+    'SAMPLE_RATE': 0.1,        # sample 策略下超过高水位后的保留比例
+    'HIGH_WATERMARK': 0.8,     # sample 策略开始采样的队列占用比例
+    'BLOCK_TIMEOUT': 0.5,      # block 策略最长阻塞秒数，超时后丢弃
+}
+
+
+def get_sink_config():
+    """合并默认配置与 settings.LOG_SINK"""
+    config = dict(DEFAULT_SINK_CONFIG)
+    config.update(getattr(settings, 'LOG_SINK', {}))
+    if config['OVERFLOW_POLICY'] not in OVERFLOW_POLICIES:
+        raise ValueError(f"未知的 LOG_SINK.OVERFLOW_POLICY: {config['OVERFLOW_POLICY']}")
+    return config
+
+
+class LogSink:
+    """有界队列 + 后台写线程"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._config = None
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._pid = None
+        self._hooks = []
+        self._last_hooks_run = 0.0
+        self._counters = {'queued': 0, 'flushed': 0, 'dropped': 0, 'failed': 0}
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+    def _ensure_started(self):
+        """首次使用或 fork 之后（gunicorn 预加载）重新创建队列和写线程"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._config = get_sink_config()
+            self._queue = queue.Queue(maxsize=self._config['MAX_QUEUE_SIZE'])
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._counters = {'queued': 0, 'flushed': 0, 'dropped': 0, 'failed': 0}
+            if self._config['ENABLED']:
+                self._thread = threading.Thread(target=self._run, name='log-sink-writer', daemon=True)
+                self._thread.start()
+            else:
+                self._thread = False
+
+    def shutdown(self, timeout=5.0):
+        """停止写线程并把队列中剩余记录全部写入"""
+        if self._pid != os.getpid() or not self._thread:
+            return
+        self._stop.set()
+        # 唤醒正在等待队列的写线程
+        try:
+            self._queue.put_nowait(_FLUSH_MARKER)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        # 写线程未能及时退出时，在当前线程把剩余记录写完
+        self._drain()
+        self._run_hooks(force=True)
+
+    def reset(self):
+        """写完队列并停止写线程，下次使用时按当前 settings.LOG_SINK 重新初始化（测试中切换模式）"""
+        self.shutdown()
+        with self._lock:
+            self._pid = None
+            self._thread = None
+
+    def add_flush_hook(self, hook):
+        """注册在写线程中周期执行的回调（如汇总表刷新）"""
+        if hook not in self._hooks:
+            self._hooks.append(hook)
+
+    def tick(self):
+        """同步模式下没有写线程，由调用方在请求结束时触发周期回调"""
+        self._ensure_started()
+        if not self._thread:
+            self._run_hooks()
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def enqueue(self, record):
+        """放入一条未保存的模型实例，返回是否被接收"""
+        self._ensure_started()
+        if not self._thread:
+            self._insert(type(record), [record])
+            return True
+
+        config = self._config
+        policy = config['OVERFLOW_POLICY']
+        try:
+            if policy == 'block':
+                self._queue.put(record, timeout=config['BLOCK_TIMEOUT'])
+            else:
+                if policy == 'sample':
+                    watermark = config['MAX_QUEUE_SIZE'] * config['HIGH_WATERMARK']
+                    if self._queue.qsize() >= watermark and random.random() >= config['SAMPLE_RATE']:
+                        self._count('dropped')
+                        return False
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+        self._count('queued')
+        return True
+
+    def flush(self):
+        """唤醒写线程并等待已入队的记录全部写入"""
+        if self._pid != os.getpid() or not self._thread:
+            return
+        self._queue.put(_FLUSH_MARKER)
+        self._queue.join()
+
+    def _run(self):
+        config = self._config
+        while not self._stop.is_set():
+            batch, taken = self._collect_batch(config['BATCH_SIZE'], config['FLUSH_INTERVAL'])
+            self._write_taken(batch, taken)
+            self._run_hooks()
+        self._drain()
+
+    def _collect_batch(self, batch_size, interval):
+        """收集一批记录：凑满 batch_size、等待超过 interval 或收到 flush 标记即返回"""
+        batch = []
+        taken = 0
+        deadline = time.monotonic() + interval
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            taken += 1
+            if item is _FLUSH_MARKER:
+                break
+            batch.append(item)
+        return batch, taken
+
+    def _drain(self):
+        batch_size = self._config['BATCH_SIZE']
+        while True:
+            batch = []
+            taken = 0
+            try:
+                while len(batch) < batch_size:
+                    item = self._queue.get_nowait()
+                    taken += 1
+                    if item is not _FLUSH_MARKER:
+                        batch.append(item)
+            except queue.Empty:
+                pass
+            if not taken:
+                return
+            self._write_taken(batch, taken)
+
+    def _write_taken(self, batch, taken):
+        """写入一批记录并为取出的每个队列元素调用 task_done"""
+        try:
+            if batch:
+                self._write(batch)
+        finally:
+            for _ in range(taken):
+                self._queue.task_done()
+
+    def _write(self, records):
+        """按模型分组 bulk_create"""
+        grouped = {}
+        for record in records:
+            grouped.setdefault(type(record), []).append(record)
+
+        self._close_connections()
+        try:
+            for model, items in grouped.items():
+                self._insert(model, items)
+        finally:
+            self._close_connections()
+
+    def _insert(self, model, items):
+        """bulk_create 一组记录；失败时逐条重试，只把出错的行计为 failed
+
+        每次写入在独立的 atomic 中（调用方已在事务中时为保存点），失败不会影响调用方的事务。
+        """
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(items, batch_size=self._config['BATCH_SIZE'])
+        except Exception as e:
+            if len(items) == 1:
+                self._count('failed')
+                logger.error(f"写入 {model.__name__} 失败: {e}")
+                return
+            logger.warning(f"批量写入 {model.__name__} 失败，逐条重试: {e}")
+            for item in items:
+                self._insert(model, [item])
+            return
+        self._count('flushed', len(items))
+
+    def _run_hooks(self, force=False):
+        if not self._hooks:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_hooks_run < self._config['FLUSH_INTERVAL']:
+            return
+        self._last_hooks_run = now
+        for hook in list(self._hooks):
+            try:
+                hook()
+            except Exception as e:
+                logger.error(f"日志写入器回调执行失败: {e}")
+        self._close_connections()
+
+    def _close_connections(self):
+        # 只在写线程中关闭过期连接；shutdown / 同步模式在调用方线程中执行，
+        # 关闭连接会破坏调用方正在进行的事务
+        if threading.current_thread() is self._thread:
+            close_old_connections()
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def stats(self):
+        """当前进程的写入统计"""
+        self._ensure_started()
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({
+            'pending': self._queue.qsize(),
+            'max_queue_size': self._config['MAX_QUEUE_SIZE'],
+            'overflow_policy': self._config['OVERFLOW_POLICY'],
+            'async_enabled': bool(self._thread),
+            'pid': self._pid,
+        })
+        return counters
+
+
+log_sink = LogSink()
+atexit.register(log_sink.shutdown)
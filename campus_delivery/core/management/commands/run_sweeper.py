@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sweeper import Sweeper, get_tasks
+
+
+class Command(BaseCommand):
+    help = '周期执行后台清理任务（命令超时、过期命令清理等）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='执行一次所有任务后退出')
+        parser.add_argument('--task', action='append', dest='tasks', help='只执行指定任务（可重复），隐含 --once')
+        parser.add_argument('--list', action='store_true', help='列出已注册的任务')
+
+    def handle(self, *args, **options):
+        tasks = get_tasks()
+
+        if options['list']:
+            for name, (_, interval) in sorted(tasks.items()):
+                self.stdout.write(f"{name}\t每 {interval} 秒")
+            return
+
+        sweeper = Sweeper()
+        if options['tasks']:
+            for name in options['tasks']:
+                if name not in tasks:
+                    raise CommandError(f"未知任务: {name}（可用: {', '.join(sorted(tasks))}）")
+                result = sweeper.run_task(name)
+                self.stdout.write(f"✅ {name}: {result}")
+            return
+
+        if options['once']:
+            ran = sweeper.run_pending(force=True)
+            if not ran:
+                self.stdout.write(self.style.WARNING('⚠️ 其他进程正在执行清理任务，本次跳过'))
+            for name in ran:
+                self.stdout.write(f"✅ {name}")
+            return
+
+        self.stdout.write(f"🧹 清理服务已启动，任务: {', '.join(sorted(tasks))}")
+        try:
+            sweeper.run_forever()
+        except KeyboardInterrupt:
+            sweeper.stop()
@@ -0,0 +1,312 @@
+"""
+进程内指标注册表（Prometheus 文本格式导出）
+
+- 计数器、仪表盘、直方图（固定桶）、摘要（count/sum）
+- 每个工作进程把自己的快照写入 METRICS['MULTIPROCESS_DIR']/metrics-<pid>.json，
+  导出接口读取所有存活进程的快照并合并，gunicorn/uvicorn 多进程下结果一致
+- 已退出进程（worker 重启、max_requests 回收）的计数器、直方图和摘要并入
+  metrics-accumulated.json 后再删除快照，保证导出的计数单调不减；仪表盘只反映存活进程，直接丢弃
+- 快照由日志写入器线程周期写出，请求线程只做内存累加
+"""
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+
+from django.conf import settings
+
+from .log_sink import log_sink
+
+logger = logging.getLogger('system_backend')
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEFAULT_METRICS_CONFIG = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': '/tmp/campus_delivery_metrics',
+    'LATENCY_BUCKETS': DEFAULT_LATENCY_BUCKETS,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+}
+
+
+def get_metrics_config():
+    config = dict(DEFAULT_METRICS_CONFIG)
+    config.update(getattr(settings, 'METRICS', {}))
+    return config
+
+
+ACCUMULATED_FILE = 'metrics-accumulated.json'
+ACCUMULATED_LOCK = 'metrics-accumulated.lock'
+
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+class MetricsRegistry:
+    """单进程指标存储"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}        # name -> (type, help, buckets)
+        self._values = {}      # (name, label_key) -> float 或 [bucket_counts..., sum, count]
+        self._pid = os.getpid()
+        self._snapshot_written = False
+
+    def _reset_after_fork(self):
+        if self._pid != os.getpid():
+            self._values = {}
+            self._pid = os.getpid()
+            self._snapshot_written = False
+
+    def _register(self, name, metric_type, help_text, buckets=None):
+        meta = self._meta.get(name)
+        if meta is None:
+            self._meta[name] = (metric_type, help_text, tuple(buckets) if buckets else None)
+        elif meta[0] != metric_type:
+            raise ValueError(f"指标 {name} 已注册为 {meta[0]}")
+        return self._meta[name]
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def inc(self, name, labels=None, value=1, help_text=''):
+        """计数器加值"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._reset_after_fork()
+            self._register(name, 'counter', help_text)
+            self._values[key] = self._values.get(key, 0) + value
+
+    def gauge_add(self, name, labels=None, value=1, help_text=''):
+        """仪表盘增减（多进程导出时求和）"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._reset_after_fork()
+            self._register(name, 'gauge', help_text)
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, labels=None, buckets=None, help_text=''):
+        """直方图观测"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._reset_after_fork()
+            _, _, bounds = self._register(
+                name, 'histogram', help_text, buckets or get_metrics_config()['LATENCY_BUCKETS']
+            )
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(bounds) + 1) + [0.0, 0]
+            for index, bound in enumerate(bounds):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            else:
+                state[len(bounds)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def summarize(self, name, value, labels=None, help_text=''):
+        """摘要观测（只保留 count 和 sum）"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._reset_after_fork()
+            self._register(name, 'summary', help_text)
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0, 0]
+            state[0] += value
+            state[1] += 1
+
+    # ------------------------------------------------------------------
+    # 多进程快照
+    # ------------------------------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            self._reset_after_fork()
+            return {
+                'meta': {name: [t, h, list(b) if b else None] for name, (t, h, b) in self._meta.items()},
+                'values': [
+                    [name, list(map(list, label_key)), value if not isinstance(value, list) else list(value)]
+                    for (name, label_key), value in self._values.items()
+                ],
+            }
+
+    def _snapshot_dir(self):
+        return get_metrics_config()['MULTIPROCESS_DIR']
+
+    def write_snapshot(self):
+        """把本进程快照原子写入共享目录"""
+        directory = self._snapshot_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        snapshot = self.snapshot()
+        if not self._snapshot_written:
+            # PID 被复用时同名文件属于已退出的进程，先并入累计文件再覆盖
+            if os.path.exists(path):
+                self._fold_dead_snapshot(directory, path)
+            self._snapshot_written = True
+        _write_json(path, snapshot)
+
+    def collect(self):
+        """合并累计值和所有存活进程的快照，本进程使用内存中的最新值"""
+        snapshots = [self.snapshot()]
+        directory = self._snapshot_dir()
+        if os.path.isdir(directory):
+            live_paths = []
+            for filename in os.listdir(directory):
+                if not (filename.startswith('metrics-') and filename.endswith('.json')):
+                    continue
+                try:
+                    pid = int(filename[len('metrics-'):-len('.json')])
+                except ValueError:
+                    continue
+                if pid == os.getpid():
+                    continue
+                path = os.path.join(directory, filename)
+                if _pid_alive(pid):
+                    live_paths.append(path)
+                else:
+                    self._fold_dead_snapshot(directory, path)
+            # 累计文件在并入之后读取，已删除的快照不会被重复计算
+            for path in [os.path.join(directory, ACCUMULATED_FILE)] + live_paths:
+                snapshot = _read_json(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        return _merge(snapshots)
+
+    def _fold_dead_snapshot(self, directory, path):
+        """把已退出进程的快照并入累计文件（丢弃仪表盘）后删除；多个进程同时处理时由文件锁串行"""
+        with open(os.path.join(directory, ACCUMULATED_LOCK), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(path):
+                    return
+                dead = _read_json(path)
+                if dead is not None:
+                    dead['values'] = [
+                        item for item in dead['values']
+                        if dead['meta'].get(item[0], ['gauge'])[0] != 'gauge'
+                    ]
+                    accumulated_path = os.path.join(directory, ACCUMULATED_FILE)
+                    accumulated = _read_json(accumulated_path) or {'meta': {}, 'values': []}
+                    meta, merged = _merge([accumulated, dead])
+                    _write_json(accumulated_path, {
+                        'meta': {name: list(value) for name, value in meta.items()},
+                        'values': [
+                            [name, list(map(list, label_key)), value]
+                            for (name, label_key), value in merged.items()
+                        ],
+                    })
+                _remove_quietly(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def render(self):
+        """Prometheus 文本格式 0.0.4"""
+        meta, merged = self.collect()
+        by_name = {}
+        for (name, label_key), value in merged.items():
+            by_name.setdefault(name, []).append((label_key, value))
+
+        lines = []
+        for name in sorted(by_name):
+            metric_type, help_text, buckets = meta[name]
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for label_key, value in sorted(by_name[name]):
+                if metric_type == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + [math.inf], value[:-2]):
+                        cumulative += count
+                        le = '+Inf' if bound == math.inf else _format_number(bound)
+                        lines.append(f"{name}_bucket{_format_labels(label_key, ('le', le))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(label_key)} {_format_number(value[-2])}")
+                    lines.append(f"{name}_count{_format_labels(label_key)} {value[-1]}")
+                elif metric_type == 'summary':
+                    lines.append(f"{name}_sum{_format_labels(label_key)} {_format_number(value[0])}")
+                    lines.append(f"{name}_count{_format_labels(label_key)} {value[1]}")
+                else:
+                    lines.append(f"{name}{_format_labels(label_key)} {_format_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(snapshots):
+    """按 (name, labels) 合并多个快照，返回 (meta, merged)"""
+    meta = {}
+    merged = {}
+    for snap in snapshots:
+        for name, (metric_type, help_text, buckets) in snap['meta'].items():
+            meta.setdefault(name, (metric_type, help_text, buckets))
+        for name, label_pairs, value in snap['values']:
+            key = (name, tuple(tuple(pair) for pair in label_pairs))
+            if isinstance(value, list):
+                current = merged.get(key)
+                merged[key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return meta, merged
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    """先写临时文件再替换，读取方不会看到写了一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(label_key, extra=None):
+    pairs = list(label_key)
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _write_snapshot_hook():
+    if get_metrics_config()['ENABLED']:
+        metrics_registry.write_snapshot()
+
+
+metrics_registry = MetricsRegistry()
+log_sink.add_flush_hook(_write_snapshot_hook)
@@ -1,9 +1,14 @@
-import json
 import time
 import logging
+from asgiref.sync import sync_to_async
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
 from .models import SystemLog
+from .log_sink import log_sink
+from .capture import get_capture_policy
+from .rollups import traffic_rollups
+from .metrics import metrics_registry, get_metrics_config
+from .streaming import is_asgi_request, iterate_in_thread
 from django.utils import timezone
 
 logger = logging.getLogger('system_backend')
@@ -16,6 +21,18 @@ class NetworkMonitorMiddleware(MiddlewareMixin):
         # 记录请求开始时间
         request.start_time = time.time()
         
+        # 在途请求数
+        request.metrics_in_flight = get_metrics_config()['ENABLED']
+        if request.metrics_in_flight:
+            metrics_registry.gauge_add(
+                'http_requests_in_flight', {'method': request.method}, 1,
+                help_text='正在处理的 HTTP 请求数'
+            )
+        
+        # 按采集策略决定是否采样（出错的请求在响应阶段仍会被记录）
+        policy = get_capture_policy()
+        request.capture_decision = policy.decide(request.path)
+        
         # 获取客户端信息
         client_ip = self.get_client_ip(request)
         user_agent = request.META.get('HTTP_USER_AGENT', 'Unknown')
@@ -23,47 +40,30 @@ class NetworkMonitorMiddleware(MiddlewareMixin):
         path = request.path
         query_params = dict(request.GET.items())
         
-        # 获取请求体（如果是POST/PUT等）
-        request_body = {}
-        if method in ['POST', 'PUT', 'PATCH']:
+        # 请求体只在视图读取之前保留原始字节，解析与截断推迟到响应阶段
+        request.capture_raw_body = b''
+        if method in ['POST', 'PUT', 'PATCH'] and policy.is_capturable(request.content_type):
             try:
-                if request.content_type == 'application/json':
-                    request_body = json.loads(request.body.decode('utf-8'))
-                else:
-                    request_body = dict(request.POST.items())
-            except:
-                request_body = {'raw_body': str(request.body)}
+                request.capture_raw_body = request.body
+            except Exception:
+                request.capture_raw_body = b''
         
         # 获取用户信息（安全检查）
         user_info = 'Anonymous'
-        user_obj = None
         if hasattr(request, 'user') and request.user.is_authenticated:
             user_info = f"{request.user.username} (ID: {request.user.id})"
-            user_obj = request.user
         
-        # 记录请求日志
-        request_data = {
+        # 请求日志数据，响应完成后决定是否写入
+        request.capture_request_data = {
             'client_ip': client_ip,
             'user_agent': user_agent,
             'method': method,
             'path': path,
             'query_params': query_params,
-            'request_body': request_body,
             'user': user_info,
             'timestamp': timezone.now().isoformat(),
         }
         
-        # 保存到数据库
-        try:
-            SystemLog.log_info(
-                message=f"收到请求: {method} {path}",
-                log_type='NETWORK_REQUEST',
-                user=user_obj,
-                data=request_data
-            )
-        except Exception as e:
-            logger.error(f"记录请求日志失败: {e}")
-        
         # 同时记录到控制台
         logger.info(f"🌐 网络请求: {client_ip} - {user_info} - {method} {path}")
         
@@ -71,24 +71,64 @@ class NetworkMonitorMiddleware(MiddlewareMixin):
     
     def process_response(self, request, response):
         """处理响应 - 记录响应信息"""
+        # 流式响应（导出、文件下载等）不能读取 content，否则整个响应会被缓冲到内存：
+        # 包装迭代器统计字节数，响应关闭时再记录
+        if response.streaming:
+            self.monitor_stream(request, response)
+            return response
+        
         # 计算请求处理时间
         if hasattr(request, 'start_time'):
             processing_time = time.time() - request.start_time
         else:
             processing_time = 0
         
-        # 获取响应信息
-        status_code = response.status_code
-        content_length = len(response.content) if hasattr(response, 'content') else 0
+        self.record_response(request, response, len(response.content), processing_time)
+        return response
+    
+    def monitor_stream(self, request, response):
+        """流式响应：统计发送的字节数与首/末字节时间，在发送结束或响应关闭时记录"""
+        stream = _StreamMonitor(getattr(request, 'start_time', None) or time.time())
+        
+        def finish():
+            if not stream.recorded:
+                stream.recorded = True
+                self.record_response(
+                    request, response, stream.bytes_sent, stream.elapsed(),
+                    stream_info=stream.info(),
+                )
         
-        # 获取响应体（如果是JSON响应）
-        response_body = {}
-        if hasattr(response, 'content') and response.content:
+        if is_asgi_request(request):
+            # ASGI 下 Django 会把同步迭代器整个读入列表再发送，统一换成异步生成器，
+            # 在数据块真正发送时计数；FileResponse 也逐块发送（uvicorn 没有 wsgi.file_wrapper）。
+            # 客户端断开时 Django 不调用 close()，由生成器结束时记录（completed=False）
+            content = response.streaming_content
+            if not response.is_async:
+                content = iterate_in_thread(content)
+            response.streaming_content = stream.wrap_async(content, finish)
+        elif getattr(response, 'file_to_stream', None) is not None:
+            # WSGI 下 FileResponse 可能由 wsgi.file_wrapper 直接发送文件（sendfile），不包装迭代器，
+            # 字节数取 Content-Length
+            stream.bytes_sent = int(response.get('Content-Length') or 0)
+            stream.file_wrapper = True
+        elif response.is_async:
+            response.streaming_content = stream.wrap_async(response.streaming_content)
+        else:
+            response.streaming_content = stream.wrap(response.streaming_content)
+        
+        original_close = response.close
+        
+        def close():
             try:
-                if response.get('Content-Type', '').startswith('application/json'):
-                    response_body = json.loads(response.content.decode('utf-8'))
-            except:
-                response_body = {'raw_content': str(response.content)[:200]}
+                original_close()
+            finally:
+                finish()
+        
+        response.close = close
+    
+    def record_response(self, request, response, content_length, processing_time, stream_info=None):
+        """汇总、指标与响应日志；stream_info 不为空表示流式响应（此时不读取响应体）"""
+        status_code = response.status_code
         
         # 获取用户信息（安全检查）
         user_info = 'Anonymous'
@@ -97,38 +137,81 @@ class NetworkMonitorMiddleware(MiddlewareMixin):
             user_info = f"{request.user.username} (ID: {request.user.id})"
             user_obj = request.user
         
-        # 记录响应日志
-        response_data = {
-            'status_code': status_code,
-            'processing_time': round(processing_time, 3),
-            'content_length': content_length,
-            'response_body': response_body,
-            'timestamp': timezone.now().isoformat(),
-        }
-        
-        # 根据状态码选择日志级别
-        if status_code >= 400:
-            log_method = SystemLog.log_warning
-            log_level = 'WARNING'
-        else:
-            log_method = SystemLog.log_info
-            log_level = 'INFO'
+        # 所有请求都计入分钟级流量汇总和延迟直方图（不受采样影响）
+        client_ip = self.get_client_ip(request)
+        if hasattr(request, 'start_time'):
+            route = self.get_route_name(request)
+            self.record_rollup(request, route, status_code, user_obj, client_ip, processing_time)
+            self.record_metrics(request, route, status_code, content_length, processing_time)
         
-        # 保存到数据库
-        try:
-            log_method(
-                message=f"响应完成: {request.method} {request.path} - {status_code} ({processing_time:.3f}s)",
-                log_type='NETWORK_RESPONSE',
-                user=user_obj,
-                data=response_data
+        # 未被采样且未出错的请求不写数据库
+        policy = get_capture_policy()
+        decision = getattr(request, 'capture_decision', None)
+        if decision is not None and policy.should_record(decision, status_code):
+            body_limit = policy.body_limit(decision, status_code)
+            capture_reason = 'sampled' if decision.sampled else 'error'
+            
+            # 记录请求日志
+            request_data = dict(request.capture_request_data)
+            request_data['user'] = user_info
+            request_data['request_body'] = policy.render_body(
+                request.capture_raw_body, request.content_type, body_limit
             )
-        except Exception as e:
-            logger.error(f"记录响应日志失败: {e}")
+            request_data['capture_reason'] = capture_reason
+            request_data['sample_rate'] = decision.sample_rate
+            
+            # 获取响应体（按 Content-Type 和大小截断）
+            if stream_info is not None:
+                response_body = dict(stream_info, content_type=response.get('Content-Type', ''))
+            else:
+                response_body = policy.render_body(
+                    response.content, response.get('Content-Type', ''), body_limit
+                )
+            
+            # 记录响应日志
+            response_data = {
+                'status_code': status_code,
+                'processing_time': round(processing_time, 3),
+                'content_length': content_length,
+                'response_body': response_body,
+                'capture_reason': capture_reason,
+                'sample_rate': decision.sample_rate,
+                'timestamp': timezone.now().isoformat(),
+            }
+            
+            # 根据状态码选择日志级别
+            if status_code >= 400:
+                log_level = 'WARNING'
+            else:
+                log_level = 'INFO'
+            
+            # 放入异步写入队列，由后台线程批量入库
+            try:
+                self.enqueue_log(
+                    level='INFO',
+                    message=f"收到请求: {request.method} {request.path}",
+                    log_type='NETWORK_REQUEST',
+                    user=user_obj,
+                    data=request_data,
+                    client_ip=(client_ip or '')[:45],
+                    path=request.path[:255],
+                )
+                self.enqueue_log(
+                    level=log_level,
+                    message=f"响应完成: {request.method} {request.path} - {status_code} ({processing_time:.3f}s)",
+                    log_type='NETWORK_RESPONSE',
+                    user=user_obj,
+                    data=response_data,
+                    client_ip=(client_ip or '')[:45],
+                    path=request.path[:255],
+                    status_code=status_code,
+                    processing_time=round(processing_time, 3),
+                )
+            except Exception as e:
+                logger.error(f"记录响应日志失败: {e}")
         
         # 同时记录到控制台
         logger.info(f"📤 网络响应: {user_info} - {request.method} {request.path} - {status_code} ({processing_time:.3f}s)")
-        
-        return response
     
     def process_exception(self, request, exception):
         """处理异常 - 记录错误信息"""
@@ -156,7 +239,9 @@ class NetworkMonitorMiddleware(MiddlewareMixin):
                 message=f"请求异常: {request.method} {request.path} - {type(exception).__name__}: {str(exception)}",
                 log_type='NETWORK_ERROR',
                 user=user_obj,
-                data=exception_data
+                data=exception_data,
+                client_ip=(client_ip or '')[:45],
+                path=request.path[:255],
             )
         except Exception as e:
             logger.error(f"记录异常日志失败: {e}")
@@ -166,6 +251,52 @@ class NetworkMonitorMiddleware(MiddlewareMixin):
         
         return None
     
+    def get_route_name(self, request):
+        """URL 名称（如 robots-get-commands），未匹配的路径统一归为 unmatched"""
+        resolver_match = getattr(request, 'resolver_match', None)
+        return resolver_match.view_name if resolver_match else 'unmatched'
+    
+    def record_rollup(self, request, route, status_code, user_obj, client_ip, processing_time):
+        """累加到流量汇总，由日志写入器线程定期合并入库"""
+        try:
+            traffic_rollups.record(
+                route=route,
+                method=request.method,
+                status_code=status_code,
+                user_id=user_obj.id if user_obj else None,
+                client_ip=client_ip,
+                latency=processing_time,
+            )
+            log_sink.tick()
+        except Exception as e:
+            logger.error(f"记录流量汇总失败: {e}")
+    
+    def record_metrics(self, request, route, status_code, content_length, processing_time):
+        """更新进程内指标注册表"""
+        if not getattr(request, 'metrics_in_flight', False):
+            return
+        try:
+            labels = {'view': route, 'method': request.method}
+            metrics_registry.gauge_add('http_requests_in_flight', {'method': request.method}, -1)
+            metrics_registry.inc(
+                'http_requests_total', dict(labels, status=str(status_code)),
+                help_text='按视图、方法、状态码统计的 HTTP 请求数'
+            )
+            metrics_registry.observe(
+                'http_request_duration_seconds', processing_time, labels,
+                help_text='HTTP 请求处理耗时（秒）'
+            )
+            metrics_registry.summarize(
+                'http_response_size_bytes', content_length, labels,
+                help_text='HTTP 响应体大小（字节）'
+            )
+        except Exception as e:
+            logger.error(f"记录请求指标失败: {e}")
+    
+    def enqueue_log(self, level, message, log_type, user=None, data=None, **fields):
+        """交给异步写入器批量入库（fields 为 client_ip、path 等索引列）；控制台输出由中间件自己完成"""
+        SystemLog.emit(level, message, log_type, user=user, data=data, defer=True, targets=('db',), **fields)
+    
     def get_client_ip(self, request):
         """获取客户端真实IP地址"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -176,6 +307,62 @@ class NetworkMonitorMiddleware(MiddlewareMixin):
         return ip
 
 
+class _StreamMonitor:
+    """流式响应的字节计数；只保存计数和时间，不保留数据块"""
+
+    def __init__(self, start_time):
+        self.start_time = start_time
+        self.view_time = time.time() - start_time
+        self.bytes_sent = 0
+        self.chunks = 0
+        self.first_byte_at = None
+        self.last_byte_at = None
+        self.completed = False
+        self.recorded = False
+        self.file_wrapper = False
+
+    def _count(self, chunk):
+        now = time.time()
+        if self.first_byte_at is None:
+            self.first_byte_at = now
+        self.last_byte_at = now
+        self.bytes_sent += len(chunk)
+        self.chunks += 1
+
+    def wrap(self, content):
+        for chunk in content:
+            self._count(chunk)
+            yield chunk
+        self.completed = True
+
+    async def wrap_async(self, content, on_finish=None):
+        try:
+            async for chunk in content:
+                self._count(chunk)
+                yield chunk
+            self.completed = True
+        finally:
+            if on_finish is not None:
+                # 记录可能写库（同步日志模式、汇总刷新），不能在事件循环线程中执行
+                await sync_to_async(on_finish, thread_sensitive=True)()
+
+    def elapsed(self):
+        """到最后一个字节（未发送任何数据时到关闭）的耗时"""
+        return (self.last_byte_at or time.time()) - self.start_time
+
+    def info(self):
+        first_byte = self.first_byte_at - self.start_time if self.first_byte_at else None
+        if self.file_wrapper:
+            return {'streaming': True, 'file': True, 'view_time': round(self.view_time, 3)}
+        return {
+            'streaming': True,
+            'completed': self.completed,  # False 表示客户端提前断开
+            'chunks': self.chunks,
+            'view_time': round(self.view_time, 3),
+            'time_to_first_byte': round(first_byte, 3) if first_byte is not None else None,
+        }
+
+
 class RealTimeMonitorMiddleware(MiddlewareMixin):
     """实时监控中间件 - 用于WebSocket连接监控"""
     
@@ -195,6 +382,8 @@ class RealTimeMonitorMiddleware(MiddlewareMixin):
                     message=f"WebSocket连接建立: {client_ip}",
                     log_type='WEBSOCKET_CONNECTION',
                     user=user_obj,
+                    client_ip=(client_ip or '')[:45],
+                    path=request.path[:255],
                     data={
                         'client_ip': client_ip,
                         'user_agent': request.META.get('HTTP_USER_AGENT', 'Unknown'),
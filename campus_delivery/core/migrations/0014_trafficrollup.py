@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-17 23:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_alter_robotcommand_command_alter_systemlog_log_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrafficRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('route', models.CharField(max_length=200)),
+                ('method', models.CharField(max_length=10)),
+                ('status_class', models.CharField(max_length=3)),
+                ('client_ip', models.CharField(blank=True, default='', max_length=45)),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('latency_sum', models.FloatField(default=0)),
+                ('latency_max', models.FloatField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-bucket'],
+                'indexes': [models.Index(fields=['bucket'], name='core_traffi_bucket_fe5a7c_idx'), models.Index(fields=['user', 'bucket'], name='core_traffi_user_id_632f42_idx'), models.Index(fields=['client_ip', 'bucket'], name='core_traffi_client__270042_idx')],
+            },
+        ),
+    ]
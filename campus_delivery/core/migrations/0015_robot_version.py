@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_trafficrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='robot',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
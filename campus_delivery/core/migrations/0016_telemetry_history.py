@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-17 23:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_robot_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1分钟'), ('1h', '1小时')], max_length=3)),
+                ('bucket', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('battery_min', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('battery_max', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('battery_avg', models.FloatField(blank=True, null=True)),
+                ('location', models.CharField(blank=True, default='', max_length=100)),
+                ('door_status', models.CharField(blank=True, default='', max_length=10)),
+                ('robot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_rollups', to='core.robot')),
+            ],
+            options={
+                'ordering': ['-bucket'],
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='core_teleme_resolut_7b4a4a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('robot', 'resolution', 'bucket'), name='uniq_telemetry_rollup_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TelemetrySample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('battery_level', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('location', models.CharField(blank=True, default='', max_length=100)),
+                ('door_status', models.CharField(blank=True, default='', max_length=10)),
+                ('robot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_samples', to='core.robot')),
+            ],
+            options={
+                'ordering': ['-recorded_at'],
+                'indexes': [models.Index(fields=['robot', 'recorded_at'], name='core_teleme_robot_i_808457_idx'), models.Index(fields=['recorded_at'], name='core_teleme_recorde_5b39c2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-17 23:27
+
+from django.db import migrations
+
+
+def clear_inline_qr_images(apps, schema_editor):
+    """二维码图片改为按需渲染，清除订单中保存的 base64 图片"""
+    DeliveryOrder = apps.get_model('core', 'DeliveryOrder')
+    DeliveryOrder.objects.filter(qr_code_url__startswith='data:').update(qr_code_url=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_telemetry_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_inline_qr_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-17 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_clear_inline_qr_images'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='systemlog',
+            name='core_system_log_typ_61d765_idx',
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='client_ip',
+            field=models.CharField(blank=True, default='', max_length=45),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='path',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='processing_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemlog',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['robot', 'log_type', 'timestamp'], name='core_syslog_robot_type_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['log_type', 'timestamp'], name='core_syslog_type_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['client_ip', 'timestamp'], name='core_syslog_ip_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['path', 'timestamp'], name='core_syslog_path_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['status_code', 'timestamp'], name='core_syslog_status_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['processing_time'], name='core_syslog_proc_time'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-17 23:40
+
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+NETWORK_LOG_TYPES = ['NETWORK_REQUEST', 'NETWORK_RESPONSE', 'NETWORK_ERROR', 'WEBSOCKET_CONNECTION']
+
+# "收到请求: GET /api/x/" / "响应完成: GET /api/x/ - 200 (0.012s)"
+MESSAGE_PATH = re.compile(r'^\S+:\s+[A-Z]+\s+(/\S*)')
+
+
+def _columns(log):
+    data = log.data if isinstance(log.data, dict) else {}
+    path = data.get('path') or ''
+    if not path:
+        match = MESSAGE_PATH.match(log.message or '')
+        path = match.group(1) if match else ''
+    status_code = data.get('status_code')
+    processing_time = data.get('processing_time')
+    return {
+        'client_ip': str(data.get('client_ip') or '')[:45],
+        'path': path[:255],
+        'status_code': status_code if isinstance(status_code, int) and 0 <= status_code < 65536 else None,
+        'processing_time': processing_time if isinstance(processing_time, (int, float)) else None,
+    }
+
+
+def backfill_columns(apps, schema_editor):
+    """把网络日志 data 中的 client_ip / path / status_code / processing_time 分批写入新列
+
+    按主键分批，每批单独提交，大表上不会长时间锁表。
+    """
+    SystemLog = apps.get_model('core', 'SystemLog')
+    fields = ['client_ip', 'path', 'status_code', 'processing_time']
+    queryset = SystemLog.objects.filter(log_type__in=NETWORK_LOG_TYPES).order_by('id').only('id', 'message', 'data')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        for log in batch:
+            for name, value in _columns(log).items():
+                setattr(log, name, value)
+        SystemLog.objects.bulk_update(batch, fields, batch_size=500)
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    # 每批独立提交
+    atomic = False
+
+    dependencies = [
+        ('core', '0018_systemlog_indexed_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_columns, migrations.RunPython.noop),
+    ]
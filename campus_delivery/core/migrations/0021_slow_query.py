@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 23:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_systemlog_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('fingerprint', models.CharField(max_length=16)),
+                ('sql', models.TextField()),
+                ('duration_ms', models.FloatField()),
+                ('route', models.CharField(blank=True, default='', max_length=200)),
+                ('method', models.CharField(blank=True, default='', max_length=10)),
+                ('many', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='core_slowqu_created_9b0f6b_idx'), models.Index(fields=['fingerprint', 'created_at'], name='core_slowqu_fingerp_b93b13_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-17 23:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_slow_query'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CpuProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('route', models.CharField(blank=True, default='', max_length=200)),
+                ('method', models.CharField(blank=True, default='', max_length=10)),
+                ('path', models.CharField(blank=True, default='', max_length=255)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('duration_ms', models.FloatField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('interval_ms', models.FloatField()),
+                ('file', models.CharField(max_length=255)),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='core_cpupro_created_2008ac_idx'), models.Index(fields=['route', 'created_at'], name='core_cpupro_route_c6c1f2_idx')],
+            },
+        ),
+    ]
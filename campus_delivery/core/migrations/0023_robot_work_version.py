@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_cpu_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='robot',
+            name='work_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_robot_work_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telemetryrollup',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='telemetrysample',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='telemetryrollup',
+            index=models.Index(fields=['resolution', 'rolled_up'], name='core_teleme_resolut_e129b5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='telemetrysample',
+            index=models.Index(fields=['rolled_up'], name='core_teleme_rolled__9463f1_idx'),
+        ),
+    ]
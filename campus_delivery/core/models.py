@@ -1,4 +1,3 @@
-import logging
 from django.db import models
 from django.utils import timezone
 
@@ -90,10 +89,27 @@ class Robot(models.Model):
     current_delivery_location = models.CharField(max_length=100, blank=True, null=True)  # 当前配送地点
     delivery_start_time = models.DateTimeField(null=True, blank=True)  # 配送开始时间
     qr_wait_start_time = models.DateTimeField(null=True, blank=True)  # 等待扫码开始时间
+    
+    # 变更计数：机器人、其订单或指令变化时递增，用于轮询接口的 ETag
+    version = models.PositiveBigIntegerField(default=0)
+    # 订单/指令变更计数：只在订单或指令变化时递增（遥测、心跳不影响），用于指令和当前订单的 ETag
+    work_version = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return f"{self.name} - {self.get_status_display()}"
     
+    def save(self, *args, **kwargs):
+        """保存时在数据库内原子递增 version"""
+        if not self._state.adding and self.pk is not None:
+            self.version = models.F('version') + 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'version'}
+        super().save(*args, **kwargs)
+        if isinstance(self.version, models.expressions.Combinable):
+            # 丢弃表达式，下次访问时从数据库重新读取
+            del self.__dict__['version']
+    
     def get_current_orders(self):
         """获取当前机器人的所有订单"""
         return DeliveryOrder.objects.filter(
@@ -105,19 +121,19 @@ class Robot(models.Model):
         """更新机器人位置"""
         self.current_location = location
         self.last_status_update = timezone.now()
-        self.save()
+        self.save(update_fields=['current_location', 'last_status_update'])
     
     def update_battery(self, level):
         """更新电池电量"""
         self.battery_level = max(0, min(100, level))
         self.last_status_update = timezone.now()
-        self.save()
+        self.save(update_fields=['battery_level', 'last_status_update'])
     
     def set_door_status(self, status):
         """设置门状态"""
         self.door_status = status
         self.last_status_update = timezone.now()
-        self.save()
+        self.save(update_fields=['door_status', 'last_status_update'])
 
 
 class RobotCommand(models.Model):
@@ -190,112 +206,61 @@ class SystemLog(models.Model):
     # 额外数据
     data = models.JSONField(default=dict, blank=True)  # 存储额外的JSON数据
     
+    # 网络日志的常用查询字段（由监控中间件填写，不再从 data 中按 JSON 路径查询）
+    client_ip = models.CharField(max_length=45, blank=True, default='')
+    path = models.CharField(max_length=255, blank=True, default='')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    processing_time = models.FloatField(null=True, blank=True)  # 秒
+    
     class Meta:
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['timestamp']),
             models.Index(fields=['level']),
-            models.Index(fields=['log_type']),
+            # 机器人事件（emergency_events / command_events）
+            models.Index(fields=['robot', 'log_type', 'timestamp'], name='core_syslog_robot_type_ts'),
+            # 按类型取最近的日志（网络监控 realtime / connections 等），同时覆盖只按 log_type 过滤
+            models.Index(fields=['log_type', 'timestamp'], name='core_syslog_type_ts'),
+            models.Index(fields=['client_ip', 'timestamp'], name='core_syslog_ip_ts'),
+            models.Index(fields=['path', 'timestamp'], name='core_syslog_path_ts'),
+            models.Index(fields=['status_code', 'timestamp'], name='core_syslog_status_ts'),
+            models.Index(fields=['processing_time'], name='core_syslog_proc_time'),
         ]
     
     def __str__(self):
         return f"[{self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}] {self.level} - {self.message[:50]}"
     
     @classmethod
-    def log_info(cls, message, log_type='SYSTEM', robot=None, order=None, user=None, data=None):
+    def emit(cls, level, message, log_type='SYSTEM', robot=None, order=None, user=None, data=None, **options):
+        """记录系统事件：按 log_type 路由到数据库 / 日志文件，高频类型批量延迟写库（见 core.events）"""
+        from .events import emit_event
+        return emit_event(cls, level, message, log_type, robot=robot, order=order, user=user, data=data, **options)
+    
+    @classmethod
+    def emit_many(cls, events, **options):
+        """批量记录系统事件（每条分别路由，写库部分一次 bulk_create）"""
+        from .events import emit_events
+        return emit_events(cls, events, **options)
+    
+    @classmethod
+    def log_info(cls, message, log_type='SYSTEM', **options):
         """记录信息日志"""
-        # 创建数据库记录
-        log_entry = cls.objects.create(
-            level='INFO',
-            log_type=log_type,
-            message=message,
-            robot=robot,
-            order=order,
-            user=user,
-            data=data or {}
-        )
-        
-        # 同时写入日志文件
-        logger = logging.getLogger('system_backend')
-        robot_info = f" (机器人: {robot.name})" if robot else ""
-        order_info = f" (订单: #{order.id})" if order else ""
-        user_info = f" (用户: {user.username})" if user else ""
-        log_message = f"[{log_type}] {message}{robot_info}{order_info}{user_info}"
-        logger.info(log_message)
-        
-        return log_entry
+        return cls.emit('INFO', message, log_type, **options)
     
     @classmethod
-    def log_warning(cls, message, log_type='SYSTEM', robot=None, order=None, user=None, data=None):
+    def log_warning(cls, message, log_type='SYSTEM', **options):
         """记录警告日志"""
-        # 创建数据库记录
-        log_entry = cls.objects.create(
-            level='WARNING',
-            log_type=log_type,
-            message=message,
-            robot=robot,
-            order=order,
-            user=user,
-            data=data or {}
-        )
-        
-        # 同时写入日志文件
-        logger = logging.getLogger('system_backend')
-        robot_info = f" (机器人: {robot.name})" if robot else ""
-        order_info = f" (订单: #{order.id})" if order else ""
-        user_info = f" (用户: {user.username})" if user else ""
-        log_message = f"[{log_type}] {message}{robot_info}{order_info}{user_info}"
-        logger.warning(log_message)
-        
-        return log_entry
+        return cls.emit('WARNING', message, log_type, **options)
     
     @classmethod
-    def log_error(cls, message, log_type='SYSTEM', robot=None, order=None, user=None, data=None):
+    def log_error(cls, message, log_type='SYSTEM', **options):
         """记录错误日志"""
-        # 创建数据库记录
-        log_entry = cls.objects.create(
-            level='ERROR',
-            log_type=log_type,
-            message=message,
-            robot=robot,
-            order=order,
-            user=user,
-            data=data or {}
-        )
-        
-        # 同时写入日志文件
-        logger = logging.getLogger('system_backend')
-        robot_info = f" (机器人: {robot.name})" if robot else ""
-        order_info = f" (订单: #{order.id})" if order else ""
-        user_info = f" (用户: {user.username})" if user else ""
-        log_message = f"[{log_type}] {message}{robot_info}{order_info}{user_info}"
-        logger.error(log_message)
-        
-        return log_entry
+        return cls.emit('ERROR', message, log_type, **options)
     
     @classmethod
-    def log_success(cls, message, log_type='SYSTEM', robot=None, order=None, user=None, data=None):
+    def log_success(cls, message, log_type='SYSTEM', **options):
         """记录成功日志"""
-        # 创建数据库记录
-        log_entry = cls.objects.create(
-            level='SUCCESS',
-            log_type=log_type,
-            message=message,
-            robot=robot,
-            order=order,
-            user=user,
-            data=data or {}
-        )
-        
-        # 同时写入日志文件
-        logger = logging.getLogger('system_backend')
-        robot_info = f" (机器人: {robot.name})" if robot else ""
-        order_info = f" (订单: #{order.id})" if order else ""
-        user_info = f" (用户: {user.username})" if user else ""
-        log_message = f"[{log_type}] {message}{robot_info}{order_info}{user_info}"
-        logger.info(log_message)  # 成功日志也使用INFO级别写入文件
-        
-        return log_entry
+        return cls.emit('SUCCESS', message, log_type, **options)
 
 
 class Message(models.Model):
@@ -308,3 +273,145 @@ class Message(models.Model):
         return f"{self.name} ({self.email})"
 
 
+
+
+class TrafficRollup(models.Model):
+    """网络流量分钟级汇总 - 由中间件增量维护，监控页面直接读取"""
+    bucket = models.DateTimeField()  # 分钟起点
+    route = models.CharField(max_length=200)  # URL 名称（如 robots-get-commands）
+    method = models.CharField(max_length=10)
+    status_class = models.CharField(max_length=3)  # 2xx / 3xx / 4xx / 5xx
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    client_ip = models.CharField(max_length=45, blank=True, default='')
+
+    request_count = models.PositiveIntegerField(default=0)
+    latency_sum = models.FloatField(default=0)  # 秒
+    latency_max = models.FloatField(default=0)  # 秒
+
+    class Meta:
+        ordering = ['-bucket']
+        indexes = [
+            models.Index(fields=['bucket']),
+            models.Index(fields=['user', 'bucket']),
+            models.Index(fields=['client_ip', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"[{self.bucket.strftime('%Y-%m-%d %H:%M')}] {self.method} {self.route} {self.status_class} x{self.request_count}"
+
+
+class TelemetrySample(models.Model):
+    """机器人遥测原始采样 - 只追加，由日志写入器批量插入，按保留期清理"""
+    robot = models.ForeignKey(Robot, on_delete=models.CASCADE, related_name='telemetry_samples')
+    recorded_at = models.DateTimeField()  # 机器人采样时间
+    battery_level = models.PositiveSmallIntegerField(null=True, blank=True)
+    location = models.CharField(max_length=100, blank=True, default='')
+    door_status = models.CharField(max_length=10, blank=True, default='')
+    rolled_up = models.BooleanField(default=False)  # 是否已计入 1 分钟汇总
+
+    class Meta:
+        ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['robot', 'recorded_at']),
+            models.Index(fields=['recorded_at']),
+            models.Index(fields=['rolled_up']),
+        ]
+
+    def __str__(self):
+        return f"[{self.recorded_at.strftime('%Y-%m-%d %H:%M:%S')}] 机器人 #{self.robot_id} 电量={self.battery_level}"
+
+
+class TelemetryRollup(models.Model):
+    """遥测降采样汇总 - 由清理任务从原始采样（1分钟）和分钟汇总（1小时）重算"""
+    RESOLUTION_CHOICES = [
+        ('1m', '1分钟'),
+        ('1h', '1小时'),
+    ]
+
+    robot = models.ForeignKey(Robot, on_delete=models.CASCADE, related_name='telemetry_rollups')
+    resolution = models.CharField(max_length=3, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()  # 时间桶起点
+    sample_count = models.PositiveIntegerField(default=0)
+    battery_min = models.PositiveSmallIntegerField(null=True, blank=True)
+    battery_max = models.PositiveSmallIntegerField(null=True, blank=True)
+    battery_avg = models.FloatField(null=True, blank=True)
+    location = models.CharField(max_length=100, blank=True, default='')  # 桶内最后位置
+    door_status = models.CharField(max_length=10, blank=True, default='')  # 桶内最后门状态
+    rolled_up = models.BooleanField(default=False)  # 1 分钟汇总是否已计入 1 小时汇总
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['robot', 'resolution', 'bucket'], name='uniq_telemetry_rollup_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket']),
+            models.Index(fields=['resolution', 'rolled_up']),
+        ]
+
+    def __str__(self):
+        return f"[{self.bucket.strftime('%Y-%m-%d %H:%M')}] 机器人 #{self.robot_id} {self.resolution} x{self.sample_count}"
+
+
+class SystemLogArchive(models.Model):
+    """系统日志归档清单 - 每天一个 gzip NDJSON 文件，对应的日志行已从 SystemLog 删除"""
+    day = models.DateField(unique=True)
+    path = models.CharField(max_length=255)  # 相对 LOG_ARCHIVE['DIR'] 的文件名
+    row_count = models.PositiveIntegerField(default=0)
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64)
+    first_id = models.BigIntegerField(null=True, blank=True)
+    last_id = models.BigIntegerField(null=True, blank=True)
+    purged = models.BooleanField(default=False)  # 数据库中的行是否已全部删除
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"{self.day} - {self.row_count} 条日志 ({self.path})"
+
+
+class SlowQuery(models.Model):
+    """慢 SQL - 由 SQL 分析中间件在语句耗时超过阈值时经日志写入器批量写入"""
+    created_at = models.DateTimeField(default=timezone.now)
+    fingerprint = models.CharField(max_length=16)  # 参数替换为 ? 之后的语句哈希
+    sql = models.TextField()  # 原始语句（截断）
+    duration_ms = models.FloatField()
+    route = models.CharField(max_length=200, blank=True, default='')  # URL 名称
+    method = models.CharField(max_length=10, blank=True, default='')
+    many = models.BooleanField(default=False)  # executemany
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['fingerprint', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"[{self.created_at.strftime('%Y-%m-%d %H:%M:%S')}] {self.duration_ms:.1f}ms {self.sql[:50]}"
+
+
+class CpuProfile(models.Model):
+    """CPU 采样记录 - 一次被采样请求的折叠栈文件（CPU_PROFILER['DIR'] 下），可渲染为火焰图"""
+    created_at = models.DateTimeField(default=timezone.now)
+    route = models.CharField(max_length=200, blank=True, default='')  # URL 名称
+    method = models.CharField(max_length=10, blank=True, default='')
+    path = models.CharField(max_length=255, blank=True, default='')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    duration_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField(default=0)
+    interval_ms = models.FloatField()
+    file = models.CharField(max_length=255)  # 相对 CPU_PROFILER['DIR'] 的文件名
+    size_bytes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['route', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"[{self.created_at.strftime('%Y-%m-%d %H:%M:%S')}] {self.method} {self.route} - {self.sample_count} 个样本"
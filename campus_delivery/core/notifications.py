@@ -0,0 +1,94 @@
+"""
+机器人变更通知
+
+长轮询请求在这里等待，而不是循环查询数据库：
+- 同一进程内用条件变量立即唤醒
+- 跨进程（多个 gunicorn/uvicorn 工作进程）通过共享目录中每个机器人一个
+  标记文件的 mtime 传递，等待方以短间隔检查文件时间戳
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_NOTIFY_DIR = '/tmp/campus_delivery_notify'
+
+# 跨进程检查标记文件的间隔（秒）
+CROSS_PROCESS_CHECK_INTERVAL = 0.2
+
+
+class RobotNotifier:
+    """按机器人划分的单一主题通知"""
+
+    def __init__(self, topic):
+        self.topic = topic
+        self._cond = threading.Condition()
+        self._versions = {}
+        self._listeners = []
+
+    def _marker_path(self, robot_id):
+        directory = getattr(settings, 'ROBOT_NOTIFY_DIR', DEFAULT_NOTIFY_DIR)
+        return os.path.join(directory, f"{self.topic}-robot-{robot_id}")
+
+    def add_listener(self, listener):
+        """注册进程内监听函数 listener(robot_id)，如 WebSocket 连接表"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def marker_version(self, robot_id):
+        """跨进程通知版本（标记文件 mtime），不存在时为 0"""
+        return self._marker_mtime(robot_id)
+
+    def _marker_mtime(self, robot_id):
+        try:
+            return os.stat(self._marker_path(robot_id)).st_mtime_ns
+        except OSError:
+            return 0
+
+    def token(self, robot_id):
+        """在查询数据库之前获取当前版本，避免查询与等待之间的通知丢失"""
+        with self._cond:
+            local = self._versions.get(robot_id, 0)
+        return local, self._marker_mtime(robot_id)
+
+    def notify(self, robot_id):
+        """唤醒等待该机器人的所有请求"""
+        with self._cond:
+            self._versions[robot_id] = self._versions.get(robot_id, 0) + 1
+            self._cond.notify_all()
+        for listener in list(self._listeners):
+            listener(robot_id)
+
+        path = self._marker_path(robot_id)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a'):
+                pass
+            # 保证时间戳单调递增，连续两次通知不会落在同一纳秒
+            now = max(time.time_ns(), self._marker_mtime(robot_id) + 1)
+            os.utime(path, ns=(now, now))
+        except OSError:
+            pass
+
+    def wait(self, robot_id, token, timeout):
+        """等待 token 之后的新通知，返回是否被唤醒"""
+        local_version, marker_mtime = token
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if self._versions.get(robot_id, 0) != local_version:
+                    return True
+            if self._marker_mtime(robot_id) != marker_mtime:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            with self._cond:
+                if self._versions.get(robot_id, 0) != local_version:
+                    return True
+                self._cond.wait(min(remaining, CROSS_PROCESS_CHECK_INTERVAL))
+
+
+# 新指令创建时通知对应机器人（长轮询请求与 WebSocket 连接）
+command_notifier = RobotNotifier('commands')
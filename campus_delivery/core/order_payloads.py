@@ -0,0 +1,66 @@
+"""
+下发给机器人的订单数据
+
+current_orders、receive_orders 与配送员更新订单状态（DispatchOrderViewSet.partial_update）
+返回同一种订单结构，统一在这里构建：
+- order_payload_queryset 为订单查询加上 select_related('student')，并跳过旧的二维码图片列，
+  无论订单数量多少，构建数据都不会再逐条查询学生
+- 调用方先把查询结果 list() 一次，再交给 order_payload / delivery_route，避免重复求值
+"""
+from .qr import qr_image_url
+
+
+def order_payload_queryset(queryset):
+    return queryset.select_related('student').defer('qr_code_url')
+
+
+def order_payload(order, request=None, **extra):
+    """单个订单的完整信息"""
+    student = order.student
+    payload = {
+        "order_id": order.id,
+        "status": order.status,
+        "student": {
+            "id": student.id,
+            "name": student.username,
+            "email": student.email,
+            "first_name": student.first_name,
+            "last_name": student.last_name,
+        },
+        "package_info": {
+            "type": order.package_type,
+            "weight": order.weight,
+            "fragile": order.fragile,
+            "description": order.description,
+        },
+        "pickup_location": {
+            "building": order.pickup_building,
+            "instructions": order.pickup_instructions,
+        },
+        "delivery_location": {
+            "building": order.delivery_building,
+            "room": order.delivery_room,
+        },
+        "qr_code_data": {
+            "payload": order.qr_payload_data,
+            "signature": order.qr_signature,
+            "qr_image_url": qr_image_url(order, request),
+        },
+        "delivery_priority": "normal",
+        "estimated_time": "15分钟",
+    }
+    payload.update(extra)
+    return payload
+
+
+def delivery_route(orders):
+    """按订单顺序生成配送路线"""
+    return [
+        {
+            "sequence": i,
+            "order_id": order.id,
+            "location": f"{order.delivery_building}-{order.delivery_room or '指定地点'}",
+            "estimated_arrival": "10:30"  # 这里可以根据实际路线计算
+        }
+        for i, order in enumerate(orders, 1)
+    ]
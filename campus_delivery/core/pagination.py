@@ -0,0 +1,176 @@
+"""
+游标（keyset）分页
+
+列表按 (时间, id) 等唯一排序键排序，下一页用 "排序键 < 上一页最后一行" 的条件定位，
+而不是 OFFSET：翻到多深的页面，数据库都只读取一页的行。
+
+    GET /api/logs/?page_size=100
+    -> {"next": ".../api/logs/?cursor=...", "previous": null, "results": [...]}
+
+游标用 django.core.signing 签名编码，对客户端不透明且不可伪造；
+page_size 限制在 1..max_page_size 之间。
+"""
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+_CURSOR_SALT = 'core.pagination'
+
+
+class KeysetPagination(BasePagination):
+    """按 ordering 中的字段做游标分页，最后一个字段必须唯一（通常是 id）
+
+    视图可以用 cursor_ordering 属性覆盖排序。
+    视图定义 keyset_extra_rows(ordering, position, limit) 时，数据库中的行不足一页（或向前翻页）时
+    用它补充数据库以外的行（如归档日志），返回按 ordering 排好的对象，各字段方向须一致。
+    """
+    ordering = ('-id',)
+    page_size = None          # 默认取 REST_FRAMEWORK['PAGE_SIZE']
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = '无效的分页游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(getattr(view, 'cursor_ordering', self.ordering))
+        self.page_size = self.get_page_size(request)
+
+        position, reverse = self.decode_cursor(request)
+        ordering = self._reversed(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+
+        rows = list(queryset[:self.page_size + 1])
+        extra_rows = getattr(view, 'keyset_extra_rows', None)
+        if extra_rows is not None and (reverse or len(rows) <= self.page_size):
+            extra = extra_rows(ordering, position, self.page_size + 1)
+            if extra:
+                rows = sorted(rows + list(extra), key=self._sort_key, reverse=ordering[0].startswith('-'))
+                rows = rows[:self.page_size + 1]
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.first_position = self._position(rows[0]) if rows else None
+        self.last_position = self._position(rows[-1]) if rows else None
+        if not rows and position is not None:
+            # 空页：保留原位置，使 previous/next 仍然可用
+            self.first_position = self.last_position = position
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        default = self.page_size or getattr(settings, 'REST_FRAMEWORK', {}).get('PAGE_SIZE') or 50
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            size = default
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self._link(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self._link(self.first_position, reverse=True)
+
+    # ------------------------------------------------------------------
+    # 游标编码
+    # ------------------------------------------------------------------
+    def encode_cursor(self, position, reverse):
+        return signing.dumps(
+            {'p': position, 'r': int(reverse)},
+            salt=_CURSOR_SALT,
+            compress=True,
+        )
+
+    def decode_cursor(self, request):
+        """返回 (位置, 是否向前翻页)；没有游标时位置为 None"""
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            data = signing.loads(token, salt=_CURSOR_SALT)
+            position = data['p']
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError(position)
+            return position, bool(data.get('r'))
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _link(self, position, reverse):
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    # ------------------------------------------------------------------
+    # 排序键
+    # ------------------------------------------------------------------
+    def _sort_key(self, row):
+        return tuple(getattr(row, name.lstrip('-')) for name in self.ordering)
+
+    def _position(self, row):
+        return [_to_json(getattr(row, name.lstrip('-'))) for name in self.ordering]
+
+    @staticmethod
+    def _reversed(ordering):
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+    @staticmethod
+    def _after(ordering, position):
+        """按字典序排在 position 之后的行: (a > x) or (a = x and b > y) ..."""
+        condition = Q()
+        equal = {}
+        for name, value in zip(ordering, position):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+
+def _to_json(value):
+    """排序键的值转为可编码的形式（时间转为 ISO 字符串，数据库比较时会自动解析）"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class TimestampKeysetPagination(KeysetPagination):
+    """SystemLog 等按 timestamp 倒序的列表"""
+    ordering = ('-timestamp', '-id')
+
+
+class CreatedAtKeysetPagination(KeysetPagination):
+    """订单、留言等按 created_at 倒序的列表"""
+    ordering = ('-created_at', '-id')
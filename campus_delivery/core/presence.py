@@ -0,0 +1,219 @@
+"""
+机器人在线状态（presence）
+
+心跳、指令轮询、状态上报都只是"机器人还活着"的信号，不必每次都写 Robot 行和 SystemLog：
+- 最近一次存活时间记录在共享目录中每个机器人一个 <id>.seen 文件的 mtime，
+  所有工作进程可见，写入只是一次 utime
+- last_status_update 每个机器人最多每 FLUSH_INTERVAL 秒写一次库
+  （进程内先节流，UPDATE 再带时间条件，多进程同时到期也只有一个生效）
+- <id>.online 标记文件表示当前在线：首次创建成功的进程记录"上线"日志，
+  清理任务 presence_offline 删除超时机器人的标记并记录"离线"日志，
+  因此 SystemLog 只记录上线/离线跳变
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+
+logger = logging.getLogger('system_backend')
+
+DEFAULT_PRESENCE_CONFIG = {
+    'DIR': '/tmp/campus_delivery_presence',
+    'FLUSH_INTERVAL': 60,   # last_status_update 每个机器人最多多久写一次库（秒）
+    'OFFLINE_AFTER': 90,    # 超过该秒数没有存活信号视为离线
+}
+
+
+def get_presence_config():
+    config = dict(DEFAULT_PRESENCE_CONFIG)
+    config.update(getattr(settings, 'ROBOT_PRESENCE', {}))
+    return config
+
+
+def _to_datetime(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+class PresenceTable:
+    """基于共享目录的在线状态表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_flushed = {}  # robot_id -> 本进程最近一次写库时间（epoch 秒）
+
+    def _path(self, robot_id, suffix):
+        return os.path.join(get_presence_config()['DIR'], f"{robot_id}.{suffix}")
+
+    def touch(self, robot_id, persisted=False, now=None):
+        """记录一次存活信号，返回是否为上线跳变
+
+        persisted=True 表示调用方已经写过 last_status_update（如状态上报），这里只更新节流时间。
+        """
+        config = get_presence_config()
+        now = now or time.time()
+        self._write_seen(robot_id, now)
+        came_online = self._mark_online(robot_id)
+
+        with self._lock:
+            last_flushed = self._last_flushed.get(robot_id, 0)
+            due = now - last_flushed >= config['FLUSH_INTERVAL']
+            if persisted or came_online or due:
+                self._last_flushed[robot_id] = now
+
+        if came_online:
+            if not persisted:
+                self._flush(robot_id, now)
+            self._log_online(robot_id)
+        elif due and not persisted:
+            self._flush(robot_id, now, min_age=config['FLUSH_INTERVAL'])
+        return came_online
+
+    def last_seen(self, robot_id):
+        """最近一次存活时间，未知时为 None"""
+        try:
+            return _to_datetime(os.stat(self._path(robot_id, 'seen')).st_mtime)
+        except OSError:
+            return None
+
+    def snapshot(self):
+        """所有已知机器人的最近存活时间: {robot_id: epoch 秒}"""
+        directory = get_presence_config()['DIR']
+        seen = {}
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return seen
+        for entry in entries:
+            name, _, suffix = entry.name.partition('.')
+            if suffix != 'seen' or not name.isdigit():
+                continue
+            try:
+                seen[int(name)] = entry.stat().st_mtime
+            except OSError:
+                continue
+        return seen
+
+    def online(self, now=None):
+        """当前在线的机器人: {robot_id: 最近存活时间}"""
+        now = now or time.time()
+        cutoff = now - get_presence_config()['OFFLINE_AFTER']
+        return {
+            robot_id: _to_datetime(seen_at)
+            for robot_id, seen_at in self.snapshot().items()
+            if seen_at >= cutoff
+        }
+
+    def is_online(self, robot_id, now=None):
+        last_seen = self.last_seen(robot_id)
+        if last_seen is None:
+            return False
+        now = now or time.time()
+        return now - last_seen.timestamp() < get_presence_config()['OFFLINE_AFTER']
+
+    def sweep_offline(self, now=None):
+        """把超时的在线机器人标记为离线，返回离线的机器人ID列表
+
+        last_status_update 写为真实的最后存活时间，离线日志一次批量插入。
+        """
+        from .models import Robot, SystemLog
+
+        now = now or time.time()
+        cutoff = now - get_presence_config()['OFFLINE_AFTER']
+        seen = self.snapshot()
+        directory = get_presence_config()['DIR']
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return []
+
+        offline = {}
+        for entry in entries:
+            name, _, suffix = entry.name.partition('.')
+            if suffix != 'online' or not name.isdigit():
+                continue
+            robot_id = int(name)
+            seen_at = seen.get(robot_id)
+            if seen_at is not None and seen_at >= cutoff:
+                continue
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                continue  # 其他进程已处理
+            offline[robot_id] = seen_at
+
+        if not offline:
+            return []
+        with self._lock:
+            for robot_id in offline:
+                self._last_flushed.pop(robot_id, None)
+
+        known = {robot_id: seen_at for robot_id, seen_at in offline.items() if seen_at is not None}
+        if known:
+            Robot.objects.filter(id__in=known).update(
+                last_status_update=Case(
+                    *[When(id=robot_id, then=Value(_to_datetime(seen_at))) for robot_id, seen_at in known.items()]
+                ),
+                version=F('version') + 1
+            )
+        names = dict(Robot.objects.filter(id__in=offline).values_list('id', 'name'))
+        SystemLog.emit_many([
+            {
+                'level': 'WARNING',
+                'log_type': 'ROBOT_CONTROL',
+                'message': f"机器人 {names[robot_id]} 离线",
+                'robot_id': robot_id,
+                'data': {'last_seen': _to_datetime(seen_at).isoformat() if seen_at else None},
+            }
+            for robot_id, seen_at in offline.items()
+            if robot_id in names
+        ])
+        logger.warning(f"📴 机器人离线: {sorted(offline)}")
+        return sorted(offline)
+
+    def _write_seen(self, robot_id, now):
+        path = self._path(robot_id, 'seen')
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'a'):
+                    pass
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+        except OSError:
+            pass
+
+    def _mark_online(self, robot_id):
+        """创建在线标记，只有创建成功的调用返回 True"""
+        try:
+            fd = os.open(self._path(robot_id, 'online'), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:  # FileExistsError: 已在线
+            return False
+        os.close(fd)
+        return True
+
+    def _flush(self, robot_id, now, min_age=None):
+        """写入 last_status_update；min_age 不为空时只在数据库中的时间足够旧时写入"""
+        from .models import Robot
+
+        seen_at = _to_datetime(now)
+        rows = Robot.objects.filter(id=robot_id)
+        if min_age is not None:
+            rows = rows.filter(last_status_update__lt=_to_datetime(now - min_age))
+        rows.update(last_status_update=seen_at, version=F('version') + 1)
+
+    def _log_online(self, robot_id):
+        from .models import Robot, SystemLog
+
+        robot = Robot.objects.filter(id=robot_id).only('id', 'name').first()
+        if robot is not None:
+            SystemLog.log_info(f"机器人 {robot.name} 上线", log_type='ROBOT_CONTROL', robot=robot)
+
+
+presence = PresenceTable()
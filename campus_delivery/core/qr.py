@@ -0,0 +1,123 @@
+"""
+订单二维码图片
+
+订单只保存二维码内容（qr_payload_data），图片在请求 /api/orders/<id>/qr.png（或 qr.svg）时按需渲染：
+- 渲染结果放在进程内有界 LRU 缓存中，键为 (内容哈希, 格式)
+- 响应带强 ETag 与 Cache-Control，浏览器重复打开时直接 304 或命中本地缓存
+- <img> 无法携带 JWT，地址中附带基于 SECRET_KEY 的签名 sig；签名绑定订单ID与内容哈希，
+  二维码内容变化后旧地址自动失效
+订单接口只返回图片地址，不再返回 base64 图片。
+"""
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+DEFAULT_QR_IMAGE_CONFIG = {
+    'CACHE_SIZE': 256,     # 缓存的渲染结果数量
+    'MAX_AGE': 86400,      # Cache-Control max-age（秒）
+    'BOX_SIZE': 15,        # PNG 每个格子的像素
+    'BORDER': 8,           # 边框格子数
+}
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def get_qr_image_config():
+    config = dict(DEFAULT_QR_IMAGE_CONFIG)
+    config.update(getattr(settings, 'QR_IMAGE', {}))
+    return config
+
+
+def payload_hash(payload):
+    return hashlib.sha256((payload or '').encode()).hexdigest()[:32]
+
+
+def qr_image_signature(order_id, payload):
+    return salted_hmac('core.qr', f"{order_id}:{payload_hash(payload)}").hexdigest()[:32]
+
+
+def verify_qr_image_signature(order_id, payload, signature):
+    return bool(signature) and constant_time_compare(qr_image_signature(order_id, payload), signature)
+
+
+def qr_image_url(order, request=None, fmt='png'):
+    """订单二维码图片地址，传入 request 时返回绝对地址；订单没有二维码内容时返回 None"""
+    if not order.qr_payload_data:
+        return None
+    path = f"/api/orders/{order.id}/qr.{fmt}?sig={qr_image_signature(order.id, order.qr_payload_data)}"
+    return request.build_absolute_uri(path) if request is not None else path
+
+
+def qr_etag(payload, fmt):
+    return f'"qr-{payload_hash(payload)}-{fmt}"'
+
+
+def _render(payload, fmt):
+    import qrcode
+
+    config = get_qr_image_config()
+    qr = qrcode.QRCode(
+        version=1,           # 使用最小版本
+        error_correction=qrcode.constants.ERROR_CORRECT_L,  # 低纠错级别，格子更大更易扫描
+        box_size=config['BOX_SIZE'],
+        border=config['BORDER']
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if fmt == 'svg':
+        import qrcode.image.svg
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRImageCache:
+    """按 (内容哈希, 格式) 缓存渲染结果的 LRU"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, payload, fmt):
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(fmt)
+        key = (payload_hash(payload), fmt)
+        with self._lock:
+            image = self._items.get(key)
+            if image is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        # 渲染放在锁外，同一内容并发渲染的代价只是重复计算一次
+        image = _render(payload, fmt)
+        with self._lock:
+            self._items[key] = image
+            self._items.move_to_end(key)
+            while len(self._items) > get_qr_image_config()['CACHE_SIZE']:
+                self._items.popitem(last=False)
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+qr_images = QRImageCache()
+
+
+def render_qr_png(payload):
+    return qr_images.get(payload, 'png')
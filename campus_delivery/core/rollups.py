@@ -0,0 +1,122 @@
+"""
+网络流量分钟级汇总
+
+中间件在每个请求结束时调用 traffic_rollups.record()，只在内存中累加；
+日志写入器线程周期性地把累加结果合并进 TrafficRollup 表。
+监控接口读取汇总表，成本与分钟桶数量相关，而不是日志行数。
+
+- WebSocket 连接建立也计入汇总（method='WS'），统计不再扫描 SystemLog
+- 清理任务 traffic_rollup_retention 删除超过 RETENTION_DAYS 的桶
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .log_sink import log_sink
+
+logger = logging.getLogger('system_backend')
+
+DEFAULT_TRAFFIC_ROLLUP_CONFIG = {
+    'RETENTION_DAYS': 7,           # 汇总桶保留天数（流量曲线最多查询 7 天）
+    'STATS_WINDOW_HOURS': 24,      # 监控页统计数字的时间窗口
+    'ACTIVE_WINDOW_SECONDS': 60,   # 活跃连接：最近多少秒内有请求
+}
+
+# WebSocket 连接在汇总表中的 method
+WEBSOCKET_METHOD = 'WS'
+
+
+def get_traffic_rollup_config():
+    config = dict(DEFAULT_TRAFFIC_ROLLUP_CONFIG)
+    config.update(getattr(settings, 'TRAFFIC_ROLLUP', {}))
+    return config
+
+
+def minute_bucket(when=None):
+    """把时间截断到分钟"""
+    when = when or timezone.now()
+    return when.replace(second=0, microsecond=0)
+
+
+def status_class(status_code):
+    return f"{int(status_code) // 100}xx"
+
+
+class TrafficRollupAggregator:
+    """进程内累加器，按 (分钟, 路由, 方法, 状态类别, 用户, IP) 聚合"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def record(self, route, method, status_code, user_id, client_ip, latency, when=None):
+        key = (
+            minute_bucket(when),
+            route[:200],
+            method,
+            status_class(status_code),
+            user_id,
+            (client_ip or '')[:45],
+        )
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [1, latency, latency]
+            else:
+                entry[0] += 1
+                entry[1] += latency
+                if latency > entry[2]:
+                    entry[2] = latency
+
+    def flush(self):
+        """把累加结果合并进数据库，返回写入的桶数"""
+        from .models import TrafficRollup
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        for (bucket, route, method, status, user_id, client_ip), (count, latency_sum, latency_max) in pending.items():
+            lookup = {
+                'bucket': bucket,
+                'route': route,
+                'method': method,
+                'status_class': status,
+                'user_id': user_id,
+                'client_ip': client_ip,
+            }
+            try:
+                # 多个工作进程可能各自写入同一个桶，查询时统一 Sum 即可
+                updated = TrafficRollup.objects.filter(**lookup).update(
+                    request_count=F('request_count') + count,
+                    latency_sum=F('latency_sum') + latency_sum,
+                    latency_max=Greatest(F('latency_max'), latency_max),
+                )
+                if not updated:
+                    TrafficRollup.objects.create(
+                        request_count=count,
+                        latency_sum=latency_sum,
+                        latency_max=latency_max,
+                        **lookup
+                    )
+            except Exception as e:
+                logger.error(f"写入流量汇总失败: {e}")
+        return len(pending)
+
+
+def purge_traffic_rollups(now=None):
+    """删除超过保留期的汇总桶，返回删除行数"""
+    from .models import TrafficRollup
+
+    cutoff = (now or timezone.now()) - timedelta(days=get_traffic_rollup_config()['RETENTION_DAYS'])
+    return TrafficRollup.objects.filter(bucket__lt=cutoff).delete()[0]
+
+
+traffic_rollups = TrafficRollupAggregator()
+log_sink.add_flush_hook(traffic_rollups.flush)
@@ -1,7 +1,9 @@
 # core/serializers.py
 
 from rest_framework import serializers
-from .models import User, DeliveryOrder, Robot, Message
+from .models import User, DeliveryOrder, Robot, Message, SystemLog, SlowQuery, CpuProfile
+from .qr import qr_image_url
+from .fieldsets import SparseFieldsetsMixin
 from django.contrib.auth import get_user_model
 from datetime import date, datetime
 from django.utils import timezone
@@ -45,15 +47,19 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 
-class DeliveryOrderSerializer(serializers.ModelSerializer):
+class DeliveryOrderSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.username', read_only=True)
     student_email = serializers.CharField(source='student.email', read_only=True)
     robot_name = serializers.CharField(source='robot.name', read_only=True)
+    # 二维码图片按需渲染，只返回地址
+    qr_code_url = serializers.SerializerMethodField()
     
     class Meta:
         model = DeliveryOrder
         fields = '__all__'
         read_only_fields = ['student', 'teacher', 'status', 'created_at', 'qr_code_url', 'qr_payload_data', 'qr_signature']
+        # 输出时计算的字段依赖的模型字段（供 ?fields= 裁剪查询）
+        field_dependencies = {'qr_code_url': ['qr_payload_data']}
 
     def validate(self, data):
         """
@@ -79,14 +85,19 @@ class DeliveryOrderSerializer(serializers.ModelSerializer):
         自定义输出格式：fragile 显示为 是/否
         """
         rep = super().to_representation(instance)
-        rep['fragile'] = "是" if instance.fragile else "否"
+        if 'fragile' in rep:
+            rep['fragile'] = "是" if instance.fragile else "否"
         return rep
 
+    def get_qr_code_url(self, instance):
+        return qr_image_url(instance, self.context.get('request'))
 
-class RobotSerializer(serializers.ModelSerializer):
+
+class RobotSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Robot
         fields = '__all__'
+        read_only_fields = ['version']
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -96,3 +107,29 @@ class MessageSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+
+
+class SystemLogSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True, default=None)
+
+    class Meta:
+        model = SystemLog
+        fields = [
+            'id', 'timestamp', 'level', 'log_type', 'message', 'robot', 'order', 'user', 'username',
+            'client_ip', 'path', 'status_code', 'processing_time', 'data',
+        ]
+
+
+class SlowQuerySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SlowQuery
+        fields = ['id', 'created_at', 'fingerprint', 'sql', 'duration_ms', 'route', 'method', 'many']
+
+
+class CpuProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CpuProfile
+        fields = [
+            'id', 'created_at', 'route', 'method', 'path', 'status_code',
+            'duration_ms', 'sample_count', 'interval_ms', 'size_bytes',
+        ]
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_init
+from django.dispatch import receiver
+
+from .models import DeliveryOrder, RobotCommand
+from .notifications import command_notifier
+from .versioning import bump_robot_versions
+
+
+@receiver(post_save, sender=RobotCommand)
+def notify_robot_on_new_command(sender, instance, created, **kwargs):
+    """新指令提交后唤醒该机器人的长轮询请求和 WebSocket 连接
+
+    紧急开门指令创建时已是 COMPLETED，但仍需要推送给在线的机器人执行
+    """
+    if created and (instance.status == 'PENDING' or instance.command == 'emergency_open_door'):
+        robot_id = instance.robot_id
+        transaction.on_commit(lambda: command_notifier.notify(robot_id))
+
+
+@receiver(post_save, sender=RobotCommand)
+def bump_version_on_command_change(sender, instance, **kwargs):
+    """指令变化使机器人的 ETag 失效（指令的批量删除只涉及已结束的指令，不影响轮询结果）"""
+    bump_robot_versions(instance.robot_id)
+
+
+@receiver(post_init, sender=DeliveryOrder)
+def remember_order_robot(sender, instance, **kwargs):
+    # 记录加载时的机器人，订单改派时新旧机器人都需要失效
+    instance._loaded_robot_id = instance.__dict__.get('robot_id')
+
+
+@receiver(post_save, sender=DeliveryOrder)
+def bump_version_on_order_change(sender, instance, **kwargs):
+    bump_robot_versions(instance.robot_id, getattr(instance, '_loaded_robot_id', None))
+    instance._loaded_robot_id = instance.robot_id
+
+
+@receiver(post_delete, sender=DeliveryOrder)
+def bump_version_on_order_delete(sender, instance, **kwargs):
+    bump_robot_versions(instance.robot_id)
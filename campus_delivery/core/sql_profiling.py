@@ -0,0 +1,171 @@
+"""
+按请求的 SQL 分析（默认关闭，SQL_PROFILING['ENABLED'] 打开）
+
+SQLProfilingMiddleware 在请求期间通过 connection.execute_wrapper 包装所有数据库连接：
+- 统计语句数、数据库总耗时和最慢的 TOP_N 条语句
+- 响应头 Server-Timing: db;dur=12.3;desc="8 queries"（浏览器开发者工具可直接查看）
+- 指标 db_queries_per_request / db_time_seconds（按视图）写入 metrics_registry
+- 超过 SLOW_QUERY_MS 的语句经日志写入器批量写入 SlowQuery，
+  /api/slow-queries/top/ 按指纹（参数替换为 ? 之后的语句）汇总
+
+流式响应在返回后才执行的查询不计入。
+"""
+import hashlib
+import heapq
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+DEFAULT_SQL_PROFILING_CONFIG = {
+    'ENABLED': False,
+    'SLOW_QUERY_MS': 100,          # 超过该耗时的语句写入 SlowQuery
+    'MAX_SLOW_PER_REQUEST': 10,    # 单个请求最多记录的慢语句
+    'TOP_N': 3,                    # Server-Timing 中列出的最慢语句数
+    'SERVER_TIMING': True,
+    'MAX_SQL_LENGTH': 4000,        # 写入 SlowQuery 的语句截断长度
+    'RETENTION_DAYS': 7,
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUES_LIST = re.compile(r'(\(\?(?:, \?)*\))(?:, \1)+')
+_SPACES = re.compile(r'\s+')
+
+
+def get_sql_profiling_config():
+    config = dict(DEFAULT_SQL_PROFILING_CONFIG)
+    config.update(getattr(settings, 'SQL_PROFILING', {}))
+    return config
+
+
+def normalize_sql(sql):
+    """参数与字面量替换为 ?，IN (...) 与多行 VALUES 折叠，用于按语句形状归类"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _SPACES.sub(' ', sql).strip()
+    sql = _VALUES_LIST.sub(r'\1, ...', sql)
+    return _IN_LIST.sub('(...)', sql)
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize_sql(sql).encode()).hexdigest()[:16]
+
+
+class QueryProfile:
+    """一次请求内的 SQL 统计；实例本身就是 execute_wrapper"""
+
+    def __init__(self, top_n=3, keep=10):
+        self.top_n = top_n
+        self.keep = max(top_n, keep)   # 保留的最慢语句数
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest = []   # 最小堆 (耗时, 序号, sql, many)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.perf_counter() - start, many)
+
+    def record(self, sql, duration, many=False):
+        self.count += 1
+        self.total_time += duration
+        item = (duration, self.count, sql, many)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, item)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def top(self, n=None):
+        """耗时从高到低的 [(耗时秒, sql, many)]"""
+        items = sorted(self.slowest, reverse=True)
+        return [(duration, sql, many) for duration, _, sql, many in items[:n or len(items)]]
+
+    def server_timing(self):
+        parts = [f'db;dur={self.total_time * 1000:.1f};desc="{self.count} queries"']
+        for index, (duration, sql, _) in enumerate(self.top(self.top_n), 1):
+            verb = sql.split(None, 1)[0].upper() if sql.strip() else 'SQL'
+            parts.append(f'sql-{index};dur={duration * 1000:.1f};desc="{verb}"')
+        return ', '.join(parts)
+
+
+class SQLProfilingMiddleware:
+    """按请求统计 SQL，见模块说明"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_sql_profiling_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+
+        profile = QueryProfile(top_n=config['TOP_N'], keep=config['MAX_SLOW_PER_REQUEST'])
+        request.sql_profile = profile
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(profile))
+            response = self.get_response(request)
+
+        if config['SERVER_TIMING']:
+            existing = response.get('Server-Timing')
+            timing = profile.server_timing()
+            response['Server-Timing'] = f"{existing}, {timing}" if existing else timing
+
+        route = self.get_route_name(request)
+        self.record_metrics(route, profile)
+        self.record_slow_queries(request, route, profile, config)
+        return response
+
+    def get_route_name(self, request):
+        resolver_match = getattr(request, 'resolver_match', None)
+        return resolver_match.view_name if resolver_match else 'unmatched'
+
+    def record_metrics(self, route, profile):
+        from .metrics import metrics_registry, get_metrics_config
+        if not get_metrics_config()['ENABLED']:
+            return
+        labels = {'view': route}
+        metrics_registry.observe(
+            'db_queries_per_request', profile.count, labels,
+            buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+            help_text='每个请求执行的 SQL 语句数'
+        )
+        metrics_registry.observe(
+            'db_time_seconds', profile.total_time, labels,
+            help_text='每个请求的数据库耗时（秒）'
+        )
+
+    def record_slow_queries(self, request, route, profile, config):
+        threshold = config['SLOW_QUERY_MS'] / 1000
+        slow = [item for item in profile.top() if item[0] >= threshold]
+        if not slow:
+            return
+        from .log_sink import log_sink
+        from .models import SlowQuery
+        for duration, sql, many in slow[:config['MAX_SLOW_PER_REQUEST']]:
+            log_sink.enqueue(SlowQuery(
+                fingerprint=fingerprint(sql),
+                sql=sql[:config['MAX_SQL_LENGTH']],
+                duration_ms=round(duration * 1000, 2),
+                route=route[:200],
+                method=request.method,
+                many=many,
+            ))
+
+
+def purge_slow_queries(now=None):
+    """删除超过保留期的慢 SQL 记录"""
+    from datetime import timedelta
+    from django.utils import timezone
+    from .models import SlowQuery
+
+    cutoff = (now or timezone.now()) - timedelta(days=get_sql_profiling_config()['RETENTION_DAYS'])
+    deleted, _ = SlowQuery.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
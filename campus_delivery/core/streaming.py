@@ -0,0 +1,33 @@
+"""
+ASGI 下的流式响应
+
+Django 在 ASGI（uvicorn）下遇到同步迭代器的 StreamingHttpResponse 时，会先用
+sync_to_async(list) 把整个迭代器读完再发送，并给出 "StreamingHttpResponse must consume
+synchronous iterators" 警告——导出、下载因此被整个缓冲到内存。
+ASGI 请求需要交给它异步迭代器：iterate_in_thread 每次只在线程中取下一块。
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+_DONE = object()
+
+
+def is_asgi_request(request):
+    """request 为 Django HttpRequest 或 DRF Request"""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+async def iterate_in_thread(iterable):
+    """把同步迭代器转换为异步生成器，每块在 Django 的同步线程中生成（可以执行 ORM 查询）"""
+    iterator = iter(iterable)
+    next_chunk = sync_to_async(lambda: next(iterator, _DONE), thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk()
+            if chunk is _DONE:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
@@ -0,0 +1,273 @@
+"""
+后台清理任务（命令超时、过期命令清理、机器人离线检测、遥测降采样、日志归档等）
+
+任务通过 @sweeper_task 注册，由以下任一方式周期执行：
+- 独立进程: python manage.py run_sweeper（推荐，docker-compose 中的 sweeper 服务）
+- 进程内线程: settings.SWEEPER['IN_PROCESS'] = True 时随 ASGI/WSGI 应用启动
+
+多个进程同时运行时通过文件锁保证同一时刻只有一个执行者。
+任务均为集合操作（一次 UPDATE / DELETE + 一次批量插入日志），不随命令数量逐条写库。
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger('system_backend')
+
+DEFAULT_SWEEPER_CONFIG = {
+    'IN_PROCESS': False,                  # 是否在 Web 进程内启动清理线程
+    'TICK_INTERVAL': 5,                   # 调度检查间隔（秒）
+    'LOCK_FILE': '/tmp/campus_delivery_sweeper.lock',
+    'COMMAND_TIMEOUT': 300,               # PENDING 命令超时秒数
+    'COMPLETED_RETENTION_DAYS': 3,        # 已完成/取消命令保留天数
+    'FAILED_RETENTION_DAYS': 1,           # 失败命令保留天数
+    'INTERVALS': {},                      # 覆盖单个任务的执行间隔（秒）
+}
+
+# 不参与超时处理的命令
+TIMEOUT_EXEMPT_COMMANDS = ['emergency_open_door']
+
+_tasks = {}
+
+
+def get_sweeper_config():
+    config = dict(DEFAULT_SWEEPER_CONFIG)
+    config.update(getattr(settings, 'SWEEPER', {}))
+    return config
+
+
+def sweeper_task(name, interval):
+    """注册清理任务，interval 为默认执行间隔（秒）"""
+    def decorator(func):
+        _tasks[name] = (func, interval)
+        return func
+    return decorator
+
+
+def get_tasks():
+    """已注册的任务: name -> (func, interval)"""
+    overrides = get_sweeper_config()['INTERVALS']
+    return {name: (func, overrides.get(name, interval)) for name, (func, interval) in _tasks.items()}
+
+
+# ----------------------------------------------------------------------
+# 命令超时与清理
+# ----------------------------------------------------------------------
+def not_timed_out(now=None, prefix=''):
+    """排除已超时但尚未被清理任务处理的命令，读路径用它代替逐条写入
+
+    prefix 用于跨关系过滤，如在 Robot 上聚合时传入 'commands__'。
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=get_sweeper_config()['COMMAND_TIMEOUT'])
+    return Q(**{f'{prefix}sent_at__gte': cutoff}) | Q(**{f'{prefix}command__in': TIMEOUT_EXEMPT_COMMANDS})
+
+
+def expire_timed_out_commands(robot=None, user=None, now=None):
+    """把超时的 PENDING 命令标记为 FAILED，返回处理数量
+
+    一次 UPDATE 完成所有机器人（或指定机器人）的超时处理，每条命令的警告日志一次批量插入。
+    """
+    from .models import RobotCommand, SystemLog
+    from .versioning import bump_robot_versions
+
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=get_sweeper_config()['COMMAND_TIMEOUT'])
+    timed_out = RobotCommand.objects.filter(
+        status='PENDING',
+        sent_at__lt=cutoff
+    ).exclude(command__in=TIMEOUT_EXEMPT_COMMANDS)
+    if robot is not None:
+        timed_out = timed_out.filter(robot=robot)
+
+    with transaction.atomic():
+        # 先锁定并取出要处理的命令，保证日志与更新的是同一批
+        expired = list(timed_out.select_for_update().values_list('id', 'robot_id', 'command'))
+        if not expired:
+            return 0
+        RobotCommand.objects.filter(id__in=[row[0] for row in expired]).update(
+            status='FAILED',
+            result='命令执行超时',
+            executed_at=now
+        )
+        bump_robot_versions(*{row[1] for row in expired})
+        SystemLog.emit_many([
+            {
+                'level': 'WARNING',
+                'log_type': 'ROBOT_CONTROL',
+                'message': f"命令执行超时: {command}",
+                'robot_id': robot_id,
+                'user': user,
+                'data': {'command_id': command_id, 'command': command},
+            }
+            for command_id, robot_id, command in expired
+        ])
+
+    logger.warning(f"⏱️ 命令超时处理: {len(expired)} 条")
+    return len(expired)
+
+
+def purge_finished_commands(robot=None, now=None):
+    """删除过期的已完成/失败命令，返回 (completed_deleted, failed_deleted)"""
+    from .models import RobotCommand
+
+    config = get_sweeper_config()
+    now = now or timezone.now()
+    commands = RobotCommand.objects.all()
+    if robot is not None:
+        commands = commands.filter(robot=robot)
+
+    completed_deleted = commands.filter(
+        status__in=['COMPLETED', 'FAILED', 'CANCELLED'],
+        sent_at__lt=now - timedelta(days=config['COMPLETED_RETENTION_DAYS'])
+    ).delete()[0]
+    failed_deleted = commands.filter(
+        status='FAILED',
+        sent_at__lt=now - timedelta(days=config['FAILED_RETENTION_DAYS'])
+    ).delete()[0]
+    return completed_deleted, failed_deleted
+
+
+@sweeper_task('expire_commands', interval=30)
+def expire_commands_task():
+    return expire_timed_out_commands()
+
+
+@sweeper_task('purge_commands', interval=3600)
+def purge_commands_task():
+    return purge_finished_commands()
+
+
+@sweeper_task('presence_offline', interval=15)
+def presence_offline_task():
+    from .presence import presence
+    return presence.sweep_offline()
+
+
+@sweeper_task('telemetry_rollup', interval=60)
+def telemetry_rollup_task():
+    from .telemetry_history import rollup_minutes, rollup_hours
+    return {'1m': rollup_minutes(), '1h': rollup_hours()}
+
+
+@sweeper_task('telemetry_retention', interval=3600)
+def telemetry_retention_task():
+    from .telemetry_history import purge_telemetry
+    return purge_telemetry()
+
+
+@sweeper_task('traffic_rollup_retention', interval=3600)
+def traffic_rollup_retention_task():
+    from .rollups import purge_traffic_rollups
+    return purge_traffic_rollups()
+
+
+@sweeper_task('log_archive', interval=3600)
+def log_archive_task():
+    from .log_archive import archive_expired_logs
+    return archive_expired_logs()
+
+
+@sweeper_task('slow_query_retention', interval=3600)
+def slow_query_retention_task():
+    from .sql_profiling import purge_slow_queries
+    return purge_slow_queries()
+
+
+@sweeper_task('cpu_profile_retention', interval=3600)
+def cpu_profile_retention_task():
+    from .cpu_profiler import purge_cpu_profiles
+    return purge_cpu_profiles()
+
+
+# ----------------------------------------------------------------------
+# 调度
+# ----------------------------------------------------------------------
+class Sweeper:
+    """按间隔执行已注册任务"""
+
+    def __init__(self):
+        self._last_run = {}
+        self._stop = threading.Event()
+
+    def run_task(self, name):
+        func, _ = get_tasks()[name]
+        close_old_connections()
+        started = time.monotonic()
+        try:
+            result = func()
+            logger.info(f"🧹 清理任务 {name} 完成: {result} ({time.monotonic() - started:.3f}s)")
+            return result
+        except Exception as e:
+            logger.error(f"清理任务 {name} 失败: {e}")
+            return None
+        finally:
+            close_old_connections()
+
+    def run_pending(self, force=False):
+        """执行到期的任务，返回本次执行的任务名；其他进程持有锁时跳过"""
+        lock_file = self._acquire_lock()
+        if lock_file is None:
+            return []
+        ran = []
+        try:
+            now = time.monotonic()
+            for name, (_, interval) in get_tasks().items():
+                last = self._last_run.get(name)
+                if force or last is None or now - last >= interval:
+                    self._last_run[name] = now
+                    self.run_task(name)
+                    ran.append(name)
+        finally:
+            self._release_lock(lock_file)
+        return ran
+
+    def run_forever(self):
+        interval = get_sweeper_config()['TICK_INTERVAL']
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def _acquire_lock(self):
+        path = get_sweeper_config()['LOCK_FILE']
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        lock_file = open(path, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _release_lock(self, lock_file):
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            lock_file.close()
+
+
+_in_process_thread = None
+
+
+def start_in_process_sweeper():
+    """SWEEPER['IN_PROCESS'] 开启时在当前进程启动清理线程"""
+    global _in_process_thread
+    if not get_sweeper_config()['IN_PROCESS']:
+        return None
+    if _in_process_thread is not None and _in_process_thread.is_alive():
+        return _in_process_thread
+    sweeper = Sweeper()
+    _in_process_thread = threading.Thread(target=sweeper.run_forever, name='command-sweeper', daemon=True)
+    _in_process_thread.start()
+    return _in_process_thread
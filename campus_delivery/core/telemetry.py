@@ -0,0 +1,171 @@
+"""
+机器人遥测写入
+
+状态上报（HTTP update_status / telemetry、WebSocket status_update）都经由 apply_telemetry：
+- 一次请求可以携带多条采样，按时间顺序合并为最终状态
+- 只写入有变化的字段，整个上报只执行一条 UPDATE（同时刷新 last_status_update 并递增 version）；
+  没有字段变化的上报不写机器人表、不递增 version，只按心跳处理
+- 可选 expected_version 做比较并交换，版本不符时抛出 TelemetryConflict
+- 仅在运行状态或门状态变化时写 SystemLog，电量/位置的常规上报不再逐条记日志
+- 每条采样另外写入遥测历史（core.telemetry_history），用于按时间范围查询
+"""
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Robot, SystemLog
+from .presence import presence
+from .telemetry_history import record_samples
+
+# 单次上报最多处理的采样数
+MAX_TELEMETRY_SAMPLES = 200
+
+ROBOT_STATUSES = ['IDLE', 'LOADING', 'DELIVERING', 'MAINTENANCE', 'RETURNING']
+DOOR_STATUSES = ['OPEN', 'CLOSED']
+
+
+class TelemetryError(ValueError):
+    """采样数据格式错误"""
+
+
+class TelemetryConflict(Exception):
+    """expected_version 与数据库中的版本不一致"""
+
+    def __init__(self, current_version):
+        super().__init__(current_version)
+        self.current_version = current_version
+
+
+def normalize_sample(sample, now=None):
+    """把一条采样转换为 Robot 字段，返回 (时间, {字段: 值})
+
+    支持的键: status / battery / location / door_status / timestamp
+    未识别或取值不合法的状态字段被忽略，电量超出范围时截断到 0-100。
+    """
+    if not isinstance(sample, dict):
+        raise TelemetryError('采样必须是对象')
+    now = now or timezone.now()
+
+    fields = {}
+    location = sample.get('location')
+    if location:
+        location = location if isinstance(location, str) else json.dumps(location)
+        fields['current_location'] = location[:100]
+
+    battery = sample.get('battery')
+    if battery is not None:
+        try:
+            fields['battery_level'] = max(0, min(100, int(float(battery))))
+        except (TypeError, ValueError):
+            raise TelemetryError(f'电量格式错误: {battery}')
+
+    door_status = str(sample.get('door_status') or '').upper()
+    if door_status in DOOR_STATUSES:
+        fields['door_status'] = door_status
+
+    status = str(sample.get('status') or '').upper()
+    if status in ROBOT_STATUSES:
+        fields['status'] = status
+
+    return _parse_timestamp(sample.get('timestamp'), now), fields
+
+
+def _parse_timestamp(value, now):
+    """采样时间，缺省为服务器当前时间，且不晚于当前时间"""
+    if not value:
+        return now
+    try:
+        if isinstance(value, (int, float)):
+            return min(datetime.fromtimestamp(value, tz=dt_timezone.utc), now)
+        # 格式正确但日期不存在（如 13 月）时 parse_datetime 抛出 ValueError
+        recorded_at = parse_datetime(str(value))
+    except (OverflowError, OSError, ValueError):
+        raise TelemetryError(f'采样时间超出范围: {value}')
+    if recorded_at is None:
+        raise TelemetryError(f'采样时间格式错误: {value}')
+    if timezone.is_naive(recorded_at):
+        recorded_at = timezone.make_aware(recorded_at)
+    return min(recorded_at, now)
+
+
+def merge_samples(samples, now=None):
+    """按采样时间合并，后采样的字段覆盖先采样的，返回 (合并后的字段, 规范化后的采样列表)"""
+    now = now or timezone.now()
+    normalized = [normalize_sample(sample, now) for sample in samples]
+    normalized.sort(key=lambda item: item[0])
+    merged = {}
+    for _, fields in normalized:
+        merged.update(fields)
+    return merged, normalized
+
+
+def apply_telemetry(robot, samples, expected_version=None):
+    """把一批采样写入机器人，返回 {'fields': 实际变化的字段, 'samples': 采样数, 'version': 新版本或 None}
+
+    robot 为已加载的 Robot 实例，用于对比出真正变化的字段；写库只有一条带字段限制的 UPDATE。
+    传入 expected_version 时在 WHERE 中附加版本条件，失败抛出 TelemetryConflict。
+    """
+    if not samples:
+        raise TelemetryError('没有采样数据')
+    if len(samples) > MAX_TELEMETRY_SAMPLES:
+        raise TelemetryError(f'单次最多上报 {MAX_TELEMETRY_SAMPLES} 条采样')
+
+    now = timezone.now()
+    merged, normalized = merge_samples(samples, now)
+    changed = {name: value for name, value in merged.items() if getattr(robot, name) != value}
+
+    rows = Robot.objects.filter(id=robot.id)
+    if expected_version is not None:
+        rows = rows.filter(version=expected_version)
+    if changed:
+        updated = rows.update(**changed, last_status_update=now, version=F('version') + 1)
+    else:
+        # 没有变化时只校验版本，last_status_update 由 presence 按心跳节流写入
+        updated = rows.exists() if expected_version is not None else True
+    if not updated:
+        current = Robot.objects.filter(id=robot.id).values_list('version', flat=True).first()
+        raise TelemetryConflict(current)
+
+    previous = {name: getattr(robot, name) for name in changed}
+    new_version = None
+    if changed:
+        for name, value in changed.items():
+            setattr(robot, name, value)
+        robot.last_status_update = now
+        if expected_version is not None:
+            new_version = robot.version = expected_version + 1
+        else:
+            # 版本由数据库递增，下次访问时重新读取
+            robot.__dict__.pop('version', None)
+    elif expected_version is not None:
+        new_version = expected_version
+
+    presence.touch(robot.id, persisted=bool(changed))
+    record_samples(robot.id, normalized)
+    _log_transitions(robot, previous, changed)
+    return {
+        'fields': sorted(changed),
+        'samples': len(samples),
+        'version': new_version,
+    }
+
+
+def _log_transitions(robot, previous, changed):
+    """只记录运行状态和门状态的变化"""
+    if 'status' in changed:
+        SystemLog.log_info(
+            f"机器人 {robot.name} 状态变化: {previous['status']} -> {changed['status']}",
+            log_type='ROBOT_CONTROL',
+            robot=robot,
+            data={'from': previous['status'], 'to': changed['status']}
+        )
+    if 'door_status' in changed:
+        SystemLog.log_info(
+            f"机器人 {robot.name} 门状态变化: {previous['door_status']} -> {changed['door_status']}",
+            log_type='ROBOT_CONTROL',
+            robot=robot,
+            data={'from': previous['door_status'], 'to': changed['door_status']}
+        )
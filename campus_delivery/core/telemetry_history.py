@@ -0,0 +1,272 @@
+"""
+机器人遥测历史
+
+- 原始采样: 状态上报时由 apply_telemetry 放入日志写入器队列，与 SystemLog 一起批量 bulk_create
+- 降采样: 原始采样和分钟汇总写入时 rolled_up=False（待汇总）。清理任务 telemetry_rollup 每分钟
+  取出待汇总的原始采样，重算它们所在的 (机器人, 分钟) 桶；再取出待汇总的分钟汇总，重算所在的小时桶
+  （整桶删除后重建，重复执行结果相同；批量补报的旧采样、清理进程停机期间的采样也会被计入）
+- 保留期: 清理任务 telemetry_retention 按分辨率删除过期数据，尚未汇总的行保留到汇总之后
+- 查询: query_history 按时间跨度自动选择分辨率，图表读取汇总表而不是扫描原始数据
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .log_sink import log_sink
+
+logger = logging.getLogger('system_backend')
+
+DEFAULT_TELEMETRY_HISTORY_CONFIG = {
+    'ENABLED': True,
+    'RAW_RETENTION_DAYS': 2,       # 原始采样保留天数
+    'MINUTE_RETENTION_DAYS': 14,   # 1 分钟汇总保留天数
+    'HOUR_RETENTION_DAYS': 365,    # 1 小时汇总保留天数
+    'ROLLUP_BATCH_SIZE': 20000,    # 每次最多处理的待汇总行数，其余留给下一次
+    'MAX_POINTS': 5000,            # 单次查询最多返回的数据点
+}
+
+RESOLUTIONS = ('raw', '1m', '1h')
+
+
+def get_telemetry_history_config():
+    config = dict(DEFAULT_TELEMETRY_HISTORY_CONFIG)
+    config.update(getattr(settings, 'TELEMETRY_HISTORY', {}))
+    return config
+
+
+def minute_bucket(when):
+    return when.replace(second=0, microsecond=0)
+
+
+def hour_bucket(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+# ----------------------------------------------------------------------
+# 写入
+# ----------------------------------------------------------------------
+def record_samples(robot_id, normalized):
+    """把规范化后的采样 [(时间, {Robot 字段: 值})] 放入写入队列，返回入队数量"""
+    from .models import TelemetrySample
+
+    if not get_telemetry_history_config()['ENABLED']:
+        return 0
+    queued = 0
+    for recorded_at, fields in normalized:
+        if not any(name in fields for name in ('battery_level', 'current_location', 'door_status')):
+            continue
+        sample = TelemetrySample(
+            robot_id=robot_id,
+            recorded_at=recorded_at,
+            battery_level=fields.get('battery_level'),
+            location=fields.get('current_location', ''),
+            door_status=fields.get('door_status', ''),
+        )
+        if log_sink.enqueue(sample):
+            queued += 1
+    return queued
+
+
+# ----------------------------------------------------------------------
+# 降采样
+# ----------------------------------------------------------------------
+class _Bucket:
+    """一个 (机器人, 时间桶) 的累加结果；按时间顺序加入，位置和门状态取最后一个非空值"""
+
+    __slots__ = ('count', 'battery_min', 'battery_max', 'battery_weighted', 'battery_count', 'location', 'door_status')
+
+    def __init__(self):
+        self.count = 0
+        self.battery_min = None
+        self.battery_max = None
+        self.battery_weighted = 0.0
+        self.battery_count = 0
+        self.location = ''
+        self.door_status = ''
+
+    def add(self, count, battery_min, battery_max, battery_avg, location, door_status):
+        self.count += count
+        if battery_avg is not None:
+            self.battery_min = battery_min if self.battery_min is None else min(self.battery_min, battery_min)
+            self.battery_max = battery_max if self.battery_max is None else max(self.battery_max, battery_max)
+            self.battery_weighted += battery_avg * count
+            self.battery_count += count
+        if location:
+            self.location = location
+        if door_status:
+            self.door_status = door_status
+
+    def to_rollup(self, robot_id, resolution, bucket):
+        from .models import TelemetryRollup
+
+        return TelemetryRollup(
+            robot_id=robot_id,
+            resolution=resolution,
+            bucket=bucket,
+            sample_count=self.count,
+            battery_min=self.battery_min,
+            battery_max=self.battery_max,
+            battery_avg=round(self.battery_weighted / self.battery_count, 2) if self.battery_count else None,
+            location=self.location,
+            door_status=self.door_status,
+        )
+
+
+def _replace_rollups(resolution, buckets):
+    """整体替换 buckets 中各 (机器人, 时间桶) 的汇总，返回写入的桶数"""
+    from .models import TelemetryRollup
+
+    by_robot = {}
+    for robot_id, when in buckets:
+        by_robot.setdefault(robot_id, []).append(when)
+    with transaction.atomic():
+        for robot_id, whens in by_robot.items():
+            TelemetryRollup.objects.filter(resolution=resolution, robot_id=robot_id, bucket__in=whens).delete()
+        TelemetryRollup.objects.bulk_create([
+            bucket.to_rollup(robot_id, resolution, when)
+            for (robot_id, when), bucket in buckets.items()
+        ], batch_size=500)
+    return len(buckets)
+
+
+def _dirty_keys(queryset, time_field, bucket_of):
+    """取出最多 ROLLUP_BATCH_SIZE 行待汇总数据，返回 (行ID列表, {机器人ID: {时间桶}})"""
+    ids = []
+    keys = {}
+    rows = queryset.filter(rolled_up=False).order_by('id').values_list('id', 'robot_id', time_field)
+    for row_id, robot_id, when in rows[:get_telemetry_history_config()['ROLLUP_BATCH_SIZE']]:
+        ids.append(row_id)
+        keys.setdefault(robot_id, set()).add(bucket_of(when))
+    return ids, keys
+
+
+def _mark_rolled_up(queryset, ids):
+    # 只标记本次读到的行，读取之后才提交的采样留给下一次
+    for start in range(0, len(ids), 1000):
+        queryset.filter(id__in=ids[start:start + 1000]).update(rolled_up=True)
+
+
+def rollup_minutes():
+    """重算含待汇总原始采样的 (机器人, 分钟) 桶的 1 分钟汇总，返回写入的桶数"""
+    from .models import TelemetrySample
+
+    ids, keys = _dirty_keys(TelemetrySample.objects.all(), 'recorded_at', minute_bucket)
+    buckets = {}
+    for robot_id, minutes in keys.items():
+        rows = TelemetrySample.objects.filter(
+            robot_id=robot_id, recorded_at__gte=min(minutes), recorded_at__lt=max(minutes) + timedelta(minutes=1)
+        ).order_by('recorded_at', 'id').values_list('recorded_at', 'battery_level', 'location', 'door_status')
+        for recorded_at, battery, location, door_status in rows.iterator(chunk_size=2000):
+            when = minute_bucket(recorded_at)
+            if when not in minutes:
+                continue
+            bucket = buckets.get((robot_id, when))
+            if bucket is None:
+                bucket = buckets[(robot_id, when)] = _Bucket()
+            bucket.add(1, battery, battery, battery, location, door_status)
+    written = _replace_rollups('1m', buckets)
+    _mark_rolled_up(TelemetrySample.objects.all(), ids)
+    return written
+
+
+def rollup_hours():
+    """用分钟汇总重算含待汇总分钟桶的 (机器人, 小时) 桶的 1 小时汇总，返回写入的桶数"""
+    from .models import TelemetryRollup
+
+    minute_rollups = TelemetryRollup.objects.filter(resolution='1m')
+    ids, keys = _dirty_keys(minute_rollups, 'bucket', hour_bucket)
+    buckets = {}
+    for robot_id, hours in keys.items():
+        rows = minute_rollups.filter(
+            robot_id=robot_id, bucket__gte=min(hours), bucket__lt=max(hours) + timedelta(hours=1)
+        ).order_by('bucket').values_list('bucket', 'sample_count', 'battery_min', 'battery_max', 'battery_avg',
+                                         'location', 'door_status')
+        for when, count, battery_min, battery_max, battery_avg, location, door_status in rows.iterator(chunk_size=2000):
+            hour = hour_bucket(when)
+            if hour not in hours:
+                continue
+            bucket = buckets.get((robot_id, hour))
+            if bucket is None:
+                bucket = buckets[(robot_id, hour)] = _Bucket()
+            bucket.add(count, battery_min, battery_max, battery_avg, location, door_status)
+    written = _replace_rollups('1h', buckets)
+    _mark_rolled_up(minute_rollups, ids)
+    return written
+
+
+def purge_telemetry(now=None):
+    """删除超过保留期的原始采样和汇总，返回 {分辨率: 删除行数}"""
+    from .models import TelemetrySample, TelemetryRollup
+
+    config = get_telemetry_history_config()
+    now = now or timezone.now()
+    return {
+        'raw': TelemetrySample.objects.filter(
+            recorded_at__lt=now - timedelta(days=config['RAW_RETENTION_DAYS']), rolled_up=True
+        ).delete()[0],
+        '1m': TelemetryRollup.objects.filter(
+            resolution='1m', bucket__lt=now - timedelta(days=config['MINUTE_RETENTION_DAYS']), rolled_up=True
+        ).delete()[0],
+        '1h': TelemetryRollup.objects.filter(
+            resolution='1h', bucket__lt=now - timedelta(days=config['HOUR_RETENTION_DAYS'])
+        ).delete()[0],
+    }
+
+
+# ----------------------------------------------------------------------
+# 查询
+# ----------------------------------------------------------------------
+def choose_resolution(start, end, now=None):
+    """按时间跨度和保留期选择分辨率: 2 小时内用原始采样，3 天内用分钟汇总，其余用小时汇总"""
+    config = get_telemetry_history_config()
+    now = now or timezone.now()
+    span = end - start
+    if span <= timedelta(hours=2) and start >= now - timedelta(days=config['RAW_RETENTION_DAYS']):
+        return 'raw'
+    if span <= timedelta(days=3) and start >= now - timedelta(days=config['MINUTE_RETENTION_DAYS']):
+        return '1m'
+    return '1h'
+
+
+def query_history(robot_id, start, end, resolution):
+    """返回 (数据点列表, 是否因 MAX_POINTS 截断)，数据点按时间升序"""
+    from .models import TelemetrySample, TelemetryRollup
+
+    limit = get_telemetry_history_config()['MAX_POINTS']
+    if resolution == 'raw':
+        rows = list(TelemetrySample.objects.filter(
+            robot_id=robot_id, recorded_at__gte=start, recorded_at__lt=end
+        ).order_by('recorded_at').values_list(
+            'recorded_at', 'battery_level', 'location', 'door_status'
+        )[:limit + 1])
+        points = [
+            {
+                't': recorded_at.isoformat(),
+                'battery': battery,
+                'location': location or None,
+                'door_status': door_status or None,
+            }
+            for recorded_at, battery, location, door_status in rows[:limit]
+        ]
+    else:
+        rows = list(TelemetryRollup.objects.filter(
+            robot_id=robot_id, resolution=resolution, bucket__gte=start, bucket__lt=end
+        ).order_by('bucket').values_list(
+            'bucket', 'sample_count', 'battery_min', 'battery_max', 'battery_avg', 'location', 'door_status'
+        )[:limit + 1])
+        points = [
+            {
+                't': bucket.isoformat(),
+                'samples': count,
+                'battery': battery_avg,
+                'battery_min': battery_min,
+                'battery_max': battery_max,
+                'location': location or None,
+                'door_status': door_status or None,
+            }
+            for bucket, count, battery_min, battery_max, battery_avg, location, door_status in rows[:limit]
+        ]
+    return points, len(rows) > limit
@@ -0,0 +1,69 @@
+"""
+测试辅助工具
+
+query_budget 断言一段代码执行的 SQL 数量不超过预算，用于保证接口的查询数与数据量无关：
+
+    from core.testing import query_budget
+
+    with query_budget(5):
+        client.get(f'/api/robots/{robot.id}/current_orders/')
+
+超出预算时抛出 AssertionError，消息中列出全部 SQL，便于定位 N+1 查询。
+也可以作为装饰器使用: @query_budget(5)
+
+log_sink_mode 在测试中切换日志写入器的同步/异步模式：
+
+    with log_sink_mode(enabled=False):
+        SystemLog.log_info("...")   # 立即写入，当前测试事务中可见
+"""
+from contextlib import ContextDecorator, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class query_budget(ContextDecorator):
+    """断言代码块内对 using 数据库的查询数不超过 max_queries"""
+
+    def __init__(self, max_queries, using='default'):
+        self.max_queries = max_queries
+        self.using = using
+        self._context = None
+
+    @property
+    def queries(self):
+        return self._context.captured_queries if self._context else []
+
+    def __enter__(self):
+        self._context = CaptureQueriesContext(connections[self.using])
+        self._context.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        executed = len(self._context)
+        if executed > self.max_queries:
+            statements = '\n'.join(
+                f"{i}. {query['sql']}" for i, query in enumerate(self._context.captured_queries, 1)
+            )
+            raise AssertionError(
+                f"查询数超出预算: 执行 {executed} 条，预算 {self.max_queries} 条\n{statements}"
+            )
+        return False
+
+
+@contextmanager
+def log_sink_mode(enabled, **options):
+    """按 LOG_SINK['ENABLED']=enabled（及 options 中的其他配置）重新初始化日志写入器，退出时写完队列并恢复"""
+    from .log_sink import log_sink
+
+    config = dict(getattr(settings, 'LOG_SINK', {}), ENABLED=enabled, **options)
+    with override_settings(LOG_SINK=config):
+        log_sink.reset()
+        try:
+            yield log_sink
+        finally:
+            log_sink.reset()
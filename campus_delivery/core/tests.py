@@ -1,3 +1,717 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import warnings
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .middleware import NetworkMonitorMiddleware
+from .commands import complete_command
+from .log_archive import archive_expired_logs
+from .log_handlers import CompressingRotatingFileHandler
+from .metrics import MetricsRegistry
+from .models import (
+    User, DeliveryOrder, Robot, RobotCommand, SystemLog, SystemLogArchive, CpuProfile,
+    TelemetrySample, TelemetryRollup, TrafficRollup,
+)
+from .rollups import purge_traffic_rollups, traffic_rollups
+from .sweeper import expire_timed_out_commands
+from .telemetry_history import hour_bucket, minute_bucket, purge_telemetry, rollup_hours, rollup_minutes
+from .log_sink import log_sink
+from .testing import log_sink_mode, query_budget
+
+
+def make_order(student, **fields):
+    values = {
+        'package_type': '文件',
+        'weight': '1kg',
+        'pickup_building': 'A栋',
+        'delivery_building': 'B栋',
+        'delivery_speed': 'standard',
+    }
+    values.update(fields)
+    return DeliveryOrder.objects.create(student=student, **values)
+
+
+def asgi_get(path, user=None, query_string='', disconnect_after=None):
+    """经 ASGIHandler 发送 GET 请求（与 uvicorn 部署相同的代码路径），返回 (状态码, 响应头, 响应体块列表, 警告)
+
+    disconnect_after: 收到该数量的响应体块后模拟客户端断开
+    """
+    headers = [(b'host', b'testserver')]
+    if user is not None:
+        headers.append((b'authorization', f"Bearer {AccessToken.for_user(user)}".encode()))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query_string.encode(), 'root_path': '', 'headers': headers,
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def run():
+        request_sent = False
+        disconnected = asyncio.Event()
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # 不断开时一直等待，直到处理器取消
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+            if disconnect_after is not None and len(messages) > disconnect_after:
+                disconnected.set()
+
+        await ASGIHandler()(scope, receive, send)
+
+    # 与测试客户端相同：请求结束时不关闭测试事务所在的连接
+    request_finished.disconnect(close_old_connections)
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            async_to_sync(run)()
+    finally:
+        request_finished.connect(close_old_connections)
+
+    start = messages[0]
+    chunks = [m['body'] for m in messages[1:] if m.get('body')]
+    return start['status'], dict(start['headers']), chunks, [str(w.message) for w in caught]
+
+
+class SyncLogSinkMixin:
+    """日志同步写入，测试事务中立即可见"""
+
+    def setUp(self):
+        super().setUp()
+        context = log_sink_mode(enabled=False)
+        context.__enter__()
+        self.addCleanup(context.__exit__, None, None, None)
+
+
+class LogSinkTests(SyncLogSinkMixin, TestCase):
+    def test_sync_mode_keeps_caller_transaction(self):
+        with transaction.atomic():
+            SystemLog.log_info("事务内日志", defer=True)
+            self.assertTrue(SystemLog.objects.filter(message="事务内日志").exists())
+
+    def test_sync_mode_does_not_close_connections(self):
+        # 在调用方线程中关闭连接会破坏其事务（MySQL 上报 Cannot operate on a closed database）
+        with mock.patch('core.log_sink.close_old_connections') as close:
+            SystemLog.log_info("同步写入", defer=True)
+            log_sink.tick()
+        close.assert_not_called()
+
+
+class LogSinkBatchTests(TransactionTestCase):
+    def test_bad_row_only_fails_itself(self):
+        student = User.objects.create(username='s1', is_student=True)
+        order = make_order(student)
+        # 写线程只在 flush() 时写入，保证删除订单发生在写入之前
+        with log_sink_mode(enabled=True, FLUSH_INTERVAL=60) as sink:
+            SystemLog.log_info("第一条", defer=True)
+            SystemLog.log_info("订单日志", order=order, defer=True)
+            SystemLog.log_info("第三条", defer=True)
+            DeliveryOrder.objects.filter(pk=order.pk).delete()
+            sink.flush()
+            stats = sink.stats()
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['flushed'], 2)
+        self.assertEqual(
+            set(SystemLog.objects.values_list('message', flat=True)), {"第一条", "第三条"}
+        )
+
+
+@override_settings(DATA_EXPORT={'CHUNK_SIZE': 8, 'GZIP_LEVEL': 6})
+class ExportTests(SyncLogSinkMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        SystemLog.objects.bulk_create([SystemLog(message=f"日志 {i}") for i in range(30)])
+
+    def test_asgi_export_streams_without_buffering(self):
+        status_code, headers, chunks, caught = asgi_get('/api/logs/export/', self.admin, 'fmt=ndjson')
+        self.assertEqual(status_code, 200)
+        self.assertFalse([w for w in caught if 'synchronous iterators' in w], caught)
+        # 每 CHUNK_SIZE // 4 行一块，逐块发送
+        self.assertGreater(len(chunks), 2)
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual(len(lines), 30)
+        self.assertEqual(json.loads(lines[0])['message'], "日志 0")
+
+    def test_wsgi_export_csv(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/logs/export/', {'fmt': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        rows = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(rows), 31)
+
+
+class StreamMonitorTests(SyncLogSinkMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        SystemLog.objects.bulk_create([SystemLog(message=f"日志 {i}") for i in range(30)])
+
+    def stream_info(self, record):
+        self.assertEqual(record.call_count, 1)
+        _, _, _, content_length, _ = record.call_args.args
+        return content_length, record.call_args.kwargs['stream_info']
+
+    @override_settings(DATA_EXPORT={'CHUNK_SIZE': 8, 'GZIP_LEVEL': 6})
+    def test_asgi_stream_counts_sent_chunks(self):
+        with mock.patch.object(NetworkMonitorMiddleware, 'record_response', autospec=True) as record:
+            _, _, chunks, caught = asgi_get('/api/logs/export/', self.admin)
+        content_length, info = self.stream_info(record)
+        self.assertEqual(content_length, sum(len(chunk) for chunk in chunks))
+        self.assertTrue(info['completed'])
+        self.assertEqual(info['chunks'], len(chunks))
+        self.assertFalse([w for w in caught if 'synchronous iterators' in w], caught)
+
+    @override_settings(DATA_EXPORT={'CHUNK_SIZE': 8, 'GZIP_LEVEL': 6})
+    def test_asgi_client_disconnect_is_recorded(self):
+        with mock.patch.object(NetworkMonitorMiddleware, 'record_response', autospec=True) as record:
+            _, _, chunks, _ = asgi_get('/api/logs/export/', self.admin, disconnect_after=1)
+        content_length, info = self.stream_info(record)
+        self.assertFalse(info['completed'])
+        self.assertEqual(content_length, sum(len(chunk) for chunk in chunks))
+
+    def test_asgi_file_response_is_counted(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(CPU_PROFILER={'DIR': directory}):
+            with open(os.path.join(directory, 'p.folded'), 'w') as f:
+                f.write('main;work 3\n' * 1000)
+            profile = CpuProfile.objects.create(duration_ms=1, interval_ms=10, file='p.folded')
+            with mock.patch.object(NetworkMonitorMiddleware, 'record_response', autospec=True) as record:
+                status_code, _, chunks, caught = asgi_get(f'/api/cpu-profiles/{profile.id}/download/', self.admin)
+        self.assertEqual(status_code, 200)
+        content_length, info = self.stream_info(record)
+        self.assertEqual(content_length, len('main;work 3\n') * 1000)
+        self.assertTrue(info['completed'])
+        self.assertNotIn('file', info)
+        self.assertFalse([w for w in caught if 'synchronous iterators' in w], caught)
+
+
+class SystemLogRoutingTests(TestCase):
+    def test_audit_events_are_written_synchronously(self):
+        with mock.patch.object(log_sink, 'enqueue') as enqueue:
+            SystemLog.log_info("二维码扫描成功", 'QR_SCAN')
+            SystemLog.log_error("订单状态异常", 'ORDER_STATUS')
+        enqueue.assert_not_called()
+        self.assertEqual(SystemLog.objects.filter(log_type__in=['QR_SCAN', 'ORDER_STATUS']).count(), 2)
+
+    def test_high_volume_types_are_deferred(self):
+        with mock.patch.object(log_sink, 'enqueue') as enqueue:
+            SystemLog.log_info("收到请求", 'NETWORK_REQUEST')
+        enqueue.assert_called_once()
+        self.assertFalse(SystemLog.objects.filter(log_type='NETWORK_REQUEST').exists())
+
+    @override_settings(SYSTEM_LOG_ROUTING={'ROUTES': {'ROBOT_CONTROL': 'file'}})
+    def test_file_route_skips_database(self):
+        self.assertIsNone(SystemLog.log_info("指令已下发", 'ROBOT_CONTROL'))
+        self.assertFalse(SystemLog.objects.exists())
+
+    def test_batched_events_follow_routes(self):
+        robot = Robot.objects.create(name='R1', status='DELIVERING')
+        stop = RobotCommand.objects.create(robot=robot, command='stop_robot')
+        stale = RobotCommand.objects.create(robot=robot, command='open_door')
+        RobotCommand.objects.filter(id=stale.id).update(sent_at=timezone.now() - timedelta(days=1))
+
+        with override_settings(SYSTEM_LOG_ROUTING={'ROUTES': {'ROBOT_CONTROL': 'drop'}}):
+            complete_command(robot, stop, 'ok')
+            self.assertEqual(expire_timed_out_commands(), 1)
+        self.assertFalse(SystemLog.objects.filter(log_type='ROBOT_CONTROL').exists())
+
+        stale = RobotCommand.objects.create(robot=robot, command='open_door')
+        RobotCommand.objects.filter(id=stale.id).update(sent_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(expire_timed_out_commands(), 1)
+        self.assertEqual(SystemLog.objects.filter(log_type='ROBOT_CONTROL', level='WARNING').count(), 1)
+
+
+@override_settings(NETWORK_CAPTURE_POLICY={'DEFAULT_SAMPLE_RATE': 0.0})
+class QueryBudgetTests(SyncLogSinkMixin, TestCase):
+    """机器人订单接口的查询数与订单数量无关"""
+
+    def setUp(self):
+        super().setUp()
+        # 流量汇总的周期刷新与被测接口无关
+        patcher = mock.patch.object(log_sink, 'tick')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dispatcher = User.objects.create(username='dispatcher', is_dispatcher=True, is_staff=True)
+        self.student = User.objects.create(username='student', is_student=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.dispatcher)
+
+    def assert_constant_requests(self, run):
+        """run(订单数) 在预算内发出请求并返回查询数；1 个与 N 个订单时查询数必须相同"""
+        counts = [run(1), run(6)]
+        self.assertEqual(counts[0], counts[1], f"查询数随订单数量变化: {counts}")
+
+    def test_receive_orders(self):
+        def run(count):
+            robot = Robot.objects.create(name=f'R{count}')
+            orders = [make_order(self.student) for _ in range(count)]
+            with query_budget(9) as budget:
+                response = self.client.post(
+                    f'/api/robots/{robot.id}/receive_orders/', {'order_ids': [o.id for o in orders]}, format='json'
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['current_orders']), count)
+            return len(budget.queries)
+        self.assert_constant_requests(run)
+
+    def test_current_orders(self):
+        def run(count):
+            robot = Robot.objects.create(name=f'R{count}')
+            for _ in range(count):
+                make_order(self.student, status='ASSIGNED', robot=robot)
+            with query_budget(3) as budget:
+                response = self.client.get(f'/api/robots/{robot.id}/current_orders/')
+            self.assertEqual(len(response.json()['current_orders']), count)
+            return len(budget.queries)
+        self.assert_constant_requests(run)
+
+    def test_dispatch_partial_update(self):
+        def run(count):
+            robot = Robot.objects.create(name=f'R{count}')
+            for _ in range(count - 1):
+                make_order(self.student, status='ASSIGNED', robot=robot)
+            order = make_order(self.student, robot=robot)
+            with query_budget(8) as budget:
+                response = self.client.patch(f'/api/dispatch/orders/{order.id}/', {'status': 'ASSIGNED'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['robot_id'], robot.id)
+            return len(budget.queries)
+        self.assert_constant_requests(run)
+
+
+class CursorPaginationTests(SyncLogSinkMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        # 同一时间戳的多行按 id 区分先后
+        now = timezone.now()
+        SystemLog.objects.bulk_create([SystemLog(message=f"日志 {i}") for i in range(7)])
+        SystemLog.objects.update(timestamp=now)
+
+    def test_next_and_previous_cover_every_row_once(self):
+        expected = list(SystemLog.objects.order_by('-id').values_list('id', flat=True))
+        seen, pages = [], []
+        url = '/api/logs/?page_size=3'
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data)
+            seen.extend(log['id'] for log in data['results'])
+            url = data['next']
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0]['previous'])
+
+        previous = self.client.get(pages[1]['previous']).json()
+        self.assertEqual([log['id'] for log in previous['results']], expected[:3])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/logs/?cursor=bogus').status_code, 404)
+
+
+class TelemetryTests(SyncLogSinkMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(ROBOT_PRESENCE={'DIR': directory.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(username='operator', is_staff=True)
+        self.robot = Robot.objects.create(name='R1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, body):
+        return self.client.post(f'/api/robots/{self.robot.id}/telemetry/', body, format='json')
+
+    def test_expected_version_compare_and_swap(self):
+        version = Robot.objects.get(id=self.robot.id).version
+        response = self.post({'samples': [{'battery': 80}], 'expected_version': version})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], version + 1)
+
+        stale = self.post({'samples': [{'battery': 70}], 'expected_version': version})
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale.json()['current_version'], version + 1)
+        self.assertEqual(Robot.objects.get(id=self.robot.id).battery_level, 80)
+
+    def test_stale_expected_version_without_changes(self):
+        version = Robot.objects.get(id=self.robot.id).version
+        self.post({'samples': [{'battery': 80}]})
+        response = self.post({'samples': [{'battery': 80}], 'expected_version': version})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['current_version'], version + 1)
+
+    def test_unchanged_report_keeps_version(self):
+        self.post({'samples': [{'battery': 80, 'status': 'IDLE'}]})
+        version = Robot.objects.get(id=self.robot.id).version
+        response = self.post({'samples': [{'battery': 80, 'status': 'IDLE'}], 'expected_version': version})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], version)
+        self.assertEqual(Robot.objects.get(id=self.robot.id).version, version)
+
+    def test_bad_timestamps_are_rejected(self):
+        for timestamp in (1e20, -1e20, '2026-13-45T10:00:00', 'yesterday'):
+            with self.subTest(timestamp=timestamp):
+                response = self.post({'samples': [{'battery': 50, 'timestamp': timestamp}]})
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(SystemLog.objects.filter(level='ERROR').exists())
+        self.assertEqual(Robot.objects.get(id=self.robot.id).battery_level, 100)
+
+    def test_samples_are_merged_in_time_order(self):
+        response = self.post({'samples': [
+            {'timestamp': '2026-01-01T00:00:02Z', 'battery': 50, 'status': 'DELIVERING'},
+            {'timestamp': '2026-01-01T00:00:01Z', 'battery': 60, 'location': 'A栋'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        robot = Robot.objects.get(id=self.robot.id)
+        self.assertEqual((robot.battery_level, robot.status, robot.current_location), (50, 'DELIVERING', 'A栋'))
+
+
+class CommandResultBatchTests(SyncLogSinkMixin, TestCase):
+    def test_outcomes_and_effects(self):
+        user = User.objects.create(username='operator', is_staff=True)
+        robot = Robot.objects.create(name='R1', status='DELIVERING')
+        door = RobotCommand.objects.create(robot=robot, command='open_door')
+        stop = RobotCommand.objects.create(robot=robot, command='stop_robot')
+        done = RobotCommand.objects.create(robot=robot, command='close_door', status='COMPLETED')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.post(f'/api/robots/{robot.id}/execute_commands/', {'results': [
+            {'command_id': door.id, 'result': 'door_open'},
+            {'command_id': stop.id, 'result': 'ok'},
+            {'command_id': done.id, 'result': 'door_closed'},
+            {'command_id': 999999, 'result': 'ok'},
+            {'command_id': 'x'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['outcome'] for item in response.json()['results']],
+            ['COMPLETED', 'COMPLETED', 'ALREADY_PROCESSED', 'NOT_FOUND', 'INVALID'],
+        )
+        self.assertEqual(response.json()['completed'], 2)
+        robot.refresh_from_db()
+        self.assertEqual((robot.door_status, robot.status), ('OPEN', 'IDLE'))
+        self.assertEqual(RobotCommand.objects.filter(status='COMPLETED').count(), 3)
+
+
+class LogArchiveTests(SyncLogSinkMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(LOG_ARCHIVE={'DIR': directory.name, 'RETENTION_DAYS': 30, 'BATCH_SIZE': 3})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+
+    def test_round_trip(self):
+        old = timezone.now() - timedelta(days=40)
+        SystemLog.objects.bulk_create([
+            SystemLog(message=f"旧日志 {i}", level='ERROR' if i % 2 else 'INFO', user=self.admin) for i in range(5)
+        ])
+        SystemLog.objects.update(timestamp=old)
+        SystemLog.objects.create(message="新日志")
+
+        result = archive_expired_logs()
+        self.assertEqual((result['archived'], result['deleted']), (5, 5))
+        self.assertEqual(list(SystemLog.objects.values_list('message', flat=True)), ["新日志"])
+        archive = SystemLogArchive.objects.get()
+        self.assertTrue(archive.purged)
+        self.assertEqual(archive.row_count, 5)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        day = timezone.localdate(old).isoformat()
+        data = client.get('/api/logs/', {'start_date': day, 'end_date': day, 'page_size': 2}).json()
+        self.assertEqual([log['message'] for log in data['results']], ["旧日志 4", "旧日志 3"])
+        self.assertEqual(data['results'][0]['username'], 'admin')
+
+        rest = client.get(data['next']).json()
+        self.assertEqual([log['message'] for log in rest['results']], ["旧日志 2", "旧日志 1"])
+
+        errors = client.get('/api/logs/', {'start_date': day, 'level': 'ERROR'}).json()
+        self.assertEqual([log['message'] for log in errors['results']], ["旧日志 3", "旧日志 1"])
+
+        # 再次运行不会重复归档
+        self.assertEqual(archive_expired_logs()['archived'], 0)
+
+
+class MetricsRegistryTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(METRICS={'MULTIPROCESS_DIR': self.directory})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def dead_worker_snapshot(self):
+        """写出一个已退出进程的快照"""
+        worker = subprocess.Popen([sys.executable, '-c', ''])
+        worker.wait()
+        registry = MetricsRegistry()
+        registry.inc('requests_total', {'route': 'orders'}, value=5)
+        registry.observe('request_seconds', 0.02)
+        registry.gauge_add('requests_in_flight', value=2)
+        with open(os.path.join(self.directory, f"metrics-{worker.pid}.json"), 'w', encoding='utf-8') as f:
+            json.dump(registry.snapshot(), f)
+
+    def test_dead_worker_counters_stay_monotonic(self):
+        registry = MetricsRegistry()
+        registry.inc('requests_total', {'route': 'orders'}, value=1)
+        registry.gauge_add('requests_in_flight', value=1)
+        self.dead_worker_snapshot()
+
+        for _ in range(2):
+            _, merged = registry.collect()
+            self.assertEqual(merged[('requests_total', (('route', 'orders'),))], 6)
+            self.assertEqual(merged[('request_seconds', ())][-1], 1)
+            # 仪表盘只统计存活进程
+            self.assertEqual(merged[('requests_in_flight', ())], 1)
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory) if name.endswith('.json')),
+            ['metrics-accumulated.json'],
+        )
+
+        self.dead_worker_snapshot()
+        _, merged = registry.collect()
+        self.assertEqual(merged[('requests_total', (('route', 'orders'),))], 11)
+        self.assertEqual(merged[('request_seconds', ())][-1], 2)
+
+
+class LogFileHandlerTests(TestCase):
+    def test_per_process_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            handler = CompressingRotatingFileHandler(
+                os.path.join(directory, 'system_backend.log'), delay=True, per_process=True
+            )
+            self.addCleanup(handler.close)
+            record = logging.makeLogRecord({'msg': '日志'})
+            handler.emit(record)
+            # fork 出的工作进程写入时切换到自己的文件
+            with mock.patch('core.log_handlers.os.getpid', return_value=os.getpid() + 1):
+                handler.emit(record)
+            self.assertEqual(
+                set(os.listdir(directory)),
+                {f"system_backend.{os.getpid()}.log", f"system_backend.{os.getpid() + 1}.log"},
+            )
+
+
+class LongPollTests(SyncLogSinkMixin, TransactionTestCase):
+    def test_connection_released_before_waiting(self):
+        user = User.objects.create(username='operator', is_staff=True)
+        robot = Robot.objects.create(name='R1')
+        client = APIClient()
+        client.force_authenticate(user)
+        calls = []
+
+        def wait(robot_id, token, timeout):
+            calls.append(close.called)
+            return False
+
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(ROBOT_PRESENCE={'DIR': directory}), \
+                mock.patch.object(connection, 'close', wraps=connection.close) as close, \
+                mock.patch('core.views.command_notifier.wait', side_effect=wait):
+            response = client.get(f'/api/robots/{robot.id}/get_commands/', {'wait': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['pending_commands'], [])
+        self.assertEqual(calls, [True])
+
+
+class RobotEtagTests(SyncLogSinkMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(ROBOT_PRESENCE={'DIR': directory.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(username='operator', is_staff=True)
+        self.robot = Robot.objects.create(name='R1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, action, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(f'/api/robots/{self.robot.id}/{action}/', **headers)
+
+    def test_telemetry_and_heartbeat_keep_work_etags(self):
+        commands_etag = self.get('get_commands')['ETag']
+        orders_etag = self.get('current_orders')['ETag']
+        status_etag = self.get('status')['ETag']
+        version = Robot.objects.get(id=self.robot.id).version
+
+        self.client.post(f'/api/robots/{self.robot.id}/heartbeat/')
+        self.client.post(f'/api/robots/{self.robot.id}/telemetry/', {'samples': [{'battery': 42}]}, format='json')
+        self.assertGreater(Robot.objects.get(id=self.robot.id).version, version)
+
+        self.assertEqual(self.get('get_commands', commands_etag).status_code, 304)
+        self.assertEqual(self.get('current_orders', orders_etag).status_code, 304)
+        self.assertEqual(self.get('status', status_etag).status_code, 200)
+
+    def test_new_command_invalidates_commands_etag(self):
+        etag = self.get('get_commands')['ETag']
+        RobotCommand.objects.create(robot=self.robot, command='open_door')
+        response = self.get('get_commands', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['command_count'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_long_poll_ignores_telemetry(self):
+        etag = self.get('get_commands')['ETag']
+        self.client.post(f'/api/robots/{self.robot.id}/telemetry/', {'samples': [{'battery': 42}]}, format='json')
+        with mock.patch('core.views.command_notifier.wait', return_value=False):
+            response = self.client.get(
+                f'/api/robots/{self.robot.id}/get_commands/', {'wait': 1}, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+
+class TelemetryRollupTests(TestCase):
+    def rollup(self):
+        rollup_minutes()
+        rollup_hours()
+
+    def rollups(self, resolution, when):
+        bucket = minute_bucket(when) if resolution == '1m' else hour_bucket(when)
+        return TelemetryRollup.objects.get(robot=self.robot, resolution=resolution, bucket=bucket)
+
+    def test_backfilled_samples_reach_every_resolution(self):
+        self.robot = Robot.objects.create(name='R1')
+        now = timezone.now()
+        old = now - timedelta(hours=30)
+        TelemetrySample.objects.create(robot=self.robot, recorded_at=now, battery_level=90)
+        self.rollup()
+
+        # 远早于当前时间的补报采样
+        TelemetrySample.objects.create(robot=self.robot, recorded_at=old, battery_level=40)
+        TelemetrySample.objects.create(robot=self.robot, recorded_at=old + timedelta(seconds=1), battery_level=60)
+        self.rollup()
+        minute = self.rollups('1m', old)
+        self.assertEqual((minute.sample_count, minute.battery_min, minute.battery_max), (2, 40, 60))
+        self.assertEqual(self.rollups('1h', old).sample_count, 2)
+        self.assertEqual(self.rollups('1h', now).sample_count, 1)
+
+        # 已汇总的桶再收到采样时整桶重算
+        TelemetrySample.objects.create(robot=self.robot, recorded_at=old + timedelta(seconds=2), battery_level=20)
+        self.rollup()
+        self.assertEqual(self.rollups('1m', old).sample_count, 3)
+        hour = self.rollups('1h', old)
+        self.assertEqual((hour.sample_count, hour.battery_min), (3, 20))
+        self.assertFalse(TelemetrySample.objects.filter(rolled_up=False).exists())
+
+    def test_purge_keeps_samples_not_yet_rolled_up(self):
+        self.robot = Robot.objects.create(name='R1')
+        old = timezone.now() - timedelta(days=5)
+        TelemetrySample.objects.create(robot=self.robot, recorded_at=old, battery_level=40)
+        self.assertEqual(purge_telemetry()['raw'], 0)
+        self.rollup()
+        self.assertEqual(purge_telemetry()['raw'], 1)
+        self.assertEqual(self.rollups('1h', old).sample_count, 1)
+
+
+@override_settings(NETWORK_CAPTURE_POLICY={'DEFAULT_SAMPLE_RATE': 0.0})
+class NetworkMonitorTests(SyncLogSinkMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        traffic_rollups.flush()
+        TrafficRollup.objects.all().delete()
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_connections_count_unsampled_requests(self):
+        student = User.objects.create(username='student', is_student=True)
+        student_client = APIClient(REMOTE_ADDR='10.0.0.8')
+        student_client.force_authenticate(student)
+        for _ in range(3):
+            student_client.get('/api/orders/')
+        traffic_rollups.flush()
+        self.assertFalse(SystemLog.objects.filter(log_type='NETWORK_REQUEST').exists())
+
+        connections = self.client.get('/api/network-monitor/connections/').json()['active_connections']
+        student_connection = next(conn for conn in connections if conn['client_ip'] == '10.0.0.8')
+        self.assertEqual((student_connection['username'], student_connection['requests']), ('student', 3))
+
+    def test_statistics_cover_recent_window(self):
+        now = timezone.now()
+        TrafficRollup.objects.bulk_create([
+            TrafficRollup(bucket=now - timedelta(days=3), route='orders', method='GET', status_class='5xx', request_count=50),
+            TrafficRollup(bucket=now - timedelta(hours=1), route='orders', method='GET', status_class='2xx', request_count=4),
+            TrafficRollup(bucket=now - timedelta(hours=1), route='orders', method='GET', status_class='5xx', request_count=1),
+            TrafficRollup(bucket=now - timedelta(hours=1), route='robot-websocket', method='WS', status_class='1xx', request_count=2),
+        ])
+        SystemLog.objects.create(message="连接", log_type='WEBSOCKET_CONNECTION')
+        with query_budget(6):
+            statistics = self.client.get('/api/network-monitor/').json()['statistics']
+        self.assertEqual(
+            (statistics['total_requests'], statistics['total_errors'], statistics['total_websockets']),
+            (5, 1, 2),
+        )
+
+    def test_retention(self):
+        now = timezone.now()
+        TrafficRollup.objects.bulk_create([
+            TrafficRollup(bucket=now - timedelta(days=8), route='orders', method='GET', status_class='2xx'),
+            TrafficRollup(bucket=now - timedelta(days=1), route='orders', method='GET', status_class='2xx'),
+        ])
+        self.assertEqual(purge_traffic_rollups(now), 1)
+        self.assertEqual(TrafficRollup.objects.count(), 1)
+
+
+class SparseFieldsetTests(SyncLogSinkMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.robot = Robot.objects.create(name='R1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_fields_only_trim_reads(self):
+        data = self.client.get(f'/api/robots/{self.robot.id}/?fields=id,status').json()
+        self.assertEqual(set(data), {'id', 'status'})
+
+        response = self.client.patch(
+            f'/api/robots/{self.robot.id}/?fields=id', {'current_location': '图书馆'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.robot.refresh_from_db()
+        self.assertEqual(self.robot.current_location, '图书馆')
+
+    def test_create_validates_every_field(self):
+        student = User.objects.create(username='student', is_student=True)
+        self.client.force_authenticate(student)
+        response = self.client.post('/api/orders/?fields=id', {'package_type': '文件'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pickup_building', response.json())
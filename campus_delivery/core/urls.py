@@ -1,8 +1,8 @@
 # core/urls.py
 
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
-from .views import DeliveryOrderViewSet, RobotViewSet, UserViewSet, DispatchOrderViewSet, MessageViewSet, QRCodeVerifyView, SystemLogViewSet, NetworkMonitorViewSet
+from .views import DeliveryOrderViewSet, RobotViewSet, UserViewSet, DispatchOrderViewSet, MessageViewSet, QRCodeVerifyView, SystemLogViewSet, SlowQueryViewSet, CpuProfileViewSet, NetworkMonitorViewSet, metrics_view, order_qr_image
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 router = DefaultRouter()
@@ -12,12 +12,16 @@ router.register('users', UserViewSet, basename='users')
 router.register(r'dispatch/orders', DispatchOrderViewSet, basename='dispatch-orders')
 router.register('messages', MessageViewSet, basename='messages')
 router.register('logs', SystemLogViewSet, basename='logs')
+router.register('slow-queries', SlowQueryViewSet, basename='slow-queries')
+router.register('cpu-profiles', CpuProfileViewSet, basename='cpu-profiles')
 router.register('network-monitor', NetworkMonitorViewSet, basename='network-monitor')
 
 # www.luanqibazao.com/login
 urlpatterns = [
+    re_path(r'^api/orders/(?P<pk>\d+)/qr\.(?P<fmt>png|svg)$', order_qr_image, name='order-qr-image'),
     path('api/', include(router.urls)),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/verify_qr/', QRCodeVerifyView.as_view(), name='verify-qr'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
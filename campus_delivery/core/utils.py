@@ -43,33 +43,13 @@ def generate_simple_qr_code(order_id, student_id):
     return json.dumps(qr_data, separators=(',', ':'))
 
 def generate_qr_code(signed_data):
-    """生成二维码图片 - 使用简化格式"""
-    from PIL import Image
-    import qrcode
-    
+    """生成二维码图片（base64 data URI）
+
+    订单接口已改为返回 /api/orders/<id>/qr.png 地址（见 core.qr），需要内嵌图片时才使用本函数。
+    """
+    from .qr import render_qr_png
+
     # 使用简化的数据格式
     qr_content = signed_data.get('payload_data', '')
-    
-    # 创建二维码，使用更大的格子尺寸和更宽松的设置
-    qr = qrcode.QRCode(
-        version=1,           # 使用最小版本
-        error_correction=qrcode.constants.ERROR_CORRECT_L,  # 低纠错级别
-        box_size=15,         # 增大格子尺寸
-        border=8             # 增大边框
-    )
-    
-    qr.add_data(qr_content)
-    qr.make(fit=True)
-    
-    # 生成图片
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # 转换为base64
-    import base64
-    import io
-    
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    
+    img_str = base64.b64encode(render_qr_png(qr_content)).decode()
     return f"data:image/png;base64,{img_str}"
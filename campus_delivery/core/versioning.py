@@ -0,0 +1,69 @@
+"""
+机器人变更版本与条件 GET
+
+Robot.version 在机器人、其订单或指令变化时递增：
+- Robot.save() 自身、遥测上报和在线心跳原子递增
+- 订单/指令通过 signals 中的 post_save/post_delete 调用 bump_robot_versions
+- 绕过信号的集合操作（queryset.update / bulk_update）由调用方显式调用 bump_robot_versions
+
+Robot.work_version 只由 bump_robot_versions 递增（订单/指令变化）。指令和当前订单接口
+（WORK_SCOPES）的 ETag 使用它，频繁的遥测和心跳不会让这两个接口的缓存失效。
+
+轮询接口用 (接口, 机器人ID, 版本) 生成 ETag，请求带 If-None-Match 且版本未变时
+直接返回 304，不再查询订单表和指令表。
+"""
+from django.db.models import F
+from rest_framework.response import Response
+
+
+# 只依赖订单/指令的接口
+WORK_SCOPES = ('commands', 'current_orders')
+
+
+def bump_robot_versions(*robot_ids):
+    """一次 UPDATE 递增多个机器人的版本和订单/指令版本"""
+    from .models import Robot
+
+    ids = {robot_id for robot_id in robot_ids if robot_id is not None}
+    if ids:
+        Robot.objects.filter(id__in=ids).update(
+            version=F('version') + 1, work_version=F('work_version') + 1
+        )
+
+
+def robot_etag(scope, robot, *parts):
+    """parts 为响应中不随版本变化的其他字段（如机器人状态）"""
+    if scope in WORK_SCOPES:
+        tag = f"w{robot.work_version}"
+    else:
+        tag = f"v{robot.version}"
+    return f'W/"robot-{robot.id}-{scope}-{"-".join([tag, *map(str, parts)])}"'
+
+
+def etag_matches(request, etag):
+    """If-None-Match 是否包含该 ETag（弱比较）"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    target = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def not_modified_response(etag):
+    response = Response(status=304)
+    return with_etag(response, etag)
+
+
+def with_etag(response, etag):
+    """附加 ETag，并要求客户端每次都重新验证"""
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,23 +1,45 @@
 from django.shortcuts import render
+from django.views.decorators.http import require_safe
 
 # Create your views here.
 from rest_framework import viewsets, permissions, status
 from .models import DeliveryOrder, Robot, Message, RobotCommand
-from .serializers import DeliveryOrderSerializer, RobotSerializer, UserSerializer, MessageSerializer
+from .serializers import DeliveryOrderSerializer, RobotSerializer, UserSerializer, MessageSerializer, SystemLogSerializer, SlowQuerySerializer, CpuProfileSerializer
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.contrib.auth import get_user_model
-from .utils import generate_signed_payload, generate_qr_code, generate_simple_qr_code
+from .utils import generate_signed_payload, generate_simple_qr_code
+from .fieldsets import SparseQuerysetMixin
+from .pagination import KeysetPagination, TimestampKeysetPagination, CreatedAtKeysetPagination
+from .exports import export_response, SYSTEM_LOG_COLUMNS, ORDER_COLUMNS, FORMATS as EXPORT_FORMATS
+from .log_archive import archived_logs, archive_totals
+from .streaming import is_asgi_request
+from .cpu_profiler import profiler_control, profile_file_path, get_cpu_profiler_config
+from .order_payloads import order_payload, order_payload_queryset, delivery_route
 from rest_framework.permissions import IsAdminUser, AllowAny
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser
 from pyzbar.pyzbar import decode
 from PIL import Image
-import json, hashlib, base64
+import json, hashlib, base64, time
 from django.conf import settings
+from django.db import connection, transaction
 from django.utils import timezone
-from .models import SystemLog
-from django.db.models import Count, Q
+from .models import SystemLog, TrafficRollup, SlowQuery, CpuProfile
+from .notifications import command_notifier
+from .commands import serialize_command, complete_command, complete_commands, CommandAlreadyProcessed, MAX_RESULT_BATCH
+from .websocket import robot_connections
+from .sweeper import not_timed_out, expire_timed_out_commands, purge_finished_commands
+from .versioning import bump_robot_versions, robot_etag, etag_matches, not_modified_response, with_etag
+from .telemetry import apply_telemetry, TelemetryError, TelemetryConflict
+from .presence import presence, get_presence_config
+from .fleet import get_fleet_snapshot, robot_order_summary
+from .telemetry_history import query_history, choose_resolution, RESOLUTIONS as HISTORY_RESOLUTIONS
+from .rollups import get_traffic_rollup_config, minute_bucket, WEBSOCKET_METHOD
+from django.db.models import Count, Q, Sum, Max, Avg
+from django.db.models.functions import Coalesce
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils.dateparse import parse_datetime
 
 
 
@@ -43,6 +65,8 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
+    cursor_ordering = ('id',)
 
     @action(detail=False, methods=['get'], url_path='me')
     def get_current_user(self, request):
@@ -70,9 +94,10 @@ class UserViewSet(viewsets.ModelViewSet):
 
 
 # ✅ 学生 / 老师订单接口
-class DeliveryOrderViewSet(viewsets.ModelViewSet):
+class DeliveryOrderViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = DeliveryOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtKeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -90,17 +115,21 @@ class DeliveryOrderViewSet(viewsets.ModelViewSet):
             'package_type': order.package_type
         }
         
-        # 生成简单二维码数据
+        # 生成简单二维码数据；图片由 /api/orders/<id>/qr.png 按需渲染，不再以 base64 存入订单
         qr_content = generate_simple_qr_code(order.id, order.student.id)
         
-        # 生成二维码图片
-        qr_base64 = generate_qr_code({'payload_data': qr_content})
-        
         # 保存二维码相关数据
-        order.qr_code_url = qr_base64
         order.qr_payload_data = qr_content
         order.qr_signature = None  # 简化版本不需要签名
-        order.save()
+        order.save(update_fields=['qr_payload_data', 'qr_signature'])
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        流式导出订单（教师导出全部，学生导出自己的订单）
+        GET /api/orders/export/?fmt=ndjson|csv&gzip=1
+        """
+        return _export(request, self.get_queryset(), ORDER_COLUMNS, 'orders')
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -128,9 +157,10 @@ class DeliveryOrderViewSet(viewsets.ModelViewSet):
 
 
 # ✅ 配送人员专属订单操作接口
-class DispatchOrderViewSet(viewsets.ModelViewSet):
+class DispatchOrderViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = DeliveryOrderSerializer
     permission_classes = [IsDispatcher]
+    pagination_class = CreatedAtKeysetPagination
 
     def get_queryset(self):
         status_filter = self.request.query_params.get("status")
@@ -174,40 +204,12 @@ class DispatchOrderViewSet(viewsets.ModelViewSet):
         
         # 如果状态更新为"已分配"或"配送中"，返回该订单的完整信息给机器人
         if new_status in ['ASSIGNED', 'DELIVERING']:
-            order_data = {
-                "order_id": instance.id,
-                "status": instance.status,
-                "student": {
-                    "id": instance.student.id,
-                    "name": instance.student.username,
-                    "email": instance.student.email,
-                    "first_name": instance.student.first_name,
-                    "last_name": instance.student.last_name,
-                },
-                "package_info": {
-                    "type": instance.package_type,
-                    "weight": instance.weight,
-                    "fragile": instance.fragile,
-                    "description": instance.description,
-                },
-                "pickup_location": {
-                    "building": instance.pickup_building,
-                    "instructions": instance.pickup_instructions,
-                },
-                "delivery_location": {
-                    "building": instance.delivery_building,
-                    "room": instance.delivery_room,
-                },
-                "qr_code_data": {
-                    "payload": instance.qr_payload_data,
-                    "signature": instance.qr_signature,
-                    "qr_image_url": instance.qr_code_url,
-                },
-                "delivery_priority": "normal",
-                "estimated_time": "15分钟",
-                "action": "order_loaded",  # 标识这是装货完成的订单
-                "timestamp": instance.updated_at.isoformat() if hasattr(instance, 'updated_at') else None
-            }
+            order_data = order_payload(
+                instance,
+                request,
+                action="order_loaded",  # 标识这是装货完成的订单
+                timestamp=instance.updated_at.isoformat() if hasattr(instance, 'updated_at') else None
+            )
             
             return Response({
                 "detail": f"订单 {instance.id} 状态已更新为 {new_status}",
@@ -219,8 +221,42 @@ class DispatchOrderViewSet(viewsets.ModelViewSet):
         return Response(self.get_serializer(instance).data)
 
 
+def _parse_time_param(value):
+    """查询参数中的时间：ISO 8601 或 Unix 时间戳（秒），为空时返回 None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _export(request, queryset, columns, name):
+    """?fmt=ndjson|csv&gzip=1 的流式导出响应"""
+    fmt = request.query_params.get('fmt', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return Response({"detail": f"fmt 只支持 {', '.join(EXPORT_FORMATS)}"}, status=400)
+    use_gzip = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+    return export_response(queryset, columns, name, fmt=fmt, use_gzip=use_gzip,
+                           asynchronous=is_asgi_request(request))
+
+
+def _wait_for_commands(robot_id, notify_token, timeout):
+    """长轮询等待新指令通知；等待前归还数据库连接，挂起的轮询请求不占用 MySQL 连接，
+    唤醒后的查询会自动重新连接（处于事务中时不能关闭，保持原连接）"""
+    if not connection.in_atomic_block:
+        connection.close()
+    return command_notifier.wait(robot_id, notify_token, timeout)
+
+
 # ✅ 机器人接口
-class RobotViewSet(viewsets.ModelViewSet):
+class RobotViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Robot.objects.all()
     serializer_class = RobotSerializer
 
@@ -231,23 +267,16 @@ class RobotViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
-        """获取机器人详细状态"""
+        """获取机器人详细状态（支持 If-None-Match 条件请求）"""
         robot = self.get_object()
+        etag = robot_etag('status', robot)
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
         
         # 获取当前订单
-        current_orders = robot.get_current_orders()
-        orders_data = []
-        for order in current_orders:
-            order_data = {
-                "order_id": order.id,
-                "status": order.status,
-                "delivery_location": f"{order.delivery_building}-{order.delivery_room or '指定地点'}",
-                "qr_is_valid": order.qr_is_valid,
-                "qr_scanned_at": order.qr_scanned_at.isoformat() if order.qr_scanned_at else None
-            }
-            orders_data.append(order_data)
+        orders_data = [robot_order_summary(order) for order in robot.get_current_orders()]
         
-        return Response({
+        return with_etag(Response({
             "id": robot.id,
             "name": robot.name,
             "status": robot.status,
@@ -258,7 +287,15 @@ class RobotViewSet(viewsets.ModelViewSet):
             "last_update": robot.last_status_update.isoformat(),
             "delivery_start_time": robot.delivery_start_time.isoformat() if robot.delivery_start_time else None,
             "qr_wait_start_time": robot.qr_wait_start_time.isoformat() if robot.qr_wait_start_time else None
-        })
+        }), etag)
+
+    @action(detail=False, methods=['get'])
+    def fleet(self, request):
+        """车队快照：所有机器人的状态、门、电量、待执行指令数和进行中的订单
+
+        查询数量固定（机器人+指令计数一条，订单一条），结果短期缓存，见 core.fleet。
+        """
+        return Response(get_fleet_snapshot())
 
     @action(detail=True, methods=['post'])
     def control(self, request, pk=None):
@@ -279,13 +316,15 @@ class RobotViewSet(viewsets.ModelViewSet):
                 sent_at=timezone.now()
             )
             
-            # 记录控制指令（轮询模式下，机器人会定期检查命令）
+            # 指令提交后由信号推送给在线的 WebSocket 连接（其他工作进程的连接同样会被唤醒），
+            # 未连接 WebSocket 的机器人通过轮询获取
+            method = 'websocket' if robot_connections.is_connected(robot.id) else 'polling'
             SystemLog.log_info(
                 f"机器人 {robot.name} 收到指令: {action}",
                 log_type='ROBOT_CONTROL',
                 robot=robot,
                 user=request.user,
-                data={'command_id': command.id, 'action': action, 'method': 'polling'}
+                data={'command_id': command.id, 'action': action, 'method': method}
             )
             
             return Response({
@@ -294,7 +333,7 @@ class RobotViewSet(viewsets.ModelViewSet):
                 "action": action,
                 "status": "PENDING",
                 "sent_at": command.sent_at.isoformat(),
-                "method": "polling"
+                "method": method
             })
                 
         except Exception as e:
@@ -326,6 +365,8 @@ class RobotViewSet(viewsets.ModelViewSet):
                 executed_at=timezone.now(),
                 result='紧急按钮触发，门已立即开启'
             )
+            # 紧急开门指令会推送给在线的 WebSocket 连接
+            pushed = robot_connections.is_connected(robot.id)
             
             # 记录紧急事件日志
             SystemLog.log_warning(
@@ -337,7 +378,8 @@ class RobotViewSet(viewsets.ModelViewSet):
                     'command_id': command.id,
                     'action': 'emergency_open_door',
                     'door_status': 'OPEN',
-                    'emergency': True
+                    'emergency': True,
+                    'pushed': pushed
                 }
             )
             
@@ -349,7 +391,8 @@ class RobotViewSet(viewsets.ModelViewSet):
                 "door_status": "OPEN",
                 "sent_at": command.sent_at.isoformat(),
                 "executed_at": command.executed_at.isoformat(),
-                "emergency": True
+                "emergency": True,
+                "pushed": pushed
             })
                 
         except Exception as e:
@@ -364,59 +407,76 @@ class RobotViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def get_commands(self, request, pk=None):
-        """机器人获取待执行的指令"""
+        """机器人获取待执行的指令
+        
+        长轮询：GET /api/robots/<id>/get_commands/?wait=25
+        没有待执行指令时最多阻塞 wait 秒（上限 settings.LONG_POLL_MAX_WAIT），
+        有新指令创建时立即返回。
+        
+        条件请求：带 If-None-Match 且机器人版本未变时返回 304；
+        与 wait 同时使用时先等待变化，超时仍未变化再返回 304。
+        """
         robot = self.get_object()
+        presence.touch(robot.id)
         
         try:
-            from datetime import timedelta
-            
-            # 1. 自动处理超时的待执行命令（超过5分钟未执行）
-            # 注意：紧急按钮命令不会被超时处理
-            timeout_cutoff = timezone.now() - timedelta(minutes=5)
-            timeout_commands = RobotCommand.objects.filter(
-                robot=robot,
-                status='PENDING',
-                sent_at__lt=timeout_cutoff
-            ).exclude(command='emergency_open_door')  # 排除紧急按钮命令
-            
-            timeout_count = 0
-            for command in timeout_commands:
-                command.status = 'FAILED'
-                command.result = '命令执行超时'
-                command.executed_at = timezone.now()
-                command.save()
-                timeout_count += 1
-                
-                SystemLog.log_warning(
-                    f"命令执行超时: {command.command}",
-                    log_type='ROBOT_CONTROL',
-                    robot=robot,
-                    data={'command_id': command.id, 'command': command.command}
-                )
-            
-            # 2. 获取剩余的待执行指令
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            return Response({"detail": "wait 必须是数字"}, status=400)
+        wait = max(0.0, min(wait, getattr(settings, 'LONG_POLL_MAX_WAIT', 25)))
+        
+        try:
+            # 先取通知版本再查询，查询之后创建的指令也能唤醒等待
+            notify_token = command_notifier.token(robot.id)
+            
+            etag = robot_etag('commands', robot)
+            if etag_matches(request, etag):
+                if not wait:
+                    return not_modified_response(etag)
+                # 取通知版本之前可能已有变化，重新读取一次版本（只查机器人表）
+                work_version = Robot.objects.filter(pk=robot.pk).values_list('work_version', flat=True)
+                current_version = work_version.first()
+                if current_version == robot.work_version:
+                    if _wait_for_commands(robot.id, notify_token, wait):
+                        current_version = work_version.first()
+                if current_version == robot.work_version:
+                    return not_modified_response(etag)
+                robot.work_version = current_version
+                etag = robot_etag('commands', robot)
+                wait = 0.0
+            
+            # 1. 获取待执行指令；超时指令由后台清理任务（core.sweeper）统一标记失败，
+            #    这里只排除它们，不在机器人的轮询请求中写库
             pending_commands = RobotCommand.objects.filter(
                 robot=robot,
                 status='PENDING'
-            ).order_by('sent_at')
+            ).filter(not_timed_out()).select_related('sent_by').order_by('sent_at')
             
-            commands_data = []
-            for command in pending_commands:
-                commands_data.append({
-                    'command_id': command.id,
-                    'command': command.command,
-                    'command_display': command.get_command_display(),
-                    'sent_at': command.sent_at.isoformat(),
-                    'sent_by': command.sent_by.username if command.sent_by else None
-                })
+            # 2. 长轮询：没有指令时等待新指令通知，被唤醒后再查询一次
+            waited = 0.0
+            woken = False
+            if wait and not pending_commands.exists():
+                wait_started = time.monotonic()
+                woken = _wait_for_commands(robot.id, notify_token, wait)
+                waited = round(time.monotonic() - wait_started, 3)
+                if woken:
+                    pending_commands = pending_commands.all()
             
-            return Response({
+            commands_data = [serialize_command(command) for command in pending_commands]
+            
+            response = Response({
                 'robot_id': robot.id,
                 'robot_name': robot.name,
                 'pending_commands': commands_data,
                 'command_count': len(commands_data),
-                'timeout_processed': timeout_count
+                'long_poll': {
+                    'wait': wait,
+                    'waited': waited,
+                    'woken': woken
+                }
             })
+            # 等待期间被唤醒时版本已变化，不再提供 ETag，下次请求取完整数据
+            return response if woken else with_etag(response, etag)
             
         except Exception as e:
             SystemLog.log_error(
@@ -442,111 +502,7 @@ class RobotViewSet(viewsets.ModelViewSet):
             if command.status != 'PENDING':
                 return Response({"detail": "指令已被处理"}, status=400)
             
-            # 更新指令状态
-            command.status = 'COMPLETED'
-            command.executed_at = timezone.now()
-            command.result = result
-            command.save()
-            
-            # 根据指令类型执行相应操作
-            if command.command == 'open_door':
-                # 从ROS返回的result中解析真实门状态
-                if result and result.startswith('door_'):
-                    door_state = result.replace('door_', '').upper()
-                    if door_state in ['OPEN', 'CLOSED']:
-                        robot.set_door_status(door_state)
-                        SystemLog.log_success(
-                            f"机器人 {robot.name} 执行开门指令成功，真实门状态: {door_state}",
-                            log_type='ROBOT_CONTROL',
-                            robot=robot,
-                            data={'real_door_state': door_state, 'result': result}
-                        )
-                    else:
-                        # 如果解析失败，使用默认状态
-                        robot.set_door_status('OPEN')
-                        SystemLog.log_warning(
-                            f"机器人 {robot.name} 执行开门指令，但门状态解析失败: {result}",
-                            log_type='ROBOT_CONTROL',
-                            robot=robot,
-                            data={'result': result}
-                        )
-                else:
-                    # 如果没有返回门状态，使用默认状态
-                    robot.set_door_status('OPEN')
-                    SystemLog.log_success(
-                        f"机器人 {robot.name} 执行开门指令成功",
-                        log_type='ROBOT_CONTROL',
-                        robot=robot
-                    )
-            elif command.command == 'close_door':
-                # 从ROS返回的result中解析真实门状态
-                if result and result.startswith('door_'):
-                    door_state = result.replace('door_', '').upper()
-                    if door_state in ['OPEN', 'CLOSED']:
-                        robot.set_door_status(door_state)
-                        SystemLog.log_success(
-                            f"机器人 {robot.name} 执行关门指令成功，真实门状态: {door_state}",
-                            log_type='ROBOT_CONTROL',
-                            robot=robot,
-                            data={'real_door_state': door_state, 'result': result}
-                        )
-                    else:
-                        # 如果解析失败，使用默认状态
-                        robot.set_door_status('CLOSED')
-                        SystemLog.log_warning(
-                            f"机器人 {robot.name} 执行关门指令，但门状态解析失败: {result}",
-                            log_type='ROBOT_CONTROL',
-                            robot=robot,
-                            data={'result': result}
-                        )
-                else:
-                    # 如果没有返回门状态，使用默认状态
-                    robot.set_door_status('CLOSED')
-                    SystemLog.log_success(
-                        f"机器人 {robot.name} 执行关门指令成功",
-                        log_type='ROBOT_CONTROL',
-                        robot=robot
-                    )
-            elif command.command == 'start_delivery':
-                if robot.status == 'LOADING':
-                    robot.status = 'DELIVERING'
-                    robot.delivery_start_time = timezone.now()
-                    robot.save()
-                    
-                    # 更新所有分配给该机器人的订单状态为DELIVERING
-                    assigned_orders = DeliveryOrder.objects.filter(
-                        robot=robot,
-                        status='ASSIGNED'
-                    )
-                    for order in assigned_orders:
-                        order.status = 'DELIVERING'
-                        order.save()
-                    
-                    SystemLog.log_success(
-                        f"机器人 {robot.name} 执行开始配送指令成功",
-                        log_type='DELIVERY',
-                        robot=robot
-                    )
-            elif command.command == 'stop_robot':
-                robot.status = 'IDLE'
-                robot.delivery_start_time = None
-                robot.qr_wait_start_time = None
-                robot.save()
-                
-                # 将正在配送的订单状态重置为ASSIGNED
-                delivering_orders = DeliveryOrder.objects.filter(
-                    robot=robot,
-                    status='DELIVERING'
-                )
-                for order in delivering_orders:
-                    order.status = 'ASSIGNED'
-                    order.save()
-                
-                SystemLog.log_warning(
-                    f"机器人 {robot.name} 执行停止指令成功",
-                    log_type='ROBOT_CONTROL',
-                    robot=robot
-                )
+            complete_command(robot, command, result)
             
             return Response({
                 "message": f"指令执行成功",
@@ -557,6 +513,9 @@ class RobotViewSet(viewsets.ModelViewSet):
             
         except RobotCommand.DoesNotExist:
             return Response({"detail": "指令不存在"}, status=404)
+        except CommandAlreadyProcessed:
+            # 同一指令已通过 WebSocket 确认
+            return Response({"detail": "指令已被处理"}, status=400)
         except Exception as e:
             SystemLog.log_error(
                 f"执行指令失败: {str(e)}",
@@ -567,134 +526,200 @@ class RobotViewSet(viewsets.ModelViewSet):
             return Response({"detail": f"执行指令失败: {str(e)}"}, status=500)
 
     @action(detail=True, methods=['post'])
-    def update_status(self, request, pk=None):
-        """机器人状态反馈API"""
+    def execute_commands(self, request, pk=None):
+        """机器人批量报告指令执行结果
+        
+        请求体: {"results": [{"command_id": 1, "result": "door_open", "executed_at": "ISO时间"}, ...]}
+        按顺序在一个事务内处理，返回每条指令的处理结果
+        """
         robot = self.get_object()
+        items = request.data.get('results')
+        
+        if not isinstance(items, list) or not items:
+            return Response({"detail": "请提供指令结果列表 results"}, status=400)
+        if len(items) > MAX_RESULT_BATCH:
+            return Response({"detail": f"单次最多上报 {MAX_RESULT_BATCH} 条指令结果"}, status=400)
         
         try:
-            # 更新位置
-            location = request.data.get('location')
-            if location:
-                robot.update_location(location)
-            
-            # 更新电池
-            battery = request.data.get('battery')
-            if battery is not None:
-                robot.update_battery(battery)
-            
-            # 更新门状态
-            door_status = request.data.get('door_status')
-            if door_status in ['OPEN', 'CLOSED']:
-                robot.set_door_status(door_status)
-            
-            # 更新机器人状态
-            status = request.data.get('status')
-            if status in ['IDLE', 'LOADING', 'DELIVERING', 'MAINTENANCE', 'RETURNING']:
-                robot.status = status
-                robot.save()
-            
-            # 记录日志
-            SystemLog.log_info(
-                f"机器人 {robot.name} 状态更新: 位置={robot.current_location}, 电池={robot.battery_level}%, 门={robot.door_status}",
-                log_type='ROBOT_CONTROL',
-                robot=robot,
-                data=request.data
-            )
+            outcomes = complete_commands(robot, items)
+            completed = sum(1 for outcome in outcomes if outcome['outcome'] == 'COMPLETED')
             
             return Response({
-                "message": "状态更新成功",
+                "message": f"已处理 {completed}/{len(outcomes)} 条指令结果",
                 "robot_id": robot.id,
-                "status": robot.status,
-                "location": robot.current_location,
-                "battery": robot.battery_level,
-                "door_status": robot.door_status
+                "completed": completed,
+                "results": outcomes
             })
             
         except Exception as e:
             SystemLog.log_error(
-                f"机器人状态更新失败: {str(e)}",
+                f"批量执行指令失败: {str(e)}",
                 log_type='ROBOT_CONTROL',
                 robot=robot,
-                data=request.data
+                data={'count': len(items)}
             )
-            return Response({"detail": f"状态更新失败: {str(e)}"}, status=500)
+            return Response({"detail": f"批量执行指令失败: {str(e)}"}, status=500)
 
     @action(detail=True, methods=['post'])
-    def heartbeat(self, request, pk=None):
-        """机器人心跳接口"""
+    def update_status(self, request, pk=None):
+        """机器人状态反馈API
+
+        兼容两种请求体: 字段直接放在顶层，或放在 data 中。只写入有变化的字段，一条 UPDATE 完成。
+        """
         robot = self.get_object()
-        
+        sample = request.data.get('data', request.data)
+
         try:
-            # 更新机器人最后活动时间
-            robot.last_status_update = timezone.now()
-            robot.save()
-            
-            SystemLog.log_info(
-                f"机器人 {robot.name} 心跳",
+            apply_telemetry(robot, [sample])
+        except TelemetryError as e:
+            return Response({"detail": str(e)}, status=400)
+        except Exception as e:
+            SystemLog.log_error(
+                f"机器人状态更新失败: {str(e)}",
                 log_type='ROBOT_CONTROL',
                 robot=robot,
                 data=request.data
             )
-            
+            return Response({"detail": f"状态更新失败: {str(e)}"}, status=500)
+
+        return Response({
+            "message": "状态更新成功",
+            "robot_id": robot.id,
+            "status": robot.status,
+            "location": robot.current_location,
+            "battery": robot.battery_level,
+            "door_status": robot.door_status,
+            "timestamp": robot.last_status_update.isoformat()
+        })
+
+    @action(detail=True, methods=['get', 'post'])
+    def telemetry(self, request, pk=None):
+        """遥测批量上报 / 历史查询API
+
+        POST 请求体: {"samples": [{"timestamp": ..., "battery": ..., "location": ..., "door_status": ..., "status": ...}],
+                      "expected_version": 可选}
+        也可以直接提交单条采样。采样按时间合并后一次写库；expected_version 与当前版本不符时返回 409。
+
+        GET ?from=&to=&resolution=raw|1m|1h|auto 查询历史（默认最近 24 小时，auto 按跨度选择分辨率）
+        """
+        robot = self.get_object()
+        if request.method == 'GET':
+            return self._telemetry_history(request, robot)
+
+        samples = request.data.get('samples')
+        if samples is None:
+            samples = [request.data]
+        if not isinstance(samples, list):
+            return Response({"detail": "samples 必须是列表"}, status=400)
+
+        expected_version = request.data.get('expected_version')
+        if expected_version is not None:
+            try:
+                expected_version = int(expected_version)
+            except (TypeError, ValueError):
+                return Response({"detail": "expected_version 格式错误"}, status=400)
+
+        try:
+            result = apply_telemetry(robot, samples, expected_version=expected_version)
+        except TelemetryError as e:
+            return Response({"detail": str(e)}, status=400)
+        except TelemetryConflict as e:
             return Response({
-                'robot_id': robot.id,
-                'robot_name': robot.name,
-                'status': 'online',
-                'timestamp': timezone.now().isoformat()
-            })
-            
+                "detail": "机器人状态已被其他请求修改",
+                "current_version": e.current_version
+            }, status=409)
         except Exception as e:
             SystemLog.log_error(
-                f"机器人心跳处理失败: {str(e)}",
+                f"机器人遥测上报失败: {str(e)}",
                 log_type='ROBOT_CONTROL',
-                robot=robot
+                robot=robot,
+                data={'count': len(samples)}
             )
-            return Response({"detail": f"心跳处理失败: {str(e)}"}, status=500)
+            return Response({"detail": f"遥测上报失败: {str(e)}"}, status=500)
+
+        return Response({
+            "robot_id": robot.id,
+            "samples": result['samples'],
+            "updated_fields": result['fields'],
+            "version": result['version'],
+            "timestamp": robot.last_status_update.isoformat()
+        })
+
+    def _telemetry_history(self, request, robot):
+        now = timezone.now()
+        try:
+            end = _parse_time_param(request.query_params.get('to')) or now
+            start = _parse_time_param(request.query_params.get('from')) or end - timedelta(hours=24)
+        except ValueError as e:
+            return Response({"detail": f"时间格式错误: {e}"}, status=400)
+        if start >= end:
+            return Response({"detail": "from 必须早于 to"}, status=400)
+
+        resolution = request.query_params.get('resolution', 'auto')
+        if resolution == 'auto':
+            resolution = choose_resolution(start, end, now)
+        elif resolution not in HISTORY_RESOLUTIONS:
+            return Response({"detail": f"resolution 只能是 auto / {' / '.join(HISTORY_RESOLUTIONS)}"}, status=400)
+
+        points, truncated = query_history(robot.id, start, end, resolution)
+        return Response({
+            "robot_id": robot.id,
+            "resolution": resolution,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "count": len(points),
+            "truncated": truncated,
+            "points": points
+        })
 
     @action(detail=True, methods=['post'])
-    def update_status(self, request, pk=None):
-        """机器人状态更新接口"""
+    def heartbeat(self, request, pk=None):
+        """机器人心跳接口
+
+        只记录到在线状态表，last_status_update 按 ROBOT_PRESENCE['FLUSH_INTERVAL'] 节流写库，
+        SystemLog 只记录上线/离线跳变。
+        """
         robot = self.get_object()
         
         try:
-            # 更新机器人状态
-            status_data = request.data.get('data', {})
-            
-            if 'battery' in status_data:
-                robot.battery_level = status_data['battery']
-            
-            if 'location' in status_data:
-                robot.current_location = status_data['location']
-            
-            if 'door_status' in status_data:
-                door_status = status_data['door_status'].upper()
-                if door_status in ['OPEN', 'CLOSED']:
-                    robot.door_status = door_status
-            
-            robot.last_status_update = timezone.now()
-            robot.save()
-            
-            SystemLog.log_info(
-                f"机器人 {robot.name} 状态更新",
-                log_type='ROBOT_CONTROL',
-                robot=robot,
-                data=status_data
-            )
+            presence.touch(robot.id)
             
             return Response({
                 'robot_id': robot.id,
                 'robot_name': robot.name,
-                'status': 'updated',
+                'status': 'online',
                 'timestamp': timezone.now().isoformat()
             })
             
         except Exception as e:
             SystemLog.log_error(
-                f"机器人状态更新失败: {str(e)}",
+                f"机器人心跳处理失败: {str(e)}",
                 log_type='ROBOT_CONTROL',
                 robot=robot
             )
-            return Response({"detail": f"状态更新失败: {str(e)}"}, status=500)
+            return Response({"detail": f"心跳处理失败: {str(e)}"}, status=500)
+
+    @action(detail=False, methods=['get'])
+    def online(self, request):
+        """当前在线的机器人（最近 OFFLINE_AFTER 秒内有心跳、轮询或状态上报）"""
+        now = timezone.now()
+        online = presence.online()
+        robots = Robot.objects.filter(id__in=online).only('id', 'name', 'status').order_by('id')
+        return Response({
+            'count': len(robots),
+            'offline_after': get_presence_config()['OFFLINE_AFTER'],
+            'robots': [
+                {
+                    'robot_id': robot.id,
+                    'name': robot.name,
+                    'status': robot.status,
+                    'last_seen': online[robot.id].isoformat(),
+                    'seconds_ago': round((now - online[robot.id]).total_seconds(), 1),
+                }
+                for robot in robots
+            ],
+            'timestamp': now.isoformat()
+        })
 
     @action(detail=True, methods=['post'])
     def qr_scanned(self, request, pk=None):
@@ -952,70 +977,26 @@ class RobotViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def current_orders(self, request, pk=None):
-        """获取机器人当前订单的完整信息"""
+        """获取机器人当前订单的完整信息（支持 If-None-Match 条件请求）"""
         robot = self.get_object()
-        orders = robot.get_current_orders()
+        etag = robot_etag('current_orders', robot, robot.status)
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        orders = list(order_payload_queryset(robot.get_current_orders()))
         
-        # 构建订单详细信息
-        orders_data = []
-        for order in orders:
-            order_data = {
-                "order_id": order.id,
-                "status": order.status,
-                "student": {
-                    "id": order.student.id,
-                    "name": order.student.username,
-                    "email": order.student.email,
-                    "first_name": order.student.first_name,
-                    "last_name": order.student.last_name,
-                },
-                "package_info": {
-                    "type": order.package_type,
-                    "weight": order.weight,
-                    "fragile": order.fragile,
-                    "description": order.description,
-                },
-                "pickup_location": {
-                    "building": order.pickup_building,
-                    "instructions": order.pickup_instructions,
-                },
-                "delivery_location": {
-                    "building": order.delivery_building,
-                    "room": order.delivery_room,
-                },
-                "qr_code_data": {
-                    "payload": order.qr_payload_data,
-                    "signature": order.qr_signature,
-                    "qr_image_url": order.qr_code_url,
-                },
-                "delivery_priority": "normal",
-                "estimated_time": "15分钟"
-            }
-            orders_data.append(order_data)
-        
-        # 生成配送路线
-        delivery_route = []
-        for i, order in enumerate(orders, 1):
-            delivery_route.append({
-                "sequence": i,
-                "order_id": order.id,
-                "location": f"{order.delivery_building}-{order.delivery_room or '指定地点'}",
-                "estimated_arrival": "10:30"  # 这里可以根据实际路线计算
-            })
-        
-        return Response({
+        return with_etag(Response({
             "robot_id": robot.id,
             "robot_name": robot.name,
             "status": robot.status,
-            "current_orders": orders_data,
-            "delivery_route": delivery_route,
+            "current_orders": [order_payload(order, request) for order in orders],
+            "delivery_route": delivery_route(orders),
             "summary": {
                 "total_orders": len(orders),
                 "loaded_orders": len([o for o in orders if o.status == 'DELIVERING']),
                 "total_distance": "2.5km",  # 这里可以根据实际路线计算
                 "estimated_total_time": f"{len(orders) * 15}分钟"
             }
-        })
+        }), etag)
 
     @action(detail=True, methods=['post'])
     def receive_orders(self, request, pk=None):
@@ -1027,73 +1008,37 @@ class RobotViewSet(viewsets.ModelViewSet):
             return Response({"detail": "请提供订单ID列表"}, status=400)
         
         try:
-            orders = DeliveryOrder.objects.filter(id__in=order_ids, status='PENDING')
-            if not orders.exists():
-                return Response({"detail": "没有找到待分配的订单"}, status=400)
-            
-            # 更新订单状态和机器人关联
-            orders.update(status='ASSIGNED', robot=robot)
-            
-            # 更新机器人状态
-            robot.status = 'LOADING'
-            robot.save()
+            with transaction.atomic():
+                # 先锁定并取出待分配订单的ID，更新后按ID重新读取（按原条件读取会因状态已变而为空）
+                assigned_ids = list(
+                    DeliveryOrder.objects.select_for_update()
+                    .filter(id__in=order_ids, status='PENDING')
+                    .order_by('id')
+                    .values_list('id', flat=True)
+                )
+                if not assigned_ids:
+                    return Response({"detail": "没有找到待分配的订单"}, status=400)
+                
+                # 更新订单状态和机器人关联（update 不触发信号，单独使订单/指令 ETag 失效）
+                DeliveryOrder.objects.filter(id__in=assigned_ids).update(status='ASSIGNED', robot=robot)
+                bump_robot_versions(robot.id)
+                
+                # 更新机器人状态
+                robot.status = 'LOADING'
+                robot.save()
             
             # 构建完整的订单信息数据（立即返回给机器人）
-            orders_data = []
-            for order in orders:
-                order_data = {
-                    "order_id": order.id,
-                    "status": order.status,
-                    "student": {
-                        "id": order.student.id,
-                        "name": order.student.username,
-                        "email": order.student.email,
-                        "first_name": order.student.first_name,
-                        "last_name": order.student.last_name,
-                    },
-                    "package_info": {
-                        "type": order.package_type,
-                        "weight": order.weight,
-                        "fragile": order.fragile,
-                        "description": order.description,
-                    },
-                    "pickup_location": {
-                        "building": order.pickup_building,
-                        "instructions": order.pickup_instructions,
-                    },
-                    "delivery_location": {
-                        "building": order.delivery_building,
-                        "room": order.delivery_room,
-                    },
-                    "qr_code_data": {
-                        "payload": order.qr_payload_data,
-                        "signature": order.qr_signature,
-                        "qr_image_url": order.qr_code_url,
-                    },
-                    "delivery_priority": "normal",
-                    "estimated_time": "15分钟"
-                }
-                orders_data.append(order_data)
-            
-            # 生成配送路线
-            delivery_route = []
-            for i, order in enumerate(orders, 1):
-                delivery_route.append({
-                    "sequence": i,
-                    "order_id": order.id,
-                    "location": f"{order.delivery_building}-{order.delivery_room or '指定地点'}",
-                    "estimated_arrival": "10:30"
-                })
+            orders = list(order_payload_queryset(DeliveryOrder.objects.filter(id__in=assigned_ids).order_by('id')))
             
             return Response({
-                "detail": f"成功分配 {orders.count()} 个订单给机器人 {robot.name}",
+                "detail": f"成功分配 {len(orders)} 个订单给机器人 {robot.name}",
                 "robot_id": robot.id,
                 "robot_name": robot.name,
                 "status": robot.status,
-                "assigned_orders": list(orders.values_list('id', flat=True)),
+                "assigned_orders": assigned_ids,
                 # 立即返回完整的订单信息给机器人
-                "current_orders": orders_data,
-                "delivery_route": delivery_route,
+                "current_orders": [order_payload(order, request) for order in orders],
+                "delivery_route": delivery_route(orders),
                 "summary": {
                     "total_orders": len(orders),
                     "loaded_orders": 0,  # 刚开始装货，已装货数量为0
@@ -1181,47 +1126,9 @@ class RobotViewSet(viewsets.ModelViewSet):
         robot = self.get_object()
         
         try:
-            from datetime import timedelta
-            
-            # 1. 清理已完成的命令（保留最近3天）
-            completed_cutoff = timezone.now() - timedelta(days=3)
-            completed_deleted = RobotCommand.objects.filter(
-                robot=robot,
-                status__in=['COMPLETED', 'FAILED', 'CANCELLED'],
-                sent_at__lt=completed_cutoff
-            ).delete()[0]
-            
-            # 2. 处理超时的待执行命令（超过5分钟未执行）
-            # 注意：紧急按钮命令不会被超时处理
-            timeout_cutoff = timezone.now() - timedelta(minutes=5)
-            timeout_commands = RobotCommand.objects.filter(
-                robot=robot,
-                status='PENDING',
-                sent_at__lt=timeout_cutoff
-            ).exclude(command='emergency_open_door')  # 排除紧急按钮命令
-            
-            timeout_count = timeout_commands.count()
-            for command in timeout_commands:
-                command.status = 'FAILED'
-                command.result = '命令执行超时'
-                command.executed_at = timezone.now()
-                command.save()
-                
-                SystemLog.log_warning(
-                    f"命令执行超时: {command.command}",
-                    log_type='ROBOT_CONTROL',
-                    robot=robot,
-                    user=request.user,
-                    data={'command_id': command.id, 'command': command.command}
-                )
-            
-            # 3. 清理超时的失败命令（保留最近1天）
-            failed_cutoff = timezone.now() - timedelta(days=1)
-            failed_deleted = RobotCommand.objects.filter(
-                robot=robot,
-                status='FAILED',
-                sent_at__lt=failed_cutoff
-            ).delete()[0]
+            # 超时处理与过期清理和后台清理任务共用同一套集合操作
+            timeout_count = expire_timed_out_commands(robot=robot, user=request.user)
+            completed_deleted, failed_deleted = purge_finished_commands(robot=robot)
             
             total_deleted = completed_deleted + failed_deleted
             
@@ -1448,6 +1355,7 @@ class RobotViewSet(viewsets.ModelViewSet):
 class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all().order_by('-created_at')
     serializer_class = MessageSerializer
+    pagination_class = CreatedAtKeysetPagination
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -1457,11 +1365,12 @@ class MessageViewSet(viewsets.ModelViewSet):
 
 class SystemLogViewSet(viewsets.ReadOnlyModelViewSet):
     """系统日志视图集"""
-    serializer_class = MessageSerializer  # 临时使用，需要创建专门的序列化器
+    serializer_class = SystemLogSerializer
     permission_classes = [IsAdminUserOnly]
+    pagination_class = TimestampKeysetPagination
     
     def get_queryset(self):
-        queryset = SystemLog.objects.all()
+        queryset = SystemLog.objects.select_related('user')
         
         # 过滤条件
         level = self.request.query_params.get('level')
@@ -1491,6 +1400,23 @@ class SystemLogViewSet(viewsets.ReadOnlyModelViewSet):
         
         return queryset
     
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        流式导出日志，过滤参数与列表相同
+        GET /api/logs/export/?fmt=ndjson|csv&gzip=1&level=ERROR&start_date=2026-10-01
+        """
+        return _export(request, self.get_queryset(), SYSTEM_LOG_COLUMNS, 'system-logs')
+    
+    def keyset_extra_rows(self, ordering, position, limit):
+        """start_date / end_date 覆盖已归档的日期时，从归档文件补充日志"""
+        if self.action != 'list':
+            return []
+        params = self.request.query_params
+        filters = {name: params.get(name) for name in
+                   ('level', 'log_type', 'robot_id', 'order_id', 'start_date', 'end_date')}
+        return archived_logs(filters, position, descending=ordering[0].startswith('-'), limit=limit)
+    
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """获取日志统计摘要"""
@@ -1501,8 +1427,13 @@ class SystemLogViewSet(viewsets.ReadOnlyModelViewSet):
         yesterday = datetime.now() - timedelta(days=1)
         recent_logs = SystemLog.objects.filter(timestamp__gte=yesterday)
         
+        archived_days, archived_rows = archive_totals()
+        live_logs = SystemLog.objects.count()
         summary = {
-            'total_logs': SystemLog.objects.count(),
+            'total_logs': live_logs + archived_rows,
+            'live_logs': live_logs,
+            'archived_logs': archived_rows,
+            'archived_days': archived_days,
             'recent_logs_24h': recent_logs.count(),
             'by_level': dict(recent_logs.values('level').annotate(count=Count('id')).values_list('level', 'count')),
             'by_type': dict(recent_logs.values('log_type').annotate(count=Count('id')).values_list('log_type', 'count')),
@@ -1513,6 +1444,139 @@ class SystemLogViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(summary)
 
 
+class SlowQueryViewSet(viewsets.ReadOnlyModelViewSet):
+    """慢 SQL 视图集（SQL_PROFILING 开启时由 SQLProfilingMiddleware 写入）"""
+    serializer_class = SlowQuerySerializer
+    permission_classes = [IsAdminUserOnly]
+    pagination_class = CreatedAtKeysetPagination
+
+    def get_queryset(self):
+        queryset = SlowQuery.objects.all()
+        fingerprint = self.request.query_params.get('fingerprint')
+        if fingerprint:
+            queryset = queryset.filter(fingerprint=fingerprint)
+        route = self.request.query_params.get('route')
+        if route:
+            queryset = queryset.filter(route=route)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        """按语句指纹汇总最近 since_hours 小时（默认 24）的慢 SQL，按总耗时排序"""
+        try:
+            since_hours = max(1, min(int(request.query_params.get('since_hours', 24)), 24 * 30))
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            return Response({'error': 'since_hours 和 limit 必须是整数'}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = timezone.now() - timedelta(hours=since_hours)
+        groups = list(
+            self.get_queryset()
+            .filter(created_at__gte=since)
+            .values('fingerprint')
+            .annotate(
+                count=Count('id'),
+                total_ms=Sum('duration_ms'),
+                avg_ms=Avg('duration_ms'),
+                max_ms=Max('duration_ms'),
+                last_seen=Max('created_at'),
+                sample_id=Max('id'),
+            )
+            .order_by('-total_ms')[:limit]
+        )
+        samples = dict(
+            SlowQuery.objects.filter(id__in=[group['sample_id'] for group in groups])
+            .values_list('id', 'sql')
+        )
+        routes = {}
+        for fingerprint, route in (
+            SlowQuery.objects.filter(fingerprint__in=[group['fingerprint'] for group in groups], created_at__gte=since)
+            .values_list('fingerprint', 'route').order_by().distinct()
+        ):
+            routes.setdefault(fingerprint, []).append(route)
+
+        return Response({
+            'since_hours': since_hours,
+            'results': [{
+                'fingerprint': group['fingerprint'],
+                'count': group['count'],
+                'total_ms': round(group['total_ms'], 2),
+                'avg_ms': round(group['avg_ms'], 2),
+                'max_ms': round(group['max_ms'], 2),
+                'last_seen': group['last_seen'],
+                'routes': sorted(routes.get(group['fingerprint'], [])),
+                'sql': samples.get(group['sample_id'], ''),
+            } for group in groups],
+        })
+
+
+class CpuProfileViewSet(viewsets.ReadOnlyModelViewSet):
+    """CPU 采样记录视图集：查看、下载折叠栈文件，开启/关闭采样"""
+    serializer_class = CpuProfileSerializer
+    permission_classes = [IsAdminUserOnly]
+    pagination_class = CreatedAtKeysetPagination
+
+    def get_queryset(self):
+        queryset = CpuProfile.objects.all()
+        route = self.request.query_params.get('route')
+        if route:
+            queryset = queryset.filter(route=route)
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """下载折叠栈文件（flamegraph.pl / speedscope 可直接打开）"""
+        from django.http import FileResponse, Http404
+
+        profile = self.get_object()
+        try:
+            stream = open(profile_file_path(profile), 'rb')
+        except FileNotFoundError:
+            raise Http404('采样文件已被清理')
+        return FileResponse(stream, as_attachment=True, filename=profile.file, content_type='text/plain; charset=utf-8')
+
+    @action(detail=False, methods=['get', 'post', 'delete'])
+    def control(self, request):
+        """查看 / 开启（routes、sample_rate、duration_seconds）/ 关闭 CPU 采样"""
+        if request.method == 'DELETE':
+            profiler_control.disable()
+            SystemLog.log_info("CPU 采样已关闭", 'SYSTEM', user=request.user)
+            return Response({'active': False})
+
+        if request.method == 'POST':
+            routes = request.data.get('routes') or []
+            if isinstance(routes, str):
+                routes = [routes]
+            try:
+                sample_rate = float(request.data.get('sample_rate', 1.0))
+                duration = int(request.data.get('duration_seconds', 600))
+            except (TypeError, ValueError):
+                return Response({'error': 'sample_rate 必须是数字，duration_seconds 必须是整数'}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(routes, list) or not all(isinstance(route, str) for route in routes):
+                return Response({'error': 'routes 必须是 URL 名称列表'}, status=status.HTTP_400_BAD_REQUEST)
+            if not 0 < sample_rate <= 1 or duration <= 0:
+                return Response({'error': 'sample_rate 取值 (0, 1]，duration_seconds 必须大于 0'}, status=status.HTTP_400_BAD_REQUEST)
+
+            profiler_control.enable(routes, sample_rate, duration, user=request.user.username)
+            SystemLog.log_info(
+                "CPU 采样已开启: %s, 比例 %s, %s 秒", 'SYSTEM', user=request.user,
+                args=(', '.join(routes) or '全部', sample_rate, duration),
+                data={'routes': routes, 'sample_rate': sample_rate, 'duration_seconds': duration}
+            )
+
+        state = profiler_control.current()
+        if state is None:
+            return Response({'active': False, 'enabled': get_cpu_profiler_config()['ENABLED']})
+        return Response({
+            'active': True,
+            'enabled': get_cpu_profiler_config()['ENABLED'],
+            'routes': state['routes'],
+            'sample_rate': state['sample_rate'],
+            'expires_at': datetime.fromtimestamp(state['expires_at'], tz=dt_timezone.utc),
+            'updated_by': state.get('updated_by'),
+        })
+
+
 class QRCodeVerifyView(APIView):
     permission_classes = [AllowAny]
     parser_classes = [MultiPartParser]
@@ -1598,9 +1662,20 @@ class QRCodeVerifyView(APIView):
             }, status=500)
 
 
+class NetworkMonitorPagination(TimestampKeysetPagination):
+    """兼容旧的 limit 参数（同样受 max_page_size 限制）"""
+    page_size = 100
+
+    def get_page_size(self, request):
+        if self.page_size_query_param not in request.query_params and 'limit' in request.query_params:
+            self.page_size_query_param = 'limit'
+        return super().get_page_size(request)
+
+
 class NetworkMonitorViewSet(viewsets.ReadOnlyModelViewSet):
     """网络监控视图集 - 实时查看所有网络活动"""
     permission_classes = [IsAdminUserOnly]
+    pagination_class = NetworkMonitorPagination
     
     def get_queryset(self):
         """获取网络相关的日志"""
@@ -1610,9 +1685,8 @@ class NetworkMonitorViewSet(viewsets.ReadOnlyModelViewSet):
         log_type = self.request.query_params.get('log_type', '')
         client_ip = self.request.query_params.get('client_ip', '')
         user_id = self.request.query_params.get('user_id', '')
-        limit = int(self.request.query_params.get('limit', 100))
         
-        queryset = SystemLog.objects.filter(
+        queryset = SystemLog.objects.select_related('user').filter(
             log_type__in=['NETWORK_REQUEST', 'NETWORK_RESPONSE', 'NETWORK_ERROR', 'WEBSOCKET_CONNECTION']
         )
         
@@ -1620,23 +1694,23 @@ class NetworkMonitorViewSet(viewsets.ReadOnlyModelViewSet):
         if log_type:
             queryset = queryset.filter(log_type=log_type)
         
-        # 按IP过滤
+        # 按IP过滤（前缀匹配，可使用 client_ip 索引）
         if client_ip:
-            queryset = queryset.filter(data__client_ip__icontains=client_ip)
+            queryset = queryset.filter(client_ip__startswith=client_ip)
         
         # 按用户过滤
         if user_id:
             queryset = queryset.filter(user_id=user_id)
         
-        return queryset.order_by('-timestamp')[:limit]
+        return queryset
     
     def list(self, request, *args, **kwargs):
-        """获取网络监控数据"""
-        queryset = self.get_queryset()
+        """获取网络监控数据（日志按游标分页，next / previous 为前后页地址）"""
+        page = self.paginate_queryset(self.get_queryset())
         
         # 序列化数据
         logs_data = []
-        for log in queryset:
+        for log in page:
             log_data = {
                 'id': log.id,
                 'timestamp': log.timestamp.isoformat(),
@@ -1647,34 +1721,51 @@ class NetworkMonitorViewSet(viewsets.ReadOnlyModelViewSet):
                     'id': log.user.id,
                     'username': log.user.username
                 } if log.user else None,
+                'client_ip': log.client_ip,
+                'path': log.path,
+                'status_code': log.status_code,
+                'processing_time': log.processing_time,
                 'data': log.data,
             }
             logs_data.append(log_data)
         
-        # 统计信息
-        total_requests = SystemLog.objects.filter(log_type='NETWORK_REQUEST').count()
-        total_responses = SystemLog.objects.filter(log_type='NETWORK_RESPONSE').count()
-        total_errors = SystemLog.objects.filter(log_type='NETWORK_ERROR').count()
-        total_websockets = SystemLog.objects.filter(log_type='WEBSOCKET_CONNECTION').count()
+        # 统计信息（读取统计窗口内的分钟级汇总桶，不扫描日志表；WebSocket 连接以 method='WS' 计入汇总）
+        window_hours = get_traffic_rollup_config()['STATS_WINDOW_HOURS']
+        recent_rollups = TrafficRollup.objects.filter(bucket__gte=timezone.now() - timedelta(hours=window_hours))
+        is_websocket = Q(method=WEBSOCKET_METHOD)
+        totals = recent_rollups.aggregate(
+            total_requests=Sum('request_count', filter=~is_websocket),
+            total_errors=Sum('request_count', filter=~is_websocket & Q(status_class='5xx')),
+            total_websockets=Sum('request_count', filter=is_websocket),
+        )
+        total_requests = totals['total_requests'] or 0
+        total_responses = total_requests
+        total_errors = totals['total_errors'] or 0
+        total_websockets = totals['total_websockets'] or 0
         
-        # 获取最近的活跃用户
-        recent_users = SystemLog.objects.filter(
-            log_type__in=['NETWORK_REQUEST', 'NETWORK_RESPONSE'],
+        # 获取最近的活跃用户和客户端IP
+        recent_users = recent_rollups.filter(
             user__isnull=False
-        ).values('user__id', 'user__username').distinct()[:10]
+        ).values('user__id', 'user__username').annotate(
+            last_seen=Max('bucket')
+        ).order_by('-last_seen').values('user__id', 'user__username')[:10]
         
-        # 获取最近的客户端IP
-        recent_ips = SystemLog.objects.filter(
-            log_type__in=['NETWORK_REQUEST', 'NETWORK_RESPONSE']
-        ).values_list('data__client_ip', flat=True).distinct()[:10]
+        recent_ips = recent_rollups.exclude(
+            client_ip=''
+        ).values('client_ip').annotate(
+            last_seen=Max('bucket')
+        ).order_by('-last_seen').values_list('client_ip', flat=True)[:10]
         
         response_data = {
             'logs': logs_data,
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
             'statistics': {
                 'total_requests': total_requests,
                 'total_responses': total_responses,
                 'total_errors': total_errors,
                 'total_websockets': total_websockets,
+                'period': f'{window_hours}小时',
             },
             'recent_users': list(recent_users),
             'recent_ips': list(recent_ips),
@@ -1691,7 +1782,7 @@ class NetworkMonitorViewSet(viewsets.ReadOnlyModelViewSet):
         # 获取最近5分钟的网络活动
         five_minutes_ago = timezone.now() - timedelta(minutes=5)
         
-        recent_logs = SystemLog.objects.filter(
+        recent_logs = SystemLog.objects.select_related('user').filter(
             log_type__in=['NETWORK_REQUEST', 'NETWORK_RESPONSE', 'NETWORK_ERROR', 'WEBSOCKET_CONNECTION'],
             timestamp__gte=five_minutes_ago
         ).order_by('-timestamp')[:50]
@@ -1708,6 +1799,10 @@ class NetworkMonitorViewSet(viewsets.ReadOnlyModelViewSet):
                     'id': log.user.id,
                     'username': log.user.username
                 } if log.user else None,
+                'client_ip': log.client_ip,
+                'path': log.path,
+                'status_code': log.status_code,
+                'processing_time': log.processing_time,
                 'data': log.data,
             }
             logs_data.append(log_data)
@@ -1719,35 +1814,39 @@ class NetworkMonitorViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'])
     def connections(self, request):
-        """获取当前活跃连接"""
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # 获取最近1分钟的网络请求（模拟活跃连接）
-        one_minute_ago = timezone.now() - timedelta(minutes=1)
-        
-        # 获取活跃连接，按IP分组，获取每个IP的最新活动时间
-        active_connections_raw = SystemLog.objects.filter(
-            log_type='NETWORK_REQUEST',
-            timestamp__gte=one_minute_ago
-        ).values('data__client_ip', 'user__username', 'timestamp')
+        """获取当前活跃连接（最近 ACTIVE_WINDOW_SECONDS 秒内有请求的客户端）
+
+        读取流量汇总桶而不是 NETWORK_REQUEST 日志：日志按采样写入，不能反映全部客户端。
+        汇总为分钟粒度，窗口起点所在的整个分钟桶都计入，last_activity 为分钟桶起点。
+        """
+        since = timezone.now() - timedelta(seconds=get_traffic_rollup_config()['ACTIVE_WINDOW_SECONDS'])
+        active_rows = TrafficRollup.objects.filter(
+            bucket__gte=minute_bucket(since)
+        ).exclude(client_ip='').values('client_ip', 'user__username').annotate(
+            last_seen=Max('bucket'),
+            requests=Sum('request_count'),
+        )
         
-        # 按IP去重，保留最新的活动时间
+        # 按IP去重，保留最新的活动时间（同一分钟内优先显示已登录用户）
         connections_dict = {}
-        for conn in active_connections_raw:
-            client_ip = conn['data__client_ip']
-            if client_ip:
-                # 从data字段中获取timestamp，如果没有则使用当前时间
-                timestamp = conn.get('timestamp') or timezone.now()
-                if client_ip not in connections_dict or timestamp > connections_dict[client_ip]['timestamp']:
-                    connections_dict[client_ip] = {
-                        'client_ip': client_ip,
-                        'username': conn['user__username'] or 'Anonymous',
-                        'last_activity': timestamp.isoformat(),
-                        'timestamp': timestamp,
-                    }
-        
-        connections_data = list(connections_dict.values())
+        for row in active_rows:
+            client_ip = row['client_ip']
+            current = connections_dict.get(client_ip)
+            rank = (row['last_seen'], row['user__username'] is not None)
+            if current is None or rank > current['rank']:
+                connections_dict[client_ip] = {
+                    'client_ip': client_ip,
+                    'username': row['user__username'] or 'Anonymous',
+                    'last_activity': row['last_seen'].isoformat(),
+                    'rank': rank,
+                    'requests': 0,
+                }
+            connections_dict[client_ip]['requests'] += row['requests']
+        
+        connections_data = [
+            {key: value for key, value in conn.items() if key != 'rank'}
+            for conn in sorted(connections_dict.values(), key=lambda conn: conn['rank'], reverse=True)
+        ]
         
         return Response({
             'active_connections': connections_data,
@@ -1760,19 +1859,126 @@ class NetworkMonitorViewSet(viewsets.ReadOnlyModelViewSet):
         from django.utils import timezone
         from datetime import timedelta
         
-        # 获取最近24小时的用户活动
+        # 获取最近24小时的用户活动（按分钟汇总桶聚合）
         one_day_ago = timezone.now() - timedelta(hours=24)
         
-        user_activity = SystemLog.objects.filter(
-            log_type__in=['NETWORK_REQUEST', 'NETWORK_RESPONSE'],
+        user_activity = TrafficRollup.objects.filter(
             user__isnull=False,
-            timestamp__gte=one_day_ago
+            bucket__gte=one_day_ago
         ).values('user__id', 'user__username').annotate(
-            request_count=Count('id', filter=Q(log_type='NETWORK_REQUEST')),
-            response_count=Count('id', filter=Q(log_type='NETWORK_RESPONSE')),
-        ).order_by('-request_count')[:20]
+            requests=Sum('request_count'),
+            errors=Coalesce(Sum('request_count', filter=Q(status_class__in=['4xx', '5xx'])), 0),
+            total_latency=Sum('latency_sum'),
+        ).order_by('-requests')[:20]
+        
+        user_activity = [
+            {
+                'user__id': row['user__id'],
+                'user__username': row['user__username'],
+                'request_count': row['requests'],
+                'response_count': row['requests'],
+                'error_count': row['errors'],
+                'avg_latency': round(row['total_latency'] / row['requests'], 3) if row['requests'] else 0,
+            }
+            for row in user_activity
+        ]
         
         return Response({
             'user_activity': list(user_activity),
             'period': '24小时',
         })
+
+    @action(detail=False, methods=['get'])
+    def traffic(self, request):
+        """按分钟汇总的流量曲线与路由排行
+        GET /api/network-monitor/traffic/?minutes=60
+        """
+        from django.utils import timezone
+        from datetime import timedelta
+        
+        try:
+            minutes = int(request.query_params.get('minutes', 60))
+        except ValueError:
+            return Response({"detail": "minutes 必须是整数"}, status=400)
+        minutes = max(1, min(minutes, 7 * 24 * 60))
+        since = timezone.now() - timedelta(minutes=minutes)
+        
+        rollups = TrafficRollup.objects.filter(bucket__gte=since)
+        
+        # 每分钟的请求数、错误数、平均/最大延迟
+        series = rollups.values('bucket').annotate(
+            requests=Sum('request_count'),
+            errors=Coalesce(Sum('request_count', filter=Q(status_class='5xx')), 0),
+            total_latency=Sum('latency_sum'),
+            peak_latency=Max('latency_max'),
+        ).order_by('bucket')
+        
+        # 各路由的请求量与延迟
+        routes = rollups.values('route', 'method').annotate(
+            requests=Sum('request_count'),
+            errors=Coalesce(Sum('request_count', filter=Q(status_class__in=['4xx', '5xx'])), 0),
+            total_latency=Sum('latency_sum'),
+            peak_latency=Max('latency_max'),
+        ).order_by('-requests')[:50]
+        
+        def with_avg(row):
+            row['avg_latency'] = round(row.pop('total_latency') / row['requests'], 4) if row['requests'] else 0
+            row['max_latency'] = round(row.pop('peak_latency'), 4)
+            return row
+        
+        return Response({
+            'minutes': minutes,
+            'series': [
+                dict(with_avg(row), bucket=row['bucket'].isoformat())
+                for row in series
+            ],
+            'routes': [with_avg(row) for row in routes],
+        })
+    
+    @action(detail=False, methods=['get'])
+    def sink_stats(self, request):
+        """获取日志异步写入器的统计（当前工作进程）"""
+        from .log_sink import log_sink
+
+        return Response(log_sink.stats())
+
+
+def metrics_view(request):
+    """Prometheus 文本格式指标导出 - 仅允许白名单 IP（默认本机）抓取
+    GET /metrics/
+    """
+    from django.http import HttpResponse, HttpResponseForbidden
+    from .metrics import metrics_registry, get_metrics_config
+
+    config = get_metrics_config()
+    if request.META.get('REMOTE_ADDR') not in config['ALLOWED_IPS']:
+        return HttpResponseForbidden('metrics are only available to local scrapers')
+
+    return HttpResponse(
+        metrics_registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@require_safe
+def order_qr_image(request, pk, fmt):
+    """订单二维码图片 - 按需渲染并缓存
+    GET /api/orders/<id>/qr.png?sig=...  或 qr.svg
+    地址由订单接口返回（core.qr.qr_image_url），sig 无效时返回 404
+    """
+    from django.http import Http404, HttpResponse, HttpResponseNotModified
+    from .qr import qr_images, qr_etag, verify_qr_image_signature, get_qr_image_config, CONTENT_TYPES
+
+    payload = DeliveryOrder.objects.filter(id=pk).values_list('qr_payload_data', flat=True).first()
+    if not payload or not verify_qr_image_signature(pk, payload, request.GET.get('sig')):
+        raise Http404('二维码不存在')
+
+    etag = qr_etag(payload, fmt)
+    cache_control = f"private, max-age={get_qr_image_config()['MAX_AGE']}"
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(qr_images.get(payload, fmt), content_type=CONTENT_TYPES[fmt])
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,429 @@
+"""
+机器人 WebSocket 指令通道（原生 ASGI，不依赖 channels）
+
+连接地址: ws://<host>/ws/robot/<robot_id>/?token=<JWT access token>
+
+服务器 -> 机器人:
+- connection_established  连接建立，附带心跳间隔与轮询回退地址
+- command                 待执行指令（格式与 get_commands 一致）
+- command_ack             指令执行结果已入库
+- heartbeat_ack           心跳响应
+- error                   消息错误
+
+机器人 -> 服务器:
+- heartbeat               心跳，记录到在线状态表（core.presence）
+- status_update           状态上报（status / battery / door_status / location，或 samples 批量采样）
+- command_result          指令执行结果，效果与 POST execute_command 相同
+
+指令在机器人确认前始终保持 PENDING，连接断开后机器人回退到 HTTP 轮询时仍能取到。
+同一进程内的新指令通过 command_notifier 的监听函数立即唤醒连接；
+其他工作进程创建的指令通过标记文件 mtime 由每个事件循环的一个巡检任务发现。
+"""
+import asyncio
+import json
+import logging
+import re
+import threading
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .commands import serialize_command, complete_command, CommandAlreadyProcessed
+from .metrics import metrics_registry, get_metrics_config
+from .models import Robot, RobotCommand, SystemLog
+from .notifications import command_notifier
+from .presence import presence
+from .rollups import traffic_rollups, WEBSOCKET_METHOD
+from .sweeper import not_timed_out
+from .telemetry import apply_telemetry
+
+logger = logging.getLogger('system_backend')
+
+ROBOT_WS_PATH = re.compile(r'^/ws/robot/(?P<robot_id>\d+)/?$')
+
+DEFAULT_WEBSOCKET_CONFIG = {
+    'SHARDS': 16,                         # 连接表分片数
+    'HEARTBEAT_INTERVAL': 30,             # 建议机器人心跳间隔（秒）
+    'CROSS_PROCESS_CHECK_INTERVAL': 0.5,  # 巡检其他进程通知的间隔（秒）
+}
+
+# 关闭码（4000-4999 为应用自定义）
+CLOSE_NOT_FOUND = 4404
+CLOSE_UNAUTHORIZED = 4401
+
+
+def get_websocket_config():
+    config = dict(DEFAULT_WEBSOCKET_CONFIG)
+    config.update(getattr(settings, 'ROBOT_WEBSOCKET', {}))
+    return config
+
+
+def db_call(func):
+    """在线程池中执行 ORM 调用，前后清理失效的数据库连接"""
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+class RobotConnection:
+    """单个机器人 WebSocket 连接"""
+
+    def __init__(self, robot, user, send):
+        self.robot = robot
+        self.robot_id = robot.id
+        self.user = user
+        self.loop = asyncio.get_running_loop()
+        self.wake_event = asyncio.Event()
+        self.cursor = None  # 已下发的最大指令ID
+        self._send = send
+        self._send_lock = asyncio.Lock()
+
+    def wake(self):
+        """可在任意线程调用"""
+        try:
+            self.loop.call_soon_threadsafe(self.wake_event.set)
+        except RuntimeError:
+            # 事件循环已关闭，连接随之失效
+            pass
+
+    async def send_json(self, message):
+        async with self._send_lock:
+            await self._send({'type': 'websocket.send', 'text': json.dumps(message, ensure_ascii=False)})
+
+
+class RobotConnectionRegistry:
+    """按机器人ID分片的连接表，分片各自加锁，减少大量连接注册/注销时的锁竞争"""
+
+    def __init__(self, shard_count=None):
+        shard_count = shard_count or get_websocket_config()['SHARDS']
+        self._shards = [(threading.Lock(), {}) for _ in range(shard_count)]
+        self._watchers = {}
+        self._watchers_lock = threading.Lock()
+
+    def _shard(self, robot_id):
+        return self._shards[robot_id % len(self._shards)]
+
+    def add(self, connection):
+        lock, table = self._shard(connection.robot_id)
+        with lock:
+            table.setdefault(connection.robot_id, set()).add(connection)
+        self._ensure_watcher(connection.loop)
+
+    def remove(self, connection):
+        lock, table = self._shard(connection.robot_id)
+        with lock:
+            connections = table.get(connection.robot_id)
+            if connections:
+                connections.discard(connection)
+                if not connections:
+                    del table[connection.robot_id]
+
+    def connections(self, robot_id):
+        lock, table = self._shard(robot_id)
+        with lock:
+            return list(table.get(robot_id, ()))
+
+    def is_connected(self, robot_id):
+        """本进程内该机器人是否有在线连接"""
+        return bool(self.connections(robot_id))
+
+    def robot_ids(self, loop=None):
+        ids = []
+        for lock, table in self._shards:
+            with lock:
+                for robot_id, connections in table.items():
+                    if loop is None or any(c.loop is loop for c in connections):
+                        ids.append(robot_id)
+        return ids
+
+    def count(self):
+        total = 0
+        for lock, table in self._shards:
+            with lock:
+                total += sum(len(connections) for connections in table.values())
+        return total
+
+    def wake(self, robot_id):
+        """唤醒该机器人的所有连接去拉取新指令"""
+        for connection in self.connections(robot_id):
+            connection.wake()
+
+    # ------------------------------------------------------------------
+    # 跨进程通知巡检
+    # ------------------------------------------------------------------
+    def _ensure_watcher(self, loop):
+        with self._watchers_lock:
+            task = self._watchers.get(loop)
+            if task is None or task.done():
+                self._watchers[loop] = loop.create_task(self._watch(loop))
+
+    async def _watch(self, loop):
+        """每个事件循环一个任务：检查在线机器人的通知标记文件，发现变化即唤醒"""
+        interval = get_websocket_config()['CROSS_PROCESS_CHECK_INTERVAL']
+        seen = {}
+        while True:
+            robot_ids = self.robot_ids(loop)
+            if not robot_ids:
+                with self._watchers_lock:
+                    if not self.robot_ids(loop):
+                        self._watchers.pop(loop, None)
+                        return
+            for robot_id in robot_ids:
+                version = command_notifier.marker_version(robot_id)
+                if robot_id in seen and seen[robot_id] != version:
+                    self.wake(robot_id)
+                seen[robot_id] = version
+            for robot_id in set(seen) - set(robot_ids):
+                del seen[robot_id]
+            await asyncio.sleep(interval)
+
+
+robot_connections = RobotConnectionRegistry()
+command_notifier.add_listener(robot_connections.wake)
+
+
+# ----------------------------------------------------------------------
+# 数据库操作（在线程池中执行）
+# ----------------------------------------------------------------------
+@db_call
+def _authenticate(raw_token):
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+    if not raw_token:
+        return None
+    authenticator = JWTAuthentication()
+    try:
+        user = authenticator.get_user(authenticator.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user if user.is_active else None
+
+
+@db_call
+def _get_robot(robot_id):
+    return Robot.objects.filter(id=robot_id).first()
+
+
+@db_call
+def _fetch_commands(robot_id, cursor):
+    """连接建立时下发全部待执行指令，之后只下发新指令（含紧急开门）"""
+    commands = RobotCommand.objects.filter(robot_id=robot_id).select_related('sent_by')
+    if cursor is None:
+        latest = commands.aggregate(latest=Max('id'))['latest'] or 0
+        pending = list(commands.filter(not_timed_out(), status='PENDING', id__lte=latest).order_by('id'))
+        return [serialize_command(c) for c in pending], latest
+    new_commands = list(commands.filter(
+        Q(status='PENDING') | Q(command='emergency_open_door'),
+        id__gt=cursor
+    ).order_by('id'))
+    if new_commands:
+        cursor = new_commands[-1].id
+    return [serialize_command(c) for c in new_commands], cursor
+
+
+@db_call
+def _log_connection(robot, user, client_ip, event):
+    message = (
+        f"WebSocket连接建立: 机器人 {robot.name}" if event == 'connected'
+        else f"WebSocket连接断开: 机器人 {robot.name}"
+    )
+    SystemLog.log_info(
+        message=message,
+        log_type='WEBSOCKET_CONNECTION',
+        robot=robot,
+        user=user,
+        client_ip=(client_ip or '')[:45],
+        data={
+            'client_ip': client_ip,
+            'connection_type': 'websocket',
+            'event': event,
+            'timestamp': timezone.now().isoformat(),
+        }
+    )
+    if event == 'connected':
+        traffic_rollups.record(
+            route='robot-websocket',
+            method=WEBSOCKET_METHOD,
+            status_code=101,
+            user_id=user.id if user else None,
+            client_ip=client_ip,
+            latency=0.0,
+        )
+
+
+@db_call
+def _touch_robot(robot_id):
+    presence.touch(robot_id)
+
+
+@db_call
+def _apply_status_update(robot_id, message):
+    robot = Robot.objects.get(id=robot_id)
+    samples = message.get('samples') or [message]
+    apply_telemetry(robot, samples)
+
+
+@db_call
+def _complete_command(robot_id, command_id, result):
+    """返回 command_ack 的状态: COMPLETED / ALREADY_PROCESSED / NOT_FOUND"""
+    robot = Robot.objects.get(id=robot_id)
+    try:
+        command = RobotCommand.objects.get(id=command_id, robot=robot)
+    except (RobotCommand.DoesNotExist, ValueError):
+        return 'NOT_FOUND', None
+    if command.status != 'PENDING':
+        return 'ALREADY_PROCESSED', None
+    try:
+        complete_command(robot, command, result)
+    except CommandAlreadyProcessed:
+        return 'ALREADY_PROCESSED', None
+    return 'COMPLETED', command.executed_at.isoformat()
+
+
+# ----------------------------------------------------------------------
+# ASGI 应用
+# ----------------------------------------------------------------------
+def _client_ip(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'x-forwarded-for':
+            return value.decode('latin-1').split(',')[0].strip()
+    client = scope.get('client')
+    return client[0] if client else None
+
+
+def _record_connection_metric(value):
+    if get_metrics_config()['ENABLED']:
+        metrics_registry.gauge_add(
+            'robot_websocket_connections', None, value,
+            help_text='在线的机器人 WebSocket 连接数'
+        )
+
+
+async def robot_websocket_application(scope, receive, send):
+    """处理 /ws/robot/<id>/ 的 WebSocket 连接"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    match = ROBOT_WS_PATH.match(scope['path'])
+    if not match:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    user = await _authenticate((query.get('token') or [''])[0])
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+
+    robot = await _get_robot(int(match.group('robot_id')))
+    if robot is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    await send({'type': 'websocket.accept'})
+    connection = RobotConnection(robot, user, send)
+    client_ip = _client_ip(scope)
+    robot_connections.add(connection)
+    _record_connection_metric(1)
+    logger.info(f"🔌 机器人WebSocket连接: {robot.name} (ID: {robot.id}) - {client_ip}")
+
+    sender = asyncio.ensure_future(_send_commands(connection))
+    try:
+        await _log_connection(robot, user, client_ip, 'connected')
+        await connection.send_json({
+            'type': 'connection_established',
+            'robot_id': robot.id,
+            'robot_name': robot.name,
+            'heartbeat_interval': get_websocket_config()['HEARTBEAT_INTERVAL'],
+            'fallback': {
+                'mode': 'polling',
+                'url': f"/api/robots/{robot.id}/get_commands/",
+            },
+        })
+        await _receive_messages(connection, receive)
+    finally:
+        sender.cancel()
+        robot_connections.remove(connection)
+        _record_connection_metric(-1)
+        logger.info(f"🔌 机器人WebSocket断开: {robot.name} (ID: {robot.id})")
+        try:
+            await _log_connection(robot, user, client_ip, 'disconnected')
+        except Exception as e:
+            logger.error(f"记录WebSocket断开日志失败: {e}")
+
+
+async def _send_commands(connection):
+    """拉取并下发指令，之后等待唤醒"""
+    try:
+        while True:
+            commands, connection.cursor = await _fetch_commands(connection.robot_id, connection.cursor)
+            for command in commands:
+                await connection.send_json({'type': 'command', 'data': {}, **command})
+            await connection.wake_event.wait()
+            connection.wake_event.clear()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # 下发失败时机器人仍可通过轮询取到 PENDING 指令
+        logger.error(f"WebSocket下发指令失败: 机器人 {connection.robot_id}: {e}")
+
+
+async def _receive_messages(connection, receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        if message['type'] != 'websocket.receive':
+            continue
+
+        try:
+            data = json.loads(message.get('text') or message.get('bytes') or '')
+        except ValueError:
+            await connection.send_json({'type': 'error', 'message': '消息格式错误'})
+            continue
+        if not isinstance(data, dict):
+            await connection.send_json({'type': 'error', 'message': '消息格式错误'})
+            continue
+
+        try:
+            await _handle_message(connection, data)
+        except Exception as e:
+            logger.error(f"处理WebSocket消息失败: 机器人 {connection.robot_id}: {e}")
+            await connection.send_json({'type': 'error', 'message': f"处理消息失败: {str(e)}"})
+
+
+async def _handle_message(connection, data):
+    message_type = data.get('type', '')
+
+    if message_type == 'heartbeat':
+        await _touch_robot(connection.robot_id)
+        await connection.send_json({'type': 'heartbeat_ack', 'timestamp': timezone.now().isoformat()})
+
+    elif message_type == 'status_update':
+        await _apply_status_update(connection.robot_id, data)
+
+    elif message_type == 'command_result':
+        command_id = data.get('command_id')
+        if not command_id:
+            await connection.send_json({'type': 'error', 'message': '请提供指令ID'})
+            return
+        status, executed_at = await _complete_command(connection.robot_id, command_id, data.get('result', ''))
+        await connection.send_json({
+            'type': 'command_ack',
+            'command_id': command_id,
+            'status': status,
+            'executed_at': executed_at,
+        })
+
+    else:
+        await connection.send_json({'type': 'error', 'message': f"未知消息类型: {message_type}"})
@@ -6,6 +6,6 @@ sleep 5
 echo "🧱 执行数据库迁移..."
 python manage.py migrate
 
-echo "✅ 启动 Django 服务..."
-python manage.py runserver 0.0.0.0:8000
+echo "✅ 启动 Django 服务（ASGI，含机器人 WebSocket 通道 /ws/robot/<id>/）..."
+exec uvicorn campus_delivery.asgi:application --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-1}"
 
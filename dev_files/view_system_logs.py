@@ -24,14 +24,14 @@ def view_system_logs():
             
             # 获取系统日志
             logs_response = requests.get(
-                "http://localhost:8000/api/logs/",
+                "http://localhost:8000/api/logs/?page_size=20",
                 headers=headers,
                 timeout=5
             )
             
             if logs_response.status_code == 200:
-                logs_data = logs_response.json()
-                print(f"📊 总日志数: {len(logs_data)}")
+                logs_data = logs_response.json()['results']
+                print(f"📊 本页日志数: {len(logs_data)}")
                 print("\n📝 最近20条系统日志:")
                 print("-" * 60)
                 
@@ -80,6 +80,27 @@ def view_system_logs():
     except Exception as e:
         print(f"❌ 查看系统日志异常: {e}")
 
+def export_system_logs(path, fmt='ndjson', **filters):
+    """流式导出系统日志到文件（gzip 压缩），过滤参数同 /api/logs/"""
+    auth_response = requests.post(
+        "http://localhost:8000/api/token/",
+        json={"username": "root", "password": "test123456"},
+        timeout=5
+    )
+    auth_response.raise_for_status()
+    headers = {'Authorization': f"Bearer {auth_response.json()['access']}"}
+    params = dict(filters, fmt=fmt, gzip=1)
+
+    with requests.get("http://localhost:8000/api/logs/export/", headers=headers,
+                      params=params, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        size = 0
+        with open(path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=65536):
+                f.write(chunk)
+                size += len(chunk)
+    print(f"💾 已导出系统日志: {path} ({size} 字节)")
+
 def view_robot_logs():
     """查看机器人客户端日志"""
     print("\n🤖 机器人客户端日志")
@@ -105,6 +126,11 @@ def view_robot_logs():
 
 def main():
     """主函数"""
+    import sys
+    if len(sys.argv) > 2 and sys.argv[1] == '--export':
+        # python view_system_logs.py --export logs.ndjson.gz
+        export_system_logs(sys.argv[2])
+        return
     view_system_logs()
     view_robot_logs()
     
@@ -5,6 +5,7 @@ import Navbar from '../components/Navbar';
 import Footer from '../components/Footer';
 import '../styles/DashboardPage.css';
 import { API_BASE } from '../config';
+import { fetchAllPages } from '../pagination';
 
 
 const DashboardPage: React.FC = () => {
@@ -30,18 +31,8 @@ const DashboardPage: React.FC = () => {
       const token = localStorage.getItem('access_token');
 
       try {
-        const res = await fetch(`${API_BASE}/api/orders/`, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        });
-
-        const data = await res.json();
-        if (Array.isArray(data)) {
-          setOrders([...data].reverse());
-        } else {
-          console.error('❌ 响应不是数组:', data);
-        }
+        // 接口已按创建时间倒序返回
+        setOrders(await fetchAllPages(`${API_BASE}/api/orders/?page_size=200`, token));
       } catch (err) {
         console.error('❌ 请求失败', err);
       }
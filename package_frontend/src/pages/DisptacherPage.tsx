@@ -4,6 +4,7 @@ import Footer from '../components/Footer';
 import CommandResultModal from '../components/CommandResultModal';
 import '../styles/DispatcherPage.css';
 import { API_BASE } from '../config';
+import { fetchAllPages } from '../pagination';
 
 interface Order {
     id: number;
@@ -97,11 +98,7 @@ const DispatcherPage: React.FC = () => {
 
         const fetchOrders = async (token: string) => {
             try {
-                const res = await fetch(`${API_BASE}/api/dispatch/orders/`, {
-                    headers: {Authorization: `Bearer ${token}`},
-                });
-                const data = await res.json();
-                setOrders(data);
+                setOrders(await fetchAllPages(`${API_BASE}/api/dispatch/orders/?page_size=200`, token));
             } catch (err) {
                 console.error('订单获取失败:', err);
             }
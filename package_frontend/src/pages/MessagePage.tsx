@@ -4,6 +4,7 @@ import Navbar from '../components/Navbar';
 import Footer from '../components/Footer';
 import '../styles/MessagePage.css';
 import { API_BASE } from '../config';
+import { fetchAllPages } from '../pagination';
 
 
 interface Message {
@@ -24,13 +25,7 @@ const MessagePage: React.FC = () => {
     const fetchMessages = async () => {
         const token = localStorage.getItem('access_token');
         try {
-            const res = await fetch(`${API_BASE}/api/messages/`, {
-                headers: {
-                    Authorization: `Bearer ${token}`,
-                },
-            });
-            const data = await res.json();
-            setMessages(data);
+            setMessages(await fetchAllPages<Message>(`${API_BASE}/api/messages/?page_size=200`, token));
         } catch (err) {
             console.error('❌ 获取留言失败:', err);
         }
@@ -4,6 +4,7 @@ import Navbar from "../components/Navbar";
 import Footer from "../components/Footer";
 import "../styles/MyOrdersPage.css";
 import { API_BASE } from '../config';
+import { fetchAllPages } from '../pagination';
 
 
 interface Order {
@@ -30,17 +31,10 @@ const MyOrdersPage: React.FC = () => {
       const token = localStorage.getItem("access_token");
       if (!token) return;
 
-      const response = await fetch(`${API_BASE}/api/orders/`, {
-        headers: {
-          Authorization: `Bearer ${token}`,
-        },
-      });
-
-      if (response.ok) {
-        const data = await response.json();
-        setOrders(data);
-      } else {
-        console.error("❌ 获取订单失败");
+      try {
+        setOrders(await fetchAllPages<Order>(`${API_BASE}/api/orders/?page_size=200`, token));
+      } catch (err) {
+        console.error("❌ 获取订单失败", err);
       }
     };
 
@@ -3,6 +3,7 @@ import Navbar from '../components/Navbar';
 import Footer from '../components/Footer';
 import '../styles/UserManagementPage.css';
 import { API_BASE } from '../config';
+import { fetchAllPages } from '../pagination';
 
 
 interface User {
@@ -23,12 +24,7 @@ const UserManagementPage: React.FC = () => {
     const fetchUsers = async () => {
         const token = localStorage.getItem('access_token');
         try {
-            const res = await fetch(`${API_BASE}/api/users/`, {
-                headers: {
-                    Authorization: `Bearer ${token}`,
-                },
-            });
-            const data = await res.json();
+            const data = await fetchAllPages(`${API_BASE}/api/users/?page_size=200`, token);
 
             const normalized = data.map((user: any) => ({
                 ...user,
@@ -0,0 +1,27 @@
+// 游标分页列表: { next, previous, results }，next 为 null 表示已到最后一页
+export interface Page<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
+// 沿 next 逐页读取，返回全部结果（兼容未分页的数组响应）
+export const fetchAllPages = async <T = any>(url: string, token: string | null): Promise<T[]> => {
+  const items: T[] = [];
+  let nextUrl: string | null = url;
+  while (nextUrl) {
+    const res: Response = await fetch(nextUrl, {
+      headers: { Authorization: `Bearer ${token}` },
+    });
+    if (!res.ok) {
+      throw new Error(`请求失败: ${res.status}`);
+    }
+    const data: Page<T> | T[] = await res.json();
+    if (Array.isArray(data)) {
+      return items.concat(data);
+    }
+    items.push(...data.results);
+    nextUrl = data.next;
+  }
+  return items;
+};
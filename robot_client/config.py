@@ -19,6 +19,15 @@ class Config:
     POLL_INTERVAL = int(os.getenv('POLL_INTERVAL', '3'))  # 秒
     MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))
     RETRY_DELAY = int(os.getenv('RETRY_DELAY', '2'))  # 秒
+    LONG_POLL_WAIT = int(os.getenv('LONG_POLL_WAIT', '20'))  # 秒，0 表示关闭长轮询
+    
+    # 指令结果批量上报：窗口内产生的结果合并为一次请求，0 表示逐条上报
+    RESULT_BATCH_WINDOW = float(os.getenv('RESULT_BATCH_WINDOW', '0.5'))  # 秒
+    RESULT_BATCH_SIZE = int(os.getenv('RESULT_BATCH_SIZE', '50'))
+    
+    # WebSocket指令通道（连接断开时自动回退到轮询）
+    USE_WEBSOCKET = os.getenv('USE_WEBSOCKET', 'true').lower() == 'true'
+    WS_RECONNECT_MAX_DELAY = int(os.getenv('WS_RECONNECT_MAX_DELAY', '60'))  # 秒
     
     # 日志配置
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -3,8 +3,10 @@
 
 import sys
 import time
+import asyncio
 import threading
 import signal
+from collections import deque
 from config import Config
 from utils.logger import RobotLogger
 from hardware.gpio_controller import GPIOController
@@ -29,6 +31,12 @@ class RobotClient:
         self.current_orders = []
         self.is_running = False
         self.poll_thread = None
+        self.ws_thread = None
+        self.ws_connected = False  # WebSocket在线时轮询线程不再获取指令
+        
+        # 已处理的指令ID（WebSocket与轮询切换时避免重复执行）
+        self.handled_commands = deque(maxlen=200)
+        self.handled_lock = threading.Lock()
         
         # 注册回调函数
         self.register_callbacks()
@@ -60,8 +68,10 @@ class RobotClient:
                 self.logger.info("   - 可以测试二维码扫描")
                 self.logger.info("   - 服务器连接功能将被跳过")
             else:
-                # 开始轮询服务器
+                # 开始轮询服务器；启用WebSocket时指令改由WebSocket推送，断开后自动回退到轮询
                 self.start_polling()
+                if Config.USE_WEBSOCKET:
+                    self.start_websocket()
             
             # 不再自动开始二维码扫描，改为按钮触发模式
             self.logger.info("📱 二维码扫描已设置为按钮触发模式")
@@ -105,17 +115,82 @@ class RobotClient:
                 if data:
                     self.handle_server_data(data)
                 
-                # 获取并执行待处理的指令
+                # WebSocket在线时指令由服务器推送
+                if self.ws_connected:
+                    time.sleep(Config.POLL_INTERVAL)
+                    continue
+                
+                # 获取并执行待处理的指令（长轮询模式下该请求本身会等待新指令）
                 commands = self.api.get_commands()
                 if commands:
                     self.handle_commands(commands)
                 
-                time.sleep(Config.POLL_INTERVAL)
+                if not Config.LONG_POLL_WAIT or not self.api.last_poll_ok:
+                    time.sleep(Config.POLL_INTERVAL)
                 
             except Exception as e:
                 self.logger.error(f"轮询失败: {e}")
                 time.sleep(Config.RETRY_DELAY)
     
+    def start_websocket(self):
+        """启动WebSocket指令通道"""
+        try:
+            from websocket_client import RobotWebSocketClient
+        except ImportError:
+            self.logger.warning("⚠️ 未安装 websockets，仅使用轮询模式")
+            return
+        
+        self.ws_thread = threading.Thread(target=lambda: asyncio.run(self.websocket_loop(RobotWebSocketClient)))
+        self.ws_thread.daemon = True
+        self.ws_thread.start()
+    
+    async def websocket_loop(self, client_class):
+        """保持WebSocket连接，断开后按指数退避重连，期间由轮询线程获取指令"""
+        delay = Config.RETRY_DELAY
+        while self.is_running:
+            client = client_class(Config.SERVER_URL, Config.ROBOT_ID, self.api.access_token)
+            
+            async def on_connected(client=client):
+                self.ws_connected = True
+                self.logger.info("🔌 WebSocket已连接，指令改为服务器推送")
+                asyncio.create_task(client.start_heartbeat())
+            
+            async def on_command_received(command_id, command, data, client=client):
+                await self.handle_ws_command(client, command_id, command)
+            
+            client.on_connected = on_connected
+            client.on_command_received = on_command_received
+            
+            try:
+                await client.connect()  # 阻塞直到连接断开
+            except Exception as e:
+                self.logger.warning(f"⚠️ WebSocket连接失败: {e}")
+            
+            if self.ws_connected:
+                delay = Config.RETRY_DELAY
+                self.ws_connected = False
+                self.logger.warning("🔌 WebSocket已断开，回退到轮询模式")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, Config.WS_RECONNECT_MAX_DELAY)
+    
+    async def handle_ws_command(self, client, command_id, command_type):
+        """执行WebSocket推送的指令并通过WebSocket确认，发送失败时改用HTTP上报"""
+        if not self.claim_command(command_id):
+            return
+        self.logger.info(f"🤖 收到推送指令: {command_type}")
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.run_command, command_type)
+        if not await client.send_command_result(command_id, result):
+            await loop.run_in_executor(None, self.api.report_command_result, command_id, result)
+    
+    def claim_command(self, command_id):
+        """登记指令ID，已处理过的返回False"""
+        with self.handled_lock:
+            if command_id in self.handled_commands:
+                return False
+            self.handled_commands.append(command_id)
+            return True
+    
     def handle_server_data(self, data):
         """处理服务器数据"""
         try:
@@ -147,6 +222,9 @@ class RobotClient:
                 command_type = command.get('command')
                 command_display = command.get('command_display', command_type)
                 
+                if not self.claim_command(command_id):
+                    continue
+                
                 self.logger.info(f"🤖 收到指令: {command_display}")
                 
                 # 执行指令
@@ -162,7 +240,14 @@ class RobotClient:
             self.logger.error(f"处理指令失败: {e}")
     
     def execute_command(self, command_type, command_id):
-        """执行具体指令"""
+        """执行具体指令并通过HTTP报告结果"""
+        result = self.run_command(command_type)
+        # 短时间内连续执行的多条指令（如重连后补执行）合并为一次批量上报
+        success = self.api.report_command_result(command_id, result)
+        return success
+    
+    def run_command(self, command_type):
+        """执行具体指令，返回上报给服务器的结果"""
         try:
             result = "执行成功"
             
@@ -198,15 +283,11 @@ class RobotClient:
                 self.logger.warning(f"❓ 未知指令类型: {command_type}")
                 result = "未知指令"
             
-            # 报告执行结果给服务器
-            success = self.api.execute_command(command_id, result)
-            return success
+            return result
             
         except Exception as e:
             self.logger.error(f"执行指令异常: {e}")
-            # 报告执行失败
-            self.api.execute_command(command_id, f"执行失败: {str(e)}")
-            return False
+            return f"执行失败: {str(e)}"
     
     def set_status(self, status):
         """设置机器人状态"""
@@ -429,6 +510,9 @@ class RobotClient:
         self.logger.info("🛑 停止快递车客户端...")
         self.is_running = False
         
+        # 上报尚未发送的指令结果
+        self.api.flush_command_results()
+        
         # 停止组件
         if self.camera:
             self.camera.cleanup()
@@ -4,7 +4,10 @@
 import requests
 import json
 import time
+import threading
+from datetime import datetime, timezone
 from config import Config
+from network.etag_session import ETagSession
 
 class APIClient:
     """API客户端"""
@@ -13,8 +16,15 @@ class APIClient:
         self.logger = logger
         self.server_url = Config.SERVER_URL
         self.robot_id = Config.ROBOT_ID
-        self.session = requests.Session()
+        # GET 请求自动携带 If-None-Match，状态/订单/指令未变化时服务器返回 304
+        self.session = ETagSession()
         self.session.timeout = 10
+        self.last_poll_ok = False  # 最近一次获取指令是否成功（长轮询失败时调用方需要退避）
+        
+        # 待批量上报的指令结果
+        self._pending_results = []
+        self._results_lock = threading.Lock()
+        self._results_timer = None
         
         # 设置请求头
         self.session.headers.update({
@@ -99,11 +109,38 @@ class APIClient:
             else:
                 self.logger.error(f"状态更新失败: HTTP {response.status_code}")
                 return None
-                
+
         except requests.exceptions.RequestException as e:
             self.logger.error(f"网络请求失败: {e}")
             return None
-    
+
+    def send_telemetry(self, samples, expected_version=None):
+        """批量上报遥测采样，服务器按时间合并后一次写库
+
+        samples: [{'timestamp': ISO时间, 'battery': ..., 'location': ..., 'door_status': ..., 'status': ...}]
+        expected_version 与服务器版本不一致时返回 None（HTTP 409）
+        """
+        try:
+            url = f"{self.server_url}/api/robots/{self.robot_id}/telemetry/"
+            data = {'samples': samples}
+            if expected_version is not None:
+                data['expected_version'] = expected_version
+
+            response = self.session.post(url, json=data)
+
+            if response.status_code == 200:
+                return response.json()
+            elif response.status_code == 409:
+                self.logger.warning(f"遥测版本冲突，服务器当前版本: {response.json().get('current_version')}")
+                return None
+            else:
+                self.logger.error(f"遥测上报失败: HTTP {response.status_code}")
+                return None
+
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"网络请求失败: {e}")
+            return None
+
     def qr_scanned(self, order_id, qr_data):
         """二维码扫描处理"""
         try:
@@ -183,12 +220,23 @@ class APIClient:
             self.logger.error(f"网络请求失败: {e}")
             return None
     
-    def get_commands(self):
-        """获取待执行的指令"""
+    def get_commands(self, wait=None):
+        """获取待执行的指令
+        
+        wait > 0 时使用长轮询：服务器在没有指令时最多等待 wait 秒，
+        新指令创建后立即返回。默认取 Config.LONG_POLL_WAIT。
+        """
+        if wait is None:
+            wait = Config.LONG_POLL_WAIT
         try:
             url = f"{self.server_url}/api/robots/{self.robot_id}/get_commands/"
-            response = self.session.get(url)
+            if wait:
+                # 读超时必须大于服务器端的等待时间
+                response = self.session.get(url, params={'wait': wait}, timeout=wait + 10)
+            else:
+                response = self.session.get(url)
             
+            self.last_poll_ok = response.status_code == 200
             if response.status_code == 200:
                 data = response.json()
                 commands = data.get('pending_commands', [])
@@ -199,6 +247,7 @@ class APIClient:
                 return []
                 
         except requests.exceptions.RequestException as e:
+            self.last_poll_ok = False
             self.logger.error(f"网络请求失败: {e}")
             return []
     
@@ -223,6 +272,82 @@ class APIClient:
             self.logger.error(f"网络请求失败: {e}")
             return False
     
+    def execute_commands(self, results):
+        """批量报告指令执行结果
+        
+        results: [{'command_id': 1, 'result': 'door_open', 'executed_at': ISO时间}, ...]
+        返回服务器给出的逐条处理结果列表，网络或服务器错误时返回 None
+        """
+        try:
+            url = f"{self.server_url}/api/robots/{self.robot_id}/execute_commands/"
+            response = self.session.post(url, json={'results': results})
+            
+            if response.status_code == 200:
+                data = response.json()
+                self.logger.info(f"批量指令结果上报成功: {data.get('message', '')}")
+                for outcome in data.get('results', []):
+                    if outcome.get('outcome') != 'COMPLETED':
+                        self.logger.warning(f"指令 {outcome.get('command_id')} 未完成: {outcome.get('detail', outcome.get('outcome'))}")
+                return data.get('results', [])
+            else:
+                self.logger.error(f"批量指令结果上报失败: HTTP {response.status_code}")
+                return None
+                
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"网络请求失败: {e}")
+            return None
+    
+    def report_command_result(self, command_id, result):
+        """登记指令执行结果，在 RESULT_BATCH_WINDOW 秒内产生的结果合并为一次批量上报
+        
+        窗口为 0 时退化为逐条调用 execute_command
+        """
+        window = Config.RESULT_BATCH_WINDOW
+        if not window:
+            return self.execute_command(command_id, result)
+        
+        with self._results_lock:
+            self._pending_results.append({
+                'command_id': command_id,
+                'result': result,
+                'executed_at': datetime.now(timezone.utc).isoformat()
+            })
+            if len(self._pending_results) >= Config.RESULT_BATCH_SIZE:
+                flush_now = True
+            else:
+                flush_now = False
+                self._schedule_results_flush(window)
+        if flush_now:
+            self.flush_command_results()
+        return True
+    
+    def _schedule_results_flush(self, delay):
+        """调用方需持有 _results_lock"""
+        if self._results_timer is None:
+            self._results_timer = threading.Timer(delay, self.flush_command_results)
+            self._results_timer.daemon = True
+            self._results_timer.start()
+    
+    def flush_command_results(self):
+        """立即上报所有待上报的指令结果，失败时保留并稍后重试"""
+        with self._results_lock:
+            batch = self._pending_results
+            self._pending_results = []
+            if self._results_timer is not None:
+                self._results_timer.cancel()
+                self._results_timer = None
+        if not batch:
+            return True
+        
+        outcomes = self.execute_commands(batch)
+        if outcomes is None:
+            # 上报失败：放回队首保持顺序，稍后重试
+            with self._results_lock:
+                self._pending_results = batch + self._pending_results
+                self._schedule_results_flush(Config.RETRY_DELAY)
+            return False
+        return True
+    
     def receive_orders(self):
         """接收订单分配"""
         try:
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+class ETagSession(requests.Session):
+    """自动条件请求的 Session
+    
+    GET 响应带 ETag 时缓存响应体，下次请求同一地址自动携带 If-None-Match；
+    服务器返回 304 时用缓存内容构造 200 响应，调用方无需区分。
+    """
+    
+    def __init__(self, max_entries=64):
+        super().__init__()
+        self.max_entries = max_entries
+        self._etag_cache = OrderedDict()
+        self._etag_lock = threading.Lock()
+        self.etag_hits = 0
+    
+    def request(self, method, url, params=None, headers=None, **kwargs):
+        if method.upper() != 'GET' or kwargs.get('stream'):
+            return super().request(method, url, params=params, headers=headers, **kwargs)
+        
+        key = self._cache_key(url, params)
+        with self._etag_lock:
+            cached = self._etag_cache.get(key)
+        if cached is not None:
+            headers = dict(headers or {})
+            headers.setdefault('If-None-Match', cached.headers['ETag'])
+        
+        response = super().request(method, url, params=params, headers=headers, **kwargs)
+        
+        if response.status_code == 304 and cached is not None:
+            self.etag_hits += 1
+            return self._from_cache(cached, response)
+        
+        with self._etag_lock:
+            if response.status_code == 200 and response.headers.get('ETag'):
+                self._etag_cache[key] = response
+                self._etag_cache.move_to_end(key)
+                while len(self._etag_cache) > self.max_entries:
+                    self._etag_cache.popitem(last=False)
+            else:
+                self._etag_cache.pop(key, None)
+        return response
+    
+    def clear_etag_cache(self):
+        with self._etag_lock:
+            self._etag_cache.clear()
+    
+    @staticmethod
+    def _cache_key(url, params):
+        if not params:
+            return url
+        items = params.items() if isinstance(params, dict) else params
+        return f"{url}?{urlencode(sorted(items))}"
+    
+    @staticmethod
+    def _from_cache(cached, not_modified):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = cached.content
+        response.headers = CaseInsensitiveDict(cached.headers)
+        for name in ('ETag', 'Date', 'Cache-Control'):
+            if name in not_modified.headers:
+                response.headers[name] = not_modified.headers[name]
+        response.encoding = cached.encoding
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response.elapsed = not_modified.elapsed
+        response.reason = 'OK (Not Modified)'
+        response.from_etag_cache = True
+        return response
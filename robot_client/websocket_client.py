@@ -34,6 +34,7 @@ class RobotWebSocketClient:
         self.websocket: Optional[websockets.WebSocketServerProtocol] = None
         self.connected = False
         self.running = False
+        self.heartbeat_interval = 30
         
         # 构建WebSocket URL
         params = urlencode({
@@ -109,6 +110,11 @@ class RobotWebSocketClient:
                 await self._handle_notification(data)
             elif message_type == 'connection_established':
                 logger.info("WebSocket连接已建立")
+                self.heartbeat_interval = data.get('heartbeat_interval', self.heartbeat_interval)
+            elif message_type == 'command_ack':
+                logger.info(f"指令结果已确认: {data.get('command_id')} ({data.get('status')})")
+            elif message_type == 'heartbeat_ack':
+                pass
             elif message_type == 'error':
                 logger.error(f"服务器错误: {data.get('message', '')}")
             else:
@@ -158,11 +164,11 @@ class RobotWebSocketClient:
         except Exception as e:
             logger.error(f"发送状态更新失败: {e}")
     
-    async def send_command_result(self, command_id: int, result: str):
-        """发送指令执行结果"""
+    async def send_command_result(self, command_id: int, result: str) -> bool:
+        """发送指令执行结果，返回是否发送成功（失败时调用方应改用HTTP上报）"""
         if not self.connected or not self.websocket:
             logger.warning("WebSocket未连接，无法发送指令结果")
-            return
+            return False
         
         message = {
             'type': 'command_result',
@@ -173,8 +179,10 @@ class RobotWebSocketClient:
         try:
             await self.websocket.send(json.dumps(message))
             logger.info(f"指令结果已发送: {result}")
+            return True
         except Exception as e:
             logger.error(f"发送指令结果失败: {e}")
+            return False
     
     async def send_qr_scanned(self, order_id: int, qr_data: Dict[str, Any]):
         """发送二维码扫描结果"""
@@ -227,8 +235,9 @@ class RobotWebSocketClient:
         except Exception as e:
             logger.error(f"发送心跳失败: {e}")
     
-    async def start_heartbeat(self, interval: int = 30):
-        """开始心跳循环"""
+    async def start_heartbeat(self, interval: Optional[int] = None):
+        """开始心跳循环（默认使用服务器建议的间隔）"""
+        interval = interval or self.heartbeat_interval
         while self.running and self.connected:
             await self.send_heartbeat()
             await asyncio.sleep(interval)
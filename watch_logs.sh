@@ -20,7 +20,7 @@ if ! docker-compose -f docker_deploy/docker-compose.yml exec backend test -f /ap
     echo "⚠️  WebSocket日志文件不存在，可能还没有WebSocket活动"
     echo "📡 正在监控系统后端日志..."
     echo ""
-    docker-compose -f docker_deploy/docker-compose.yml exec backend tail -f /app/logs/system_backend.log | grep -i websocket
+    docker-compose -f docker_deploy/docker-compose.yml exec backend sh -c 'tail -F /app/logs/system_backend*.log' | grep -i websocket
 else
     echo "📡 正在监控WebSocket事件日志..."
     echo ""